@@ -0,0 +1,134 @@
+"""Benchmark the dashboard's load → parse → filter → aggregate pipeline.
+
+    python -m benchmarks.bench_dashboard [--sizes 1000 10000 100000 1000000]
+
+Each size runs in a fresh process against a temporary SQLite database
+filled with synthetic sessions. Reports wall time and peak traced memory
+per stage and the size of the state synced to the browser.
+"""
+import argparse
+import dataclasses
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+PAGE_SIZE = 25
+FILTER_USER = "user1"
+FILTER_PAGE = "shop"
+
+
+def _payload_size(totals, records):
+    """Bytes of the synced state for one filtered dashboard view"""
+    top_users = sorted(totals["users"].items(), key=lambda item: item[1]["sessions"], reverse=True)[:10]
+    state = {
+        "session_summaries": [dataclasses.asdict(record) for record in records],
+        "page_visits_data": [{"name": page, "value": c["visits"]} for page, c in totals["pages"].items()],
+        "time_spent_data": [{"page": page, "time": c["time_minutes"]} for page, c in totals["pages"].items()],
+        "user_sessions_data": [{"name": user, "value": c["sessions"]} for user, c in top_users],
+    }
+    return len(json.dumps(state))
+
+
+def _run_pipeline(trace):
+    """Run every stage once; returns per-stage seconds (or peak bytes when tracing)"""
+    from websiteanalytics.dashboard.data import load_session_page, load_sessions
+    from websiteanalytics.dashboard.query_cache import query_cache
+    from websiteanalytics.dashboard.sessions import ALL, session_record
+
+    query_cache.invalidate()
+    results = {}
+
+    def measure(name, fn):
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        value = fn()
+        elapsed = time.perf_counter() - started
+        if trace:
+            results[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            results[name] = elapsed
+        return value
+
+    snapshot = measure("sync + parse", lambda: load_sessions(ALL))
+    columns = measure("columns", snapshot.columns)
+    mask = measure("filter", lambda: columns.filter_mask(FILTER_USER, FILTER_PAGE))
+    totals = measure("totals", lambda: columns.totals(mask))
+    records = measure("page records", lambda: [
+        session_record(columns.sessions[row], FILTER_PAGE) for row in columns.ordered_rows(mask)[:PAGE_SIZE]
+    ])
+    measure("page query", lambda: load_session_page(None, PAGE_SIZE))
+    return results, totals, records
+
+
+def run_one(size, schema):
+    """Fill the database and benchmark one size; prints one JSON line"""
+    from benchmarks.synthetic import generate_sessions
+    from websiteanalytics.storage.backend import storage
+    from websiteanalytics.storage.base import WriteOp
+    from websiteanalytics.tracking.session_schema import migrate_sessions
+
+    batch = []
+    for session_id, document in generate_sessions(size, schema=schema):
+        batch.append(WriteOp("analytics", session_id, document, False))
+        if len(batch) == storage.max_batch_writes:
+            storage.commit(batch)
+            batch = []
+    storage.commit(batch)
+    if schema == 2:
+        # Finds nothing to rewrite and marks the store migrated, so the dashboard reads projections
+        migrate_sessions()
+
+    times, totals, records = _run_pipeline(trace=False)
+    peaks, _, _ = _run_pipeline(trace=True)
+    print(json.dumps({
+        "size": size,
+        "times": times,
+        "peaks": peaks,
+        "payload": _payload_size(totals, records),
+        "matches": totals["sessions"],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--schema", type=int, choices=(1, 2), default=2, help="session document layout")
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        run_one(args.run_one, args.schema)
+        return
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                ANALYTICS_STORAGE=f"sqlite:{os.path.join(tmp, 'bench.db')}",
+                ANALYTICS_LOG="warning",
+            )
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_dashboard", "--run-one", str(size),
+                 "--schema", str(args.schema)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        print(f"\n📊 {size:,} sessions ({result['matches']:,} match the filters)")
+        print(f"   {'stage':<14} {'wall ms':>10} {'peak MiB':>10}")
+        for name, elapsed in result["times"].items():
+            print(f"   {name:<14} {elapsed * 1000:>10.1f} {result['peaks'][name] / 2**20:>10.1f}")
+        total = sum(result["times"].values())
+        print(f"   {'total':<14} {total * 1000:>10.1f}")
+        print(f"   state payload {result['payload']:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
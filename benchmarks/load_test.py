@@ -0,0 +1,145 @@
+"""Load-test the page-tracking handlers with concurrent virtual visitors.
+
+    python -m benchmarks.load_test --users 200 --duration 30 --latency 0.02 --failure-rate 0.01
+
+Each virtual visitor runs sessions of signed-in or anonymous navigation
+between the shop's pages on its own thread, calling the AnalyticsState
+handler bodies directly (Reflex's own event processing is not included).
+Writes go through the real event buffer and compactor into an in-memory
+datastore with the given latency and failure rate. Reports handler
+latency percentiles and datastore writes per second.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+# page -> (next page, probability); None ends the session
+NAVIGATION = {
+    "home": (("shop", 0.5), ("about", 0.2), ("home", 0.1), (None, 0.2)),
+    "shop": (("shop", 0.4), ("home", 0.3), ("about", 0.1), (None, 0.2)),
+    "about": (("home", 0.4), ("shop", 0.3), (None, 0.3)),
+}
+
+
+def _next_page(rng, page):
+    roll = rng.random()
+    for next_page, probability in NAVIGATION[page]:
+        roll -= probability
+        if roll < 0:
+            return next_page
+    return None
+
+
+def _visitor_class():
+    """Plain class that runs AnalyticsState's handler bodies on ordinary attributes"""
+    from reflex.event import EventHandler
+
+    from websiteanalytics.pages.analyticalpage import AnalyticsState
+
+    fields = AnalyticsState.get_fields()
+    namespace = {name: fields[name].default for name in AnalyticsState.base_vars}
+    namespace.update(AnalyticsState.backend_vars)
+    for name, value in vars(AnalyticsState).items():
+        if isinstance(value, EventHandler):
+            namespace[name] = value.fn
+        elif callable(value) and name.startswith("_") and not name.startswith("__"):
+            namespace[name] = value
+    return type("Visitor", (), namespace)
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _run_visitor(visitor_class, number, args, deadline, latencies):
+    rng = random.Random(number)
+    user_email = f"loadtest{number}@example.com"
+
+    def timed(name, fn, *fn_args):
+        started = time.perf_counter()
+        fn(*fn_args)
+        latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+    while time.monotonic() < deadline:
+        visitor = visitor_class()
+        anonymous = rng.random() < args.anonymous_ratio
+        page = "home"
+        while page and time.monotonic() < deadline:
+            if anonymous:
+                timed("start_anon_page_tracking", visitor.start_anon_page_tracking, page)
+            else:
+                timed("start_page_tracking", visitor.start_page_tracking, page, user_email)
+            time.sleep(rng.expovariate(1 / args.think_time))
+            page = _next_page(rng, page)
+        if anonymous:
+            timed("end_anon_session", visitor.end_anon_session)
+        else:
+            timed("end_session", visitor.end_session, user_email)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual visitors")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to generate load")
+    parser.add_argument("--think-time", type=float, default=0.2, help="mean seconds on a page")
+    parser.add_argument("--anonymous-ratio", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.01, help="datastore seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.01, help="extra random datastore seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of datastore calls that fail")
+    args = parser.parse_args()
+
+    os.environ["ANALYTICS_STORAGE"] = "memory"
+    # Injected failures are expected; set ANALYTICS_LOG to see how they are handled
+    os.environ.setdefault("ANALYTICS_LOG", "critical")
+    from websiteanalytics.storage.backend import storage
+    from websiteanalytics.tracking.event_buffer import event_buffer
+
+    datastore = storage.backend
+    datastore.latency = args.latency
+    datastore.jitter = args.jitter
+    datastore.failure_rate = args.failure_rate
+    visitor_class = _visitor_class()
+
+    per_thread = [{} for _ in range(args.users)]
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=_run_visitor, args=(visitor_class, number, args, deadline, per_thread[number]))
+        for number in range(args.users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    writes = datastore.writes
+    backlog = event_buffer.pending()
+
+    drain_started = time.monotonic()
+    event_buffer.flush()
+    drained = time.monotonic() - drain_started
+
+    latencies = {}
+    for thread_latencies in per_thread:
+        for name, values in thread_latencies.items():
+            latencies.setdefault(name, []).extend(values)
+    latencies["all handlers"] = [value for values in list(latencies.values()) for value in values]
+
+    print(f"\n🚦 {args.users} visitors for {elapsed:.1f}s, datastore latency {args.latency * 1000:.0f}"
+          f"+{args.jitter * 1000:.0f} ms, failure rate {args.failure_rate:.1%}")
+    print(f"   {'handler':<26} {'calls':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, values in latencies.items():
+        ordered = sorted(values)
+        print(f"   {name:<26} {len(ordered):>8} "
+              + " ".join(f"{_percentile(ordered, q) * 1000:>8.3f}" for q in (0.5, 0.95, 0.99)))
+    print(f"   datastore writes          {writes:,} ({writes / elapsed:,.0f}/s)")
+    print(f"   injected failures         {datastore.failures:,}")
+    print(f"   buffered events at end    {backlog:,} (drained in {drained:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import random
+
+from websiteanalytics.tracking.session_schema import sample_hash
+
+PAGES = ("home", "shop", "about", "contact")
+# Sessions start between this epoch and a year later
+START_EPOCH = 1735689600
+
+
+def generate_sessions(count, seed=0, anonymous_ratio=0.3, users=None, schema=2):
+    """Yield (session_id, document) pairs shaped like compacted `analytics` documents.
+
+    Deterministic for a given seed. `schema` picks the document layout:
+    2 for the nested pages map the compactor writes, 1 for the dotted
+    `pages.<name>.<field>` keys older documents hold. About
+    `anonymous_ratio` of the sessions are anonymous.
+    """
+    rng = random.Random(seed)
+    if users is None:
+        users = max(1, count // 20)
+
+    for index in range(count):
+        login_time = START_EPOCH + rng.uniform(0, 365 * 86400)
+        if rng.random() < anonymous_ratio:
+            user_email = "anonymous"
+            session_id = f"anon_{index:08d}"
+        else:
+            user_email = f"user{rng.randrange(users)}@example.com"
+            session_id = f"{user_email}_{index:08d}"
+
+        document = {"user_email": user_email, "login_time": login_time}
+        if schema == 1:
+            document["session_start"] = login_time
+        else:
+            document["schema"] = 2
+            document["sample_hash"] = sample_hash(session_id)
+            document["pages"] = {}
+        if user_email == "anonymous":
+            document["is_anonymous" if schema == 1 else "anon"] = True
+
+        now = login_time
+        total_minutes = 0
+        for page_name in rng.sample(PAGES, rng.randint(1, len(PAGES))):
+            minutes = round(rng.expovariate(1 / 1.5), 2)
+            visits = rng.randint(1, 5)
+            entry_time = now + rng.uniform(1, 30)
+            now = entry_time + minutes * 60
+            if schema == 1:
+                document[f"pages.{page_name}.visits"] = visits
+                document[f"pages.{page_name}.entry_time"] = entry_time
+                document[f"pages.{page_name}.page_name"] = page_name
+                document[f"pages.{page_name}.time_spent_minutes"] = minutes
+                document[f"pages.{page_name}.exit_time"] = now
+            else:
+                document["pages"][page_name] = {"v": visits, "t": minutes, "en": entry_time, "ex": now}
+            total_minutes += minutes
+
+        # Some sessions are still open: no logout or total yet
+        if rng.random() < 0.9:
+            if schema == 1:
+                document["logout_time"] = now
+                document["total_session_time_minutes"] = round(total_minutes, 2)
+            else:
+                document["out"] = now
+                document["total"] = round(total_minutes, 2)
+        document["updated_at"] = now
+        yield session_id, document
@@ -0,0 +1,19 @@
+import os
+
+# Modules open the configured backend on import, so pick it before any of them load
+os.environ["ANALYTICS_STORAGE"] = "memory"
+os.environ["ANALYTICS_LOG"] = "warning"
+
+import pytest
+
+
+@pytest.fixture
+def memory_storage():
+    """The shared storage, backed by a fresh MemoryStorage for one test"""
+    from websiteanalytics.storage.backend import storage
+    from websiteanalytics.storage.memory_backend import MemoryStorage
+
+    previous = storage.backend
+    storage.backend = MemoryStorage()
+    yield storage
+    storage.backend = previous
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+from websiteanalytics.dashboard.change_feed import ChangeFeed
+from websiteanalytics.storage import base
+from websiteanalytics.storage.base import Poller
+from websiteanalytics.storage.memory_backend import MemoryStorage
+
+
+class _Watch:
+    def __init__(self, after):
+        self.after = after
+        self.stopped = False
+
+    def unsubscribe(self):
+        self.stopped = True
+
+
+def test_poller_delivers_documents_past_its_cursor(monkeypatch):
+    monkeypatch.setattr(base, "POLL_INTERVAL", 0.01)
+    backend = MemoryStorage()
+    backend.set("analytics", "old", {"updated_at": 100.0})
+    batches = []
+    delivered = threading.Semaphore(0)
+
+    def callback(changed, removed):
+        batches.append((changed, removed))
+        delivered.release()
+
+    poller = Poller(backend, "analytics", "updated_at", 150.0, callback)
+    try:
+        backend.set("analytics", "s1", {"updated_at": 200.0})
+        assert delivered.acquire(timeout=5)
+        backend.set("analytics", "s2", {"updated_at": 300.0})
+        assert delivered.acquire(timeout=5)
+    finally:
+        poller.unsubscribe()
+    assert batches == [({"s1": {"updated_at": 200.0}}, []), ({"s2": {"updated_at": 300.0}}, [])]
+
+
+def test_change_feed_relistens_from_the_newest_change(memory_storage, monkeypatch):
+    watches = []
+
+    def listen(collection, field, after, callback):
+        watches.append(_Watch(after))
+        return watches[-1]
+
+    monkeypatch.setattr(memory_storage, "listen", listen)
+    feed = ChangeFeed()
+    handled = []
+    feed.add_handler(lambda changed, removed: handled.append(changed))
+
+    async def run():
+        changes = feed.subscribe()
+        feed._on_changes({"s1": {"updated_at": 4e9}, "s2": {"updated_at": 3e9}}, [])
+        received = await asyncio.wait_for(changes.get(), 5)
+        feed._relisten()
+        feed.unsubscribe(changes)
+        return received
+
+    received = asyncio.run(run())
+    assert received == ({"s1": {"updated_at": 4e9}, "s2": {"updated_at": 3e9}}, [])
+    assert handled == [received[0]]
+    assert len(watches) == 2
+    assert watches[0].stopped and watches[1].stopped
+    assert watches[1].after == 4e9
+    assert feed._watch is None
+    # Restarting after the last unsubscribe is a no-op
+    feed._relisten()
+    assert len(watches) == 2
@@ -0,0 +1,78 @@
+import math
+import threading
+
+from benchmarks.synthetic import generate_sessions
+from websiteanalytics.dashboard.columnar import _Dictionary
+from websiteanalytics.dashboard.sessions import SessionSnapshot
+
+VALUES = ["Alice@Example.com", "bob@example.com", "carol@shop.io", "anonymous", "al"]
+
+
+def _dictionary(values=VALUES):
+    dictionary = _Dictionary()
+    for value in values:
+        dictionary.encode(value)
+    return dictionary
+
+
+def _matches(dictionary, substring):
+    return [dictionary.values[code] for code in dictionary.matching(substring).nonzero()[0]]
+
+
+def test_matching_agrees_with_a_substring_scan():
+    dictionary = _dictionary()
+    for substring in ("example", "EXAMPLE.COM", "al", "a", "", "shop.io", "o@e", "zzz", "ice@ex"):
+        expected = [value for value in VALUES if substring.lower() in value.lower()]
+        assert _matches(dictionary, substring) == expected, substring
+
+
+def test_codes_are_stable_and_new_values_are_indexed():
+    dictionary = _dictionary()
+    assert dictionary.encode("bob@example.com") == 1
+    assert dictionary.encode("dave@example.com") == len(VALUES)
+    assert _matches(dictionary, "dave@") == ["dave@example.com"]
+    assert len(dictionary.matching("example")) == len(VALUES) + 1
+
+
+def test_concurrent_encoding_assigns_one_code_per_value():
+    dictionary = _Dictionary()
+    values = [f"user{i}@example.com" for i in range(500)]
+    threads = [threading.Thread(target=lambda: [dictionary.encode(value) for value in values]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(dictionary.values) == sorted(values)
+    assert all(dictionary.values[dictionary.codes[value]] == value for value in values)
+    assert _matches(dictionary, "user49@") == ["user49@example.com"]
+
+
+def _columns(documents):
+    return SessionSnapshot("test").merged(documents).columns()
+
+
+def test_estimates_at_full_rate_are_exact():
+    columns = _columns(dict(generate_sessions(500, seed=2)))
+    mask = columns.filter_mask()
+    totals, margins = columns.estimated_totals(mask, 1.0)
+    assert totals == columns.totals(mask)
+    assert margins["sessions"] == 0 and margins["avg_session_time"] == 0
+    assert all(counters == {"visits": 0, "time_minutes": 0} for counters in margins["pages"].values())
+
+
+def test_sample_estimates_fall_within_their_margins():
+    documents = dict(generate_sessions(20000, seed=4))
+    rate = 0.1
+    full = _columns(documents)
+    exact = full.totals(full.filter_mask())
+    sample = _columns({session_id: data for session_id, data in documents.items() if data["sample_hash"] < rate})
+    mask = sample.filter_mask()
+    totals, margins = sample.estimated_totals(mask, rate)
+
+    assert abs(totals["sessions"] - exact["sessions"]) <= margins["sessions"]
+    assert abs(totals["total_time_minutes"] / totals["sessions"] - exact["total_time_minutes"] / exact["sessions"]) \
+        <= margins["avg_session_time"]
+    for page, counters in exact["pages"].items():
+        assert abs(totals["pages"][page]["visits"] - counters["visits"]) <= margins["pages"][page]["visits"], page
+    # Each sampled session adds 1 to the sum of squares
+    assert margins["sessions"] == round(1.96 * math.sqrt((1 - rate) / rate ** 2 * mask.sum()), 2)
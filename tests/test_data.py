@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from websiteanalytics.dashboard import data
+from websiteanalytics.dashboard.data import ALL_TIME, CUSTOM_RANGE, TimeWindow, time_window
+from websiteanalytics.dashboard.query_cache import query_cache
+from websiteanalytics.tracking.events import PAGE_ENTER, SESSION_START, make_event, session_writes
+from websiteanalytics.tracking.rollups import DAY, HOUR
+from websiteanalytics.tracking.writes import WriteOp, commit_ops
+
+
+@pytest.fixture
+def fresh_cache():
+    query_cache.invalidate()
+    yield query_cache
+    query_cache.invalidate()
+
+
+def _document(user_email, login_time, updated_at, page="home"):
+    return {
+        "schema": 2,
+        "user_email": user_email,
+        "login_time": login_time,
+        "updated_at": updated_at,
+        "pages": {page: {"v": 1}},
+    }
+
+
+def test_delta_sync_reads_only_changes_past_the_cursor(memory_storage, fresh_cache, monkeypatch):
+    monkeypatch.setattr(data, "SESSIONS_TTL", 0)
+    commit_ops([
+        WriteOp("analytics", f"s{i}", _document(f"user{i}@example.com", 1000.0 + i, 5000.0), False)
+        for i in range(10)
+    ])
+    snapshot = data.load_sessions()
+    assert len(snapshot.sessions) == 10
+    assert snapshot.cursor == 5000.0
+
+    reads = []
+    find = memory_storage.backend.find
+
+    def recorded_find(collection, filters, *args):
+        reads.append(filters)
+        return find(collection, filters, *args)
+
+    monkeypatch.setattr(memory_storage.backend, "find", recorded_find)
+    commit_ops(session_writes([
+        make_event(SESSION_START, "s10", "new@example.com", ts=2000.0),
+        make_event(PAGE_ENTER, "s3", "user3@example.com", ts=2000.0, page="shop"),
+    ]))
+    synced = data.load_sessions()
+
+    assert reads == [[("updated_at", ">", 5000.0 - data.SYNC_OVERLAP_SECONDS)]]
+    assert len(synced.sessions) == 11
+    assert synced.sessions[0]["session_id"] == "s10"
+    assert synced.index["s3"]["pages"].keys() == {"home", "shop"}
+    assert synced.cursor > 5000.0
+    # Nothing changed since: the same snapshot is kept
+    assert data.load_sessions() is synced
+
+
+def test_delta_sync_drops_archived_sessions(memory_storage, fresh_cache, monkeypatch):
+    monkeypatch.setattr(data, "SESSIONS_TTL", 0)
+    monkeypatch.setattr(data, "SCHEMA_TTL", 0)
+    commit_ops([
+        WriteOp("analytics", f"s{i}", _document("a@example.com", 1000.0 * (i + 1), 5000.0), False)
+        for i in range(4)
+    ])
+    assert len(data.load_sessions().sessions) == 4
+
+    monkeypatch.setattr(data, "archived_before", lambda: 2500.0)
+    synced = data.load_sessions()
+    assert sorted(synced.index) == ["s2", "s3"]
+
+
+def _epoch(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def test_preset_windows_start_on_their_rollup_bucket():
+    now = _epoch(2025, 3, 10, 14, 35, 20)
+    assert time_window("Last hour", now=now) == TimeWindow(_epoch(2025, 3, 10, 13), None, HOUR)
+    assert time_window("Last 24 hours", now=now) == TimeWindow(_epoch(2025, 3, 9, 14), None, HOUR)
+    assert time_window("Last 7 days", now=now) == TimeWindow(_epoch(2025, 3, 3), None, DAY)
+
+
+def test_custom_windows_include_both_days():
+    assert time_window(CUSTOM_RANGE, "2025-03-01", "2025-03-02") == \
+        TimeWindow(_epoch(2025, 3, 1), _epoch(2025, 3, 3), DAY)
+    assert time_window(CUSTOM_RANGE, "", "2025-03-02") == TimeWindow(None, _epoch(2025, 3, 3), DAY)
+    assert time_window(CUSTOM_RANGE) == TimeWindow(None, None, DAY)
+    assert time_window(ALL_TIME, "2025-03-01") == TimeWindow(None, None, DAY)
+    with pytest.raises(ValueError):
+        time_window(CUSTOM_RANGE, "03/01/2025")
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from websiteanalytics.tracking import event_log
+from websiteanalytics.tracking.event_buffer import EventBuffer
+from websiteanalytics.tracking.event_log import (
+    COMPACTION_CURSOR,
+    EVENTS,
+    META,
+    compact_events,
+    event_log_writes,
+    prune_events,
+    stamp_ingested,
+)
+from websiteanalytics.tracking.events import PAGE_ENTER, SESSION_START, make_event
+from websiteanalytics.tracking.writes import commit_ops
+
+
+def _log(storage, session_id, ingested_at, seq=0, event_type=PAGE_ENTER):
+    event = make_event(event_type, session_id, "a@example.com", seq=seq, ts=ingested_at, page="home")
+    for op in event_log_writes([event]):
+        storage.set(op.collection, op.doc_id, dict(op.data, ingested_at=ingested_at))
+
+
+def _cursor(storage):
+    return storage.get(META, COMPACTION_CURSOR)["ingested_at"]
+
+
+def test_compaction_folds_events_once(memory_storage):
+    old = time.time() - 100
+    _log(memory_storage, "s1", old, seq=0, event_type=SESSION_START)
+    _log(memory_storage, "s1", old + 1, seq=1)
+    _log(memory_storage, "s1", old + 2, seq=2)
+
+    assert compact_events() == 3
+    assert _cursor(memory_storage) == old + 2
+    assert memory_storage.get("analytics", "s1")["pages"]["home"]["v"] == 2
+    # Nothing past the cursor, so the next pass folds nothing and visits are not counted twice
+    assert compact_events() == 0
+    assert memory_storage.get("analytics", "s1")["pages"]["home"]["v"] == 2
+
+
+def test_compaction_leaves_recent_events(memory_storage):
+    _log(memory_storage, "s1", time.time() - 100)
+    _log(memory_storage, "s1", time.time(), seq=1)
+
+    assert compact_events() == 1
+    assert compact_events() == 0
+    assert memory_storage.get("analytics", "s1")["pages"]["home"]["v"] == 1
+
+
+def test_compaction_drops_pass_when_cursor_moved(memory_storage, monkeypatch):
+    _log(memory_storage, "s1", time.time() - 100)
+    memory_storage.set(META, COMPACTION_CURSOR, {"ingested_at": 1})
+    # This worker read the cursor before another one advanced it
+    real_get = memory_storage.get
+    monkeypatch.setattr(memory_storage, "get", lambda collection, doc_id: (
+        None if (collection, doc_id) == (META, COMPACTION_CURSOR) else real_get(collection, doc_id)
+    ))
+
+    assert compact_events() == 0
+    assert real_get("analytics", "s1") is None
+    assert real_get(META, COMPACTION_CURSOR)["ingested_at"] == 1
+
+
+def test_full_page_does_not_split_equal_ingested_at(memory_storage, monkeypatch):
+    monkeypatch.setattr(event_log, "EVENTS_PER_PASS", 3)
+    old = time.time() - 100
+    _log(memory_storage, "s1", old, seq=0)
+    for seq in (1, 2, 3):
+        _log(memory_storage, "s1", old + 1, seq=seq)
+
+    # The page ends inside the run at old + 1, which is left whole for the next pass
+    assert compact_events() == 1
+    assert _cursor(memory_storage) == old
+    assert compact_events() == 3
+    assert _cursor(memory_storage) == old + 1
+    assert memory_storage.get("analytics", "s1")["pages"]["home"]["v"] == 4
+
+
+def test_prune_keeps_events_past_the_cursor(memory_storage):
+    old = time.time() - 100
+    _log(memory_storage, "s1", old, seq=0)
+    _log(memory_storage, "s1", old + 1, seq=1)
+    assert prune_events() == 0
+
+    assert compact_events() == 2
+    _log(memory_storage, "s1", old + 2, seq=2)
+    assert prune_events() == 2
+    assert [doc_id for doc_id, _ in memory_storage.find(EVENTS)] == ["s1_000002"]
+
+
+def test_event_log_writes_are_stamped_on_each_attempt(memory_storage, monkeypatch):
+    monkeypatch.setattr("websiteanalytics.tracking.writes.time.sleep", lambda seconds: None)
+    memory_storage.backend.failure_rate = 1.0
+    attempts = []
+
+    def prepare(chunk):
+        chunk = stamp_ingested(chunk)
+        attempts.append(chunk[0].data["ingested_at"])
+        return chunk
+
+    ops = event_log_writes([make_event(PAGE_ENTER, "s1", "a@example.com", page="home")])
+    assert "ingested_at" not in ops[0].data
+    commit_ops(ops, max_retries=3, prepare=prepare)
+    assert len(attempts) == 3
+    assert attempts == sorted(attempts)
+    assert memory_storage.backend.failures == 3
+
+
+def test_run_wider_than_a_pass_is_taken_whole(memory_storage, monkeypatch):
+    monkeypatch.setattr(event_log, "MAX_SESSIONS_PER_PASS", 2)
+    old = time.time() - 100
+    for session_id in ("s1", "s2", "s3"):
+        _log(memory_storage, session_id, old)
+    _log(memory_storage, "s4", old + 1)
+
+    assert compact_events() == 3
+    assert _cursor(memory_storage) == old
+    assert compact_events() == 1
+
+
+def test_event_buffer_flushes_fit_in_a_pass():
+    with pytest.raises(ValueError):
+        EventBuffer(flush_size=event_log.MAX_SESSIONS_PER_PASS + 1)
@@ -0,0 +1,74 @@
+import logging
+import random
+
+from websiteanalytics.logs import SampleFilter, _parse_levels, get_sampled_logger
+
+
+class _Recorder(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class _Counted:
+    """Log argument that counts how often the message is built"""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "document"
+
+
+def _logger(name, rate):
+    logger = logging.getLogger(f"tests.logs.{name}")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addFilter(SampleFilter(rate))
+    recorder = _Recorder()
+    logger.addHandler(recorder)
+    return logger, recorder
+
+
+def test_sample_filter_keeps_about_rate_of_debug_records(monkeypatch):
+    monkeypatch.setattr(random, "random", random.Random(7).random)
+    logger, recorder = _logger("sampled", 0.1)
+    for i in range(5000):
+        logger.debug("doc %d", i)
+    assert 400 < len(recorder.messages) < 600
+
+
+def test_sample_filter_keeps_every_record_above_debug():
+    logger, recorder = _logger("above", 0.0)
+    logger.debug("dropped")
+    logger.info("kept")
+    logger.warning("kept too")
+    assert recorder.messages == ["kept", "kept too"]
+
+
+def test_dropped_records_are_never_formatted():
+    logger, recorder = _logger("lazy", 0.0)
+    argument = _Counted()
+    logger.debug("%s", argument)
+    assert argument.formatted == 0
+    logger.info("%s", argument)
+    assert argument.formatted == 1
+
+
+def test_sampled_logger_is_a_documents_child_with_one_filter():
+    logger = get_sampled_logger("websiteanalytics.tests_sampled", rate=0.5)
+    assert logger.name == "websiteanalytics.tests_sampled.documents"
+    assert get_sampled_logger("websiteanalytics.tests_sampled", rate=0.9) is logger
+    assert [f.rate for f in logger.filters] == [0.5]
+
+
+def test_parse_levels():
+    assert _parse_levels("info, dashboard.sessions=debug,tracking=WARNING,bad=loud,") == {
+        "": logging.INFO,
+        "dashboard.sessions": logging.DEBUG,
+        "tracking": logging.WARNING,
+    }
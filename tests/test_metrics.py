@@ -0,0 +1,78 @@
+import asyncio
+
+from reflex.event import Event
+from reflex.state import State
+
+from websiteanalytics import metrics
+from websiteanalytics.metrics import MetricsMiddleware, handler_labels, metrics_endpoint, registry
+from websiteanalytics.pages.analyticalpage import AnalyticsDashboardState
+
+STATE = AnalyticsDashboardState.get_full_name()
+
+
+class _Update:
+    def __init__(self, final=True):
+        self.final = final
+
+    def json(self):
+        return '{"delta": {}}'
+
+
+def _sample(name, handler):
+    return registry.get_sample_value(name, {"state": "analytics_dashboard_state", "handler": handler}) or 0
+
+
+def _run(middleware, event, updates):
+    # The handlers never read the state beyond its class
+    state = object.__new__(State)
+
+    async def run():
+        await middleware.preprocess(None, state, event)
+        for update in updates:
+            await middleware.postprocess(None, state, event, update)
+
+    asyncio.run(run())
+
+
+def test_handler_labels():
+    assert handler_labels(f"{STATE}.load_analytics") == ("analytics_dashboard_state", "load_analytics")
+    assert handler_labels("state.hydrate") == ("state", "hydrate")
+
+
+def test_handlers_are_timed_once_at_their_final_update():
+    before = _sample("analytics_handler_seconds_count", "load_analytics")
+    middleware = MetricsMiddleware(payload_sample_rate=0.0)
+    _run(middleware, Event(token="t", name=f"{STATE}.load_analytics", payload={}), [_Update(False), _Update()])
+    assert _sample("analytics_handler_seconds_count", "load_analytics") == before + 1
+    assert middleware._started == {}
+
+
+def test_background_handlers_are_not_timed():
+    before = _sample("analytics_handler_seconds_count", "watch_analytics")
+    middleware = MetricsMiddleware(payload_sample_rate=0.0)
+    _run(middleware, Event(token="t", name=f"{STATE}.watch_analytics", payload={"token": 1}), [_Update()])
+    assert _sample("analytics_handler_seconds_count", "watch_analytics") == before
+    assert middleware._background == {f"{STATE}.watch_analytics": True}
+
+
+def test_payload_sizes_are_sampled():
+    before = _sample("analytics_state_payload_bytes_count", "clear_filters")
+    event = Event(token="t", name=f"{STATE}.clear_filters", payload={})
+    _run(MetricsMiddleware(payload_sample_rate=1.0), event, [_Update()])
+    _run(MetricsMiddleware(payload_sample_rate=0.0), event, [_Update()])
+    assert _sample("analytics_state_payload_bytes_count", "clear_filters") == before + 1
+    assert _sample("analytics_state_payload_bytes_sum", "clear_filters") >= len(_Update().json())
+
+
+def test_pending_start_times_are_bounded(monkeypatch):
+    monkeypatch.setattr(metrics, "MAX_PENDING_EVENTS", 3)
+    middleware = MetricsMiddleware(payload_sample_rate=0.0)
+    for _ in range(5):
+        _run(middleware, Event(token="t", name=f"{STATE}.load_analytics", payload={}), [])
+    assert len(middleware._started) <= 3
+
+
+def test_metrics_endpoint_serves_the_registry():
+    response = asyncio.run(metrics_endpoint(None))
+    assert response.status_code == 200
+    assert b"analytics_handler_seconds" in response.body
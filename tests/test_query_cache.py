@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from websiteanalytics.dashboard.query_cache import QueryCache
+
+
+def test_entries_expire_after_their_ttl_and_reload_from_the_previous_value():
+    cache = QueryCache()
+    loads = []
+
+    def loader(previous):
+        loads.append(previous)
+        return len(loads)
+
+    assert cache.get_or_load("key", loader, ttl=60) == 1
+    assert cache.get_or_load("key", loader, ttl=60) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    # A zero TTL treats the cached value as expired and hands it to the loader
+    assert cache.get_or_load("key", loader, ttl=0) == 2
+    assert loads == [None, 1]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.get_or_load("a", lambda previous: 1, ttl=60)
+    cache.get_or_load("b", lambda previous: 2, ttl=60)
+    cache.get_or_load("a", lambda previous: 0, ttl=60)
+    cache.get_or_load("c", lambda previous: 3, ttl=60)
+    assert cache.keys() == ["a", "c"]
+
+
+def test_concurrent_misses_share_one_load():
+    cache = QueryCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader(previous):
+        calls.append(previous)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_load("key", loader, ttl=60)))
+        for _ in range(8)
+    ]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [None]
+    assert results == ["value"] * 8
+
+
+def test_failed_load_is_not_cached():
+    cache = QueryCache()
+
+    def failing(previous):
+        raise RuntimeError("backend down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("key", failing)
+    assert cache.keys() == []
+    assert cache.get_or_load("key", lambda previous: "value") == "value"
+
+
+def test_update_and_invalidate():
+    cache = QueryCache()
+    cache.update("missing", lambda value: value + 1)
+    assert cache.keys() == []
+    cache.get_or_load("key", lambda previous: 1, ttl=60)
+    cache.update("key", lambda value: value + 1)
+    assert cache.get_or_load("key", lambda previous: 0, ttl=60) == 2
+    cache.invalidate("key")
+    assert cache.keys() == []
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+
+import zstandard
+
+from websiteanalytics.tracking.retention import archive_sessions, archived_before, read_archive
+from websiteanalytics.tracking.session_schema import SESSIONS
+from websiteanalytics.tracking.writes import WriteOp, commit_ops
+
+DAY_SECONDS = 86400
+
+
+def _epoch(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+NOW = _epoch(2025, 6, 1, 12)
+
+
+def _sessions(login_times):
+    commit_ops([
+        WriteOp(SESSIONS, f"s{i}", {"user_email": f"u{i}@example.com", "login_time": login_time}, False)
+        for i, login_time in enumerate(login_times)
+    ])
+
+
+def test_old_sessions_move_to_zstd_day_files(memory_storage, tmp_path):
+    login_times = [_epoch(2025, 2, 1, 10), _epoch(2025, 2, 1, 23), _epoch(2025, 2, 3, 1), NOW - DAY_SECONDS]
+    _sessions(login_times)
+    commit_ops([WriteOp(SESSIONS, "no_login", {"user_email": "x@example.com"}, False)])
+
+    assert archive_sessions(90, tmp_path, batch_size=2, now=NOW) == 3
+    assert sorted(doc_id for doc_id, _ in memory_storage.find(SESSIONS)) == ["no_login", "s3"]
+    assert archived_before() == _epoch(2025, 3, 3)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "analytics-2025-02-01.ndjson.zst", "analytics-2025-02-03.ndjson.zst",
+    ]
+    text = zstandard.ZstdDecompressor().stream_reader(
+        (tmp_path / "analytics-2025-02-03.ndjson.zst").read_bytes(), read_across_frames=True
+    ).read()
+    assert b'"id": "s2"' in text
+
+    assert [session_id for session_id, _ in read_archive(directory=tmp_path)] == ["s0", "s1", "s2"]
+    assert [session_id for session_id, _ in read_archive(_epoch(2025, 2, 1, 12), _epoch(2025, 2, 3), tmp_path)] == ["s1"]
+
+
+def test_interrupted_runs_are_read_once(memory_storage, tmp_path):
+    _sessions([_epoch(2025, 1, 5, 9), _epoch(2025, 1, 5, 10)])
+    documents = dict(memory_storage.find(SESSIONS))
+    archive_sessions(90, tmp_path, now=NOW)
+    # A run stopped after writing but before deleting archives the same sessions again
+    commit_ops([WriteOp(SESSIONS, session_id, data, False) for session_id, data in documents.items()])
+    archive_sessions(90, tmp_path, now=NOW)
+
+    assert dict(read_archive(directory=tmp_path)) == documents
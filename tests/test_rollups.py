@@ -0,0 +1,59 @@
+from collections import Counter
+
+from benchmarks.synthetic import generate_sessions
+from websiteanalytics.tracking import sketches
+from websiteanalytics.tracking.events import PAGE_ENTER, PAGE_EXIT, SESSION_END, SESSION_START, make_event
+from websiteanalytics.tracking.rollups import DAY, HOUR, ROLLUPS, backfill_rollups, load_rollups, rollup_writes
+from websiteanalytics.tracking.session_schema import read_session
+from websiteanalytics.tracking.sketches import SketchWriter, load_sketch_totals
+from websiteanalytics.tracking.writes import WriteOp, commit_ops
+
+NOW = 1.75e9
+
+
+def _session(session_id, user_email, ts, page="shop", minutes=2.0):
+    return [
+        make_event(SESSION_START, session_id, user_email, 0, ts),
+        make_event(PAGE_ENTER, session_id, user_email, 1, ts, page=page),
+        make_event(PAGE_EXIT, session_id, user_email, 2, ts + 60, page=page, time_spent_minutes=minutes),
+        make_event(SESSION_END, session_id, user_email, 3, ts + 60, total_session_time_minutes=minutes),
+    ]
+
+
+def test_rollups_sum_across_writes_and_buckets(memory_storage):
+    events = _session("s1", "a@example.com", NOW) + _session("s2", "b@example.com", NOW + 7200, minutes=3.0)
+    commit_ops(rollup_writes(events[:4]))
+    commit_ops(rollup_writes(events[4:]))
+
+    totals = load_rollups(DAY)
+    assert totals["sessions"] == 2
+    assert totals["total_time_minutes"] == 5.0
+    assert totals["pages"]["shop"] == {"visits": 2, "time_minutes": 5.0}
+    # Per-user counts are not fanned out into documents of their own
+    assert totals["users"] == {}
+    assert memory_storage.count(ROLLUPS) == 3
+
+    first_hour = load_rollups(HOUR, NOW, NOW + 3600)
+    assert first_hour["sessions"] == 1
+
+
+def test_backfill_matches_the_sessions(memory_storage, monkeypatch):
+    monkeypatch.setattr(sketches, "sketch_writer", SketchWriter())
+    documents = dict(generate_sessions(300, seed=3))
+    commit_ops([WriteOp("analytics", session_id, data, False) for session_id, data in documents.items()])
+
+    backfill_rollups()
+
+    sessions = [read_session(data) for data in documents.values()]
+    totals = load_rollups(DAY)
+    assert totals["sessions"] == len(sessions)
+    assert totals["anonymous_sessions"] == sum(session["anonymous"] for session in sessions)
+    visits = Counter()
+    for session in sessions:
+        for page, counters in session["pages"].items():
+            visits[page] += int(counters["visits"])
+    assert {page: counters["visits"] for page, counters in totals["pages"].items()} == dict(visits)
+
+    top_users = load_sketch_totals(DAY)["top_users"]
+    per_user = Counter(session["user_email"] for session in sessions)
+    assert {user: counters["sessions"] for user, counters in top_users.items()} == dict(per_user)
@@ -0,0 +1,77 @@
+import time
+
+from benchmarks.synthetic import generate_sessions
+from websiteanalytics.tracking.session_schema import (
+    META,
+    SCHEMA_DOC,
+    SESSIONS,
+    is_current,
+    migrate_sessions,
+    read_session,
+    sample_hash,
+    schema_migrated,
+    upgrade_session,
+)
+from websiteanalytics.tracking.writes import WriteOp, commit_ops
+
+V1 = {
+    "user_email": "a@example.com",
+    "login_time": 1000.0,
+    "session_start": 1000.0,
+    "is_anonymous": False,
+    "logout_time": 1600.0,
+    "total_session_time_minutes": 10.0,
+    "pages.home.visits": 2,
+    "pages.home.time_spent": 4.0,
+    "pages.home.entry_time": 1100.0,
+    "pages.shop.visits": 1,
+    "referrer": "newsletter",
+}
+
+
+def test_upgrade_renames_fields_and_nests_pages():
+    document = upgrade_session("s1", V1)
+    assert document == {
+        "schema": 2,
+        "sample_hash": sample_hash("s1"),
+        "user_email": "a@example.com",
+        "login_time": 1000.0,
+        "referrer": "newsletter",
+        "out": 1600.0,
+        "total": 10.0,
+        "pages": {"home": {"v": 2, "t": 4.0, "en": 1100.0}, "shop": {"v": 1}},
+    }
+    assert read_session(document) == read_session(V1)
+
+
+def test_upgrade_sums_mixed_layouts():
+    mixed = {"user_email": "anonymous", "is_anonymous": True, "pages.home.visits": 1, "pages": {"home": {"v": 2}}}
+    document = upgrade_session("s2", mixed)
+    assert document["anon"] is True
+    assert document["pages"] == {"home": {"v": 3}}
+    assert is_current(document)
+
+
+def test_migration_rewrites_old_sessions_and_defers_active_ones(memory_storage):
+    documents = dict(generate_sessions(40, seed=5, schema=1))
+    for data in documents.values():
+        data["updated_at"] = 1000.0
+    active_id = next(iter(documents))
+    documents[active_id]["updated_at"] = time.time()
+    commit_ops([WriteOp(SESSIONS, session_id, data, False) for session_id, data in documents.items()])
+    commit_ops([WriteOp(SESSIONS, "v2_no_hash", {"schema": 2, "user_email": "b@example.com", "pages": {}}, False)])
+
+    assert migrate_sessions(batch_size=7) == 40
+    assert not schema_migrated()
+    for session_id, data in documents.items():
+        stored = memory_storage.get(SESSIONS, session_id)
+        assert is_current(stored) != (session_id == active_id)
+        assert read_session(stored)["pages"] == read_session(data)["pages"]
+    assert memory_storage.get(SESSIONS, "v2_no_hash")["sample_hash"] == sample_hash("v2_no_hash")
+
+    memory_storage.set(SESSIONS, active_id, dict(documents[active_id], updated_at=1000.0))
+    assert migrate_sessions() == 1
+    assert schema_migrated()
+    assert memory_storage.get(META, SCHEMA_DOC)["version"] == 2
+    # A second run finds nothing to do
+    assert migrate_sessions() == 0
@@ -0,0 +1,73 @@
+import random
+
+from benchmarks.synthetic import generate_sessions
+from websiteanalytics.dashboard.columnar import SessionColumns
+from websiteanalytics.dashboard.sessions import SessionSnapshot
+
+
+def _changes(documents, count, seed=0):
+    rng = random.Random(seed)
+    changed = {}
+    for session_id in rng.sample(sorted(documents), count):
+        document = dict(documents[session_id])
+        document["updated_at"] = document.get("updated_at", 0) + 1
+        document["login_time"] = rng.uniform(1.6e9, 1.8e9)
+        changed[session_id] = document
+    return changed
+
+
+def _same_view(patched, fresh, filter_user="", filter_page=""):
+    mask = patched.filter_mask(filter_user, filter_page)
+    fresh_mask = fresh.filter_mask(filter_user, filter_page)
+    rows = [patched.sessions[row]["session_id"] for row in patched.ordered_rows(mask)]
+    fresh_rows = [fresh.sessions[row]["session_id"] for row in fresh.ordered_rows(fresh_mask)]
+    assert rows == fresh_rows
+    totals, fresh_totals = patched.totals(mask), fresh.totals(fresh_mask)
+    assert totals["sessions"] == fresh_totals["sessions"]
+    assert totals["users"].keys() == fresh_totals["users"].keys()
+    assert {page: counters["visits"] for page, counters in totals["pages"].items()} == \
+        {page: counters["visits"] for page, counters in fresh_totals["pages"].items()}
+    assert patched.durations(mask) == fresh.durations(fresh_mask)
+
+
+def test_merge_keeps_newest_first_order_and_skips_unchanged():
+    documents = dict(generate_sessions(500))
+    snapshot = SessionSnapshot("all").merged(documents)
+    assert snapshot.merged(documents) is snapshot
+
+    changed = _changes(documents, 20)
+    removed = sorted(documents)[:5]
+    merged = snapshot.merged(changed, removed)
+    expected = sorted(merged.index.values(), key=lambda session: session["login_time"] or 0, reverse=True)
+    assert [session["login_time"] for session in merged.sessions] == [session["login_time"] for session in expected]
+    assert len(merged.sessions) == len(merged.index) == 500 - len(set(removed) - set(changed))
+
+
+def test_merged_snapshot_patches_columns():
+    documents = dict(generate_sessions(500))
+    snapshot = SessionSnapshot("all").merged(documents)
+    columns = snapshot.columns()
+
+    changed = _changes(documents, 20)
+    removed = [session_id for session_id in sorted(documents) if session_id not in changed][:5]
+    merged = snapshot.merged(changed, removed)
+    patched = merged.columns()
+    assert patched is not columns
+    assert len(patched) == 520
+    assert patched.dead_rows() == 25
+    # The snapshot it came from still sees its own rows
+    assert columns.time_mask().sum() == 500
+
+    fresh = SessionColumns(merged.sessions)
+    _same_view(patched, fresh)
+    _same_view(patched, fresh, filter_user="user1", filter_page="o")
+
+
+def test_columns_are_rebuilt_once_a_quarter_is_dead():
+    documents = dict(generate_sessions(400))
+    snapshot = SessionSnapshot("all").merged(documents)
+    snapshot.columns()
+    merged = snapshot.merged({}, sorted(documents)[:150])
+    columns = merged.columns()
+    assert len(columns) == 250 and columns.dead_rows() == 0
+    assert columns.ordered
@@ -0,0 +1,197 @@
+import json
+import time
+
+import numpy as np
+
+from websiteanalytics.tracking.events import PAGE_ENTER, SESSION_END, SESSION_START, make_event
+from websiteanalytics.tracking.rollups import DAY, HOUR, bucket_start
+from websiteanalytics.tracking.sketches import (
+    DURATION_EDGES,
+    SKETCHES,
+    HyperLogLog,
+    SketchWriter,
+    TDigest,
+    TopUsers,
+    duration_summary,
+    load_sketch_totals,
+)
+from websiteanalytics.tracking.writes import commit_ops, writer_id
+
+
+def _sketch(values):
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_hyperloglog_base64_round_trip():
+    sketch = _sketch(f"user{i}@example.com" for i in range(5000))
+    restored = HyperLogLog.from_base64(sketch.to_base64())
+    assert restored.precision == sketch.precision
+    assert np.array_equal(restored.registers, sketch.registers)
+    assert restored.count() == sketch.count()
+    # The restored registers are writable
+    restored.add("someone@example.com")
+
+
+def test_empty_hyperloglog_round_trip():
+    restored = HyperLogLog.from_base64(HyperLogLog().to_base64())
+    assert restored.count() == 0
+
+
+def test_hyperloglog_count_and_merge():
+    first = _sketch(f"user{i}" for i in range(6000))
+    second = _sketch(f"user{i}" for i in range(4000, 10000))
+    assert abs(first.count() - 6000) < 6000 * 0.05
+    assert abs(first.merge(second).count() - 10000) < 10000 * 0.05
+
+
+def test_sketch_documents_round_trip_through_storage(memory_storage):
+    now = time.time()
+    writer = SketchWriter()
+    events = []
+    for i in range(300):
+        events.append(make_event(SESSION_START, f"s{i}", f"user{i % 200}@example.com", ts=now))
+        events.append(make_event(PAGE_ENTER, f"s{i}", f"user{i % 50}@example.com", ts=now, page="shop"))
+    ops = writer.writes(events[:300]) + writer.writes(events[300:])
+    # Documents hold only JSON values
+    for op in ops:
+        json.dumps(op.data)
+    commit_ops(ops)
+
+    totals = load_sketch_totals(HOUR, now - 3600, now + 3600)
+    assert abs(totals["users"] - 200) <= 10
+    assert list(totals["pages"]) == ["shop"]
+    assert abs(totals["pages"]["shop"] - 50) <= 3
+    assert memory_storage.count(SKETCHES) == 2
+
+
+def _digest(values):
+    digest = TDigest()
+    for value in values:
+        digest.add(value)
+    return digest
+
+
+def test_tdigest_dict_round_trip():
+    rng = np.random.default_rng(0)
+    digest = _digest(rng.exponential(4.0, 20000))
+    data = digest.to_dict()
+    restored = TDigest.from_dict(json.loads(json.dumps(data)))
+    assert restored.count() == digest.count() == 20000
+    assert (restored.minimum, restored.maximum) == (digest.minimum, digest.maximum)
+    for q in (0.01, 0.5, 0.9, 0.99):
+        assert restored.quantile(q) == digest.quantile(q)
+
+
+def test_empty_tdigest_round_trip():
+    data = TDigest().to_dict()
+    # JSON has no infinity, so the extremes of an empty digest are stored as null
+    assert data["min"] is None and data["max"] is None
+    restored = TDigest.from_dict(json.loads(json.dumps(data)))
+    assert restored.count() == 0
+    assert restored.quantile(0.5) == 0.0
+    restored.add(3.0)
+    assert restored.quantile(0.5) == 3.0
+
+
+def test_tdigest_quantiles_and_merge():
+    rng = np.random.default_rng(1)
+    values = rng.exponential(4.0, 40000)
+    merged = _digest(values[:25000]).merge(_digest(values[25000:]))
+    for q in (0.5, 0.9, 0.99):
+        assert abs(merged.quantile(q) - np.quantile(values, q)) < 0.02 * np.quantile(values, q)
+
+
+def test_duration_summary_bins_take_their_upper_edge():
+    values = [0.5, 0.6, 1, 60, 61]
+    counts = np.bincount(np.searchsorted(DURATION_EDGES, values, side="left"), minlength=len(DURATION_EDGES) + 1)
+    summary = duration_summary(_digest(values), counts)
+    assert summary["histogram"] == [1, 2, 0, 0, 0, 0, 0, 1, 1]
+
+
+def test_session_durations_round_trip_through_storage(memory_storage):
+    now = time.time()
+    writer = SketchWriter()
+    events = [
+        make_event(SESSION_END, f"s{i}", "a@example.com", ts=now, total_session_time_minutes=minutes,
+                   page_minutes={"home": minutes / 2, "shop": 0})
+        for i, minutes in enumerate([0.5, 1, 1.5, 5, 70])
+    ]
+    commit_ops(writer.writes(events))
+    # A document written before histograms were kept falls back to its digest
+    legacy = _digest([3.0])
+    memory_storage.set(SKETCHES, "legacy", {
+        "granularity": DAY, "bucket": bucket_start(now, DAY),
+        "users": HyperLogLog().to_base64(), "durations": legacy.to_dict(),
+    })
+
+    totals = load_sketch_totals(DAY, now - 86400, now + 86400)
+    assert totals["durations"]["histogram"] == [1, 1, 1, 2, 0, 0, 0, 0, 1]
+    # Pages count once per ended session, and only with time spent on them
+    assert list(totals["page_durations"]) == ["home"]
+    assert totals["page_durations"]["home"]["p50"] == 0.75
+
+
+def test_sketched_and_exact_histograms_agree(memory_storage):
+    from benchmarks.synthetic import generate_sessions
+    from websiteanalytics.dashboard.sessions import SessionSnapshot
+    from websiteanalytics.tracking.rollups import _session_events
+
+    documents = dict(generate_sessions(2000))
+    # An open session counts on neither side
+    documents["open"] = {"user_email": "a@example.com", "login_time": time.time(), "pages": {"home": {"v": 1, "t": 2.0}}}
+    writer = SketchWriter()
+    events = [event for session_id, data in documents.items() for event in _session_events(session_id, data)]
+    commit_ops(writer.writes(events))
+
+    columns = SessionSnapshot("all").merged(documents).columns()
+    exact = columns.durations(columns.time_mask())
+    sketched = load_sketch_totals(DAY)
+    assert sketched["durations"]["histogram"] == exact["durations"]["histogram"]
+    assert sketched["page_durations"].keys() == exact["page_durations"].keys()
+
+
+def test_top_users_keeps_the_heavy_hitters():
+    top = TopUsers(capacity=20)
+    for i in range(1000):
+        # Five users start 100 sessions each, between 500 users who start one
+        top.add(f"heavy{i // 2 % 5}" if i % 2 == 0 else f"light{i}")
+    assert len(top.counts) == 20
+    # Anyone above 1000 / 20 sessions is held, and counts never underestimate
+    assert {user for user, _ in top.top(5)} == {f"heavy{i}" for i in range(5)}
+    assert all(count >= 100 for _, count in top.top(5))
+
+
+def test_top_users_merge_and_round_trip():
+    first, second = TopUsers(capacity=3), TopUsers(capacity=3)
+    for user, count in (("a", 5), ("b", 3), ("c", 1)):
+        first.add(user, count)
+    for user, count in (("a", 2), ("d", 4), ("e", 1)):
+        second.add(user, count)
+    restored = TopUsers.from_list(json.loads(json.dumps(first.to_list())), capacity=3)
+    merged = restored.merge(second)
+    assert merged.top(3) == [("a", 7), ("d", 4), ("b", 3)]
+    assert len(merged.counts) == 3
+
+
+def test_sketch_documents_hold_top_users(memory_storage):
+    now = time.time()
+    writer = SketchWriter()
+    events = [
+        make_event(SESSION_START, f"s{i}", f"user{i % 3}@example.com", ts=now)
+        for i in range(9)
+    ]
+    commit_ops(writer.writes(events[:4]) + SketchWriter().writes(events[4:]))
+    top_users = load_sketch_totals(DAY, now - 86400, now + 86400)["top_users"]
+    assert top_users == {f"user{i}@example.com": {"sessions": 3} for i in range(3)}
+
+
+def test_sketch_documents_are_named_by_the_process_writer_id():
+    events = [make_event(SESSION_START, "s1", "a@example.com", ts=time.time())]
+    first, second = SketchWriter().writes(events), SketchWriter().writes(events)
+    doc_ids = {op.doc_id for op in first + second}
+    assert len(doc_ids) == 4
+    assert all(f"_{writer_id()}_" in doc_id for doc_id in doc_ids)
+    assert {op.data["writer"] for op in first} == {writer_id()}
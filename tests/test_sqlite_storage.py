@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+
+import pytest
+
+from websiteanalytics.storage import sqlite_backend
+from websiteanalytics.storage.base import Increment, WriteOp
+from websiteanalytics.storage.sqlite_backend import SQLiteStorage
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / "analytics.db"))
+
+
+def test_merge_and_increment(sqlite_storage):
+    sqlite_storage.set("analytics", "s1", {"user_email": "a@example.com", "pages": {"home": {"v": 1}}})
+    sqlite_storage.commit([
+        WriteOp("analytics", "s1", {"pages": {"home": {"v": Increment(2)}, "shop": {"v": Increment(1)}}}, True),
+        WriteOp("analytics", "s2", {"visits": Increment(3)}, True),
+    ])
+    assert sqlite_storage.get("analytics", "s1") == {
+        "user_email": "a@example.com",
+        "pages": {"home": {"v": 3}, "shop": {"v": 1}},
+    }
+    assert sqlite_storage.get("analytics", "s2") == {"visits": 3}
+    sqlite_storage.set("analytics", "s1", {"user_email": "b@example.com"})
+    assert sqlite_storage.get("analytics", "s1") == {"user_email": "b@example.com"}
+
+
+def test_commit_rolls_back_on_error(sqlite_storage):
+    with pytest.raises(sqlite3.IntegrityError):
+        sqlite_storage.commit([
+            WriteOp("analytics", "s1", {"visits": 1}, False),
+            WriteOp("analytics", None, {"visits": 2}, False),
+        ])
+    assert sqlite_storage.get("analytics", "s1") is None
+
+
+def test_commit_if_writes_only_when_the_check_passes(sqlite_storage):
+    sqlite_storage.set("meta", "cursor", {"position": 5})
+    ops = [WriteOp("meta", "cursor", {"position": 9}, True)]
+    assert not sqlite_storage.commit_if("meta", "cursor", lambda data: data["position"] == 4, ops)
+    assert sqlite_storage.get("meta", "cursor") == {"position": 5}
+    assert sqlite_storage.commit_if("meta", "cursor", lambda data: data["position"] == 5, ops)
+    assert sqlite_storage.get("meta", "cursor") == {"position": 9}
+
+
+def test_find_filters_orders_and_projects(sqlite_storage):
+    sqlite_storage.commit([
+        WriteOp("analytics", f"s{i}", {"login_time": float(i), "user_email": f"u{i % 2}", "pages": {}}, False)
+        for i in range(6)
+    ] + [WriteOp("analytics", "no_login", {"user_email": "u0"}, False)])
+    rows = sqlite_storage.find(
+        "analytics", [("user_email", "==", "u0")], order_by="login_time", descending=True,
+        start_after=4.0, limit=5, fields=("login_time",),
+    )
+    assert rows == [("s2", {"login_time": 2.0}), ("s0", {"login_time": 0.0})]
+    assert sqlite_storage.count("analytics", [("login_time", ">=", 3.0)]) == 3
+
+
+def test_partitions_cover_every_document_once(sqlite_storage, monkeypatch):
+    sqlite_storage.commit([WriteOp("analytics", f"s{i:03d}", {"n": i}, False) for i in range(100)])
+    sqlite_storage.set("other", "x", {"n": -1})
+
+    opened = []
+
+    class Tracked(sqlite3.Connection):
+        closed = False
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    real_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        opened.append(real_connect(*args, factory=Tracked, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(sqlite_backend.sqlite3, "connect", connect)
+    partitions = sqlite_storage.partitions("analytics", 8)
+    assert len(partitions) == 8
+    results = []
+    threads = [threading.Thread(target=lambda p=p: results.extend(sqlite_storage.scan(p))) for p in partitions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(doc_id for doc_id, _ in results) == [f"s{i:03d}" for i in range(100)]
+    # Every scan closes the connection it read with
+    assert len(opened) == 8 and all(conn.closed for conn in opened)
+    assert len(sqlite_storage.scan("analytics", fields=("n",))) == 100
+
+
+def test_collection_group_column_is_dropped(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE documents (collection TEXT NOT NULL, collection_group TEXT,"
+        " doc_id TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (collection, doc_id))"
+    )
+    conn.execute("CREATE INDEX documents_collection_group ON documents (collection_group)")
+    conn.execute("INSERT INTO documents VALUES ('analytics', 'analytics', 's1', '{\"n\": 1}')")
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(path)
+    columns = [row[1] for row in storage._conn.execute("PRAGMA table_info(documents)")]
+    assert columns == ["collection", "doc_id", "data"]
+    assert storage.get("analytics", "s1") == {"n": 1}
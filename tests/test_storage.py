@@ -0,0 +1,45 @@
+from websiteanalytics.storage.base import Increment, matches, merge_document
+
+
+def test_merge_replaces_without_merge():
+    document = {"a": 1, "pages": {"home": {"v": 2}}}
+    assert merge_document(document, {"b": 2}, merge=False) == {"b": 2}
+
+
+def test_merge_keeps_other_fields_and_nested_maps():
+    document = {"a": 1, "pages": {"home": {"v": 2, "t": 1.5}}}
+    merged = merge_document(document, {"pages": {"home": {"t": 3.0}, "shop": {"v": 1}}}, merge=True)
+    assert merged == {"a": 1, "pages": {"home": {"v": 2, "t": 3.0}, "shop": {"v": 1}}}
+
+
+def test_merge_does_not_modify_the_stored_document():
+    document = {"pages": {"home": {"v": 2}}}
+    merge_document(document, {"pages": {"home": {"v": Increment(1)}}}, merge=True)
+    assert document == {"pages": {"home": {"v": 2}}}
+
+
+def test_increment_adds_to_stored_number():
+    merged = merge_document({"visits": 2, "pages": {"home": {"v": 1}}}, {
+        "visits": Increment(3),
+        "pages": {"home": {"v": Increment(1)}},
+    }, merge=True)
+    assert merged == {"visits": 5, "pages": {"home": {"v": 2}}}
+
+
+def test_increment_starts_from_zero():
+    assert merge_document(None, {"visits": Increment(2)}, merge=True) == {"visits": 2}
+    assert merge_document({"visits": "x"}, {"visits": Increment(2)}, merge=True) == {"visits": 2}
+    # Without merge the document is replaced, so the stored count is ignored
+    assert merge_document({"visits": 7}, {"visits": Increment(2)}, merge=False) == {"visits": 2}
+
+
+def test_dotted_field_names_are_literal():
+    merged = merge_document({"pages.home.visits": 1}, {"pages.home.visits": Increment(1)}, merge=True)
+    assert merged == {"pages.home.visits": 2}
+
+
+def test_matches_skips_missing_fields():
+    document = {"login_time": 10, "user_email": "a@example.com"}
+    assert matches(document, [("login_time", ">=", 10), ("user_email", "==", "a@example.com")])
+    assert not matches(document, [("login_time", ">", 10)])
+    assert not matches(document, [("logout_time", "<", 100)])
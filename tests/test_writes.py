@@ -0,0 +1,58 @@
+from websiteanalytics.storage.base import WriteOp
+from websiteanalytics.tracking.writes import coalesce_ops, commit_ops, increment, is_increment
+
+
+def test_coalesce_sums_increments_on_one_document():
+    ops = coalesce_ops([
+        WriteOp("analytics", "s1", {"pages": {"home": {"v": increment()}}, "updated_at": 1}, True),
+        WriteOp("analytics", "s1", {"pages": {"home": {"v": increment(2)}, "shop": {"v": increment()}}, "updated_at": 2}, True),
+    ])
+    assert len(ops) == 1
+    data = ops[0].data
+    assert is_increment(data["pages"]["home"]["v"]) and data["pages"]["home"]["v"].value == 3
+    assert data["pages"]["shop"]["v"].value == 1
+    assert data["updated_at"] == 2
+    assert ops[0].merge
+
+
+def test_coalesce_keeps_first_seen_order():
+    ops = coalesce_ops([
+        WriteOp("analytics", "s2", {"a": 1}, True),
+        WriteOp("analytics", "s1", {"a": 1}, True),
+        WriteOp("analytics", "s2", {"b": 1}, True),
+        WriteOp("analytics_rollups", "s2", {"a": 1}, True),
+    ])
+    assert [(op.collection, op.doc_id) for op in ops] == [
+        ("analytics", "s2"), ("analytics", "s1"), ("analytics_rollups", "s2"),
+    ]
+    assert ops[0].data == {"a": 1, "b": 1}
+
+
+def test_coalesce_replacing_write_drops_earlier_ones():
+    ops = coalesce_ops([
+        WriteOp("analytics", "s1", {"visits": increment()}, True),
+        WriteOp("analytics", "s1", {"login_time": 5}, False),
+        WriteOp("analytics", "s1", {"visits": increment()}, True),
+    ])
+    assert len(ops) == 1
+    assert not ops[0].merge
+    assert ops[0].data["login_time"] == 5
+    assert ops[0].data["visits"].value == 1
+
+
+def test_coalesce_does_not_modify_its_input():
+    first = WriteOp("analytics", "s1", {"pages": {"home": {"v": increment()}}}, True)
+    second = WriteOp("analytics", "s1", {"pages": {"home": {"v": increment()}}}, True)
+    coalesce_ops([first, second])
+    assert first.data["pages"]["home"]["v"].value == 1
+    assert second.data["pages"]["home"]["v"].value == 1
+
+
+def test_coalesced_writes_apply_like_the_originals(memory_storage):
+    ops = [
+        WriteOp("analytics", "s1", {"pages": {"home": {"v": increment(), "t": increment(0.5)}}}, True),
+        WriteOp("analytics", "s1", {"pages": {"home": {"v": increment(), "t": increment(1.0)}}}, True),
+    ]
+    commit_ops(coalesce_ops(ops))
+    assert memory_storage.get("analytics", "s1") == {"pages": {"home": {"v": 2, "t": 1.5}}}
+
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.storage.backend import storage
+
+log = get_logger(__name__)
+
+# The listener is restarted from the newest updated_at seen this often, so the
+# set of documents it watches does not keep growing
+RELISTEN_SECONDS = 600
+
+
+class ChangeFeed:
+    """Process-wide change feed for the `analytics` collection.
+
+    One storage listener (a snapshot listener on Firestore) is shared by
+    every connected dashboard. It watches documents whose `updated_at`
+    moves past the time the listener started, so it never replays history,
+    and every RELISTEN_SECONDS it is replaced by one starting from the
+    newest `updated_at` seen. Each batch of changes is passed
+    to the registered handlers once, then to the asyncio queue of every
+    subscriber, as `(changed, removed)` where `changed` maps session id to
+    document data and `removed` lists ids.
+    """
+
+    def __init__(self, collection="analytics"):
+        self.collection = collection
+        self._subscribers = []
+        self._handlers = []
+        self._watch = None
+        self._timer = None
+        # Newest updated_at the listener has delivered
+        self._cursor = 0
+        self._lock = threading.Lock()
+
+    def add_handler(self, handler):
+        """Call `handler(changed, removed)` on the listener thread for every batch"""
+        self._handlers.append(handler)
+
+    def subscribe(self):
+        """Register the running event loop and return its change queue"""
+        changes = asyncio.Queue()
+        with self._lock:
+            self._subscribers.append((asyncio.get_running_loop(), changes))
+            if self._watch is None:
+                self._cursor = time.time()
+                self._listen()
+                log.info("🔔 Started analytics change feed")
+        return changes
+
+    def unsubscribe(self, changes):
+        with self._lock:
+            self._subscribers = [(loop, queue) for loop, queue in self._subscribers if queue is not changes]
+            if not self._subscribers and self._watch is not None:
+                self._timer.cancel()
+                self._watch.unsubscribe()
+                self._watch = None
+                log.info("🔕 Stopped analytics change feed")
+
+    def _listen(self):
+        # Called with the lock held
+        self._watch = storage.listen(self.collection, "updated_at", self._cursor, self._on_changes)
+        self._timer = threading.Timer(RELISTEN_SECONDS, self._relisten)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _relisten(self):
+        """Replace the listener with one starting from the newest updated_at seen"""
+        with self._lock:
+            if self._watch is None:
+                return
+            previous = self._watch
+            self._timer.cancel()
+            self._listen()
+        previous.unsubscribe()
+        log.debug("🔔 Restarted analytics change feed from %s", self._cursor)
+
+    def _on_changes(self, changed, removed):
+        with self._lock:
+            self._cursor = max([self._cursor] + [data.get("updated_at") or 0 for data in changed.values()])
+
+        for handler in self._handlers:
+            try:
+                handler(changed, removed)
+            except Exception:
+                log.exception("❌ Error handling analytics changes")
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (changed, removed))
+            except RuntimeError:
+                # The subscriber's loop is closed, it will unsubscribe itself
+                pass
+
+
+change_feed = ChangeFeed()
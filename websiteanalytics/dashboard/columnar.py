@@ -0,0 +1,318 @@
+import copy
+import itertools
+import math
+import threading
+
+import numpy as np
+
+from websiteanalytics.tracking.sketches import DURATION_EDGES, QUANTILES
+
+# Normal quantile for a two-sided 95% confidence interval
+Z_95 = 1.96
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _Dictionary:
+    """Dictionary encoding: maps each distinct string to a small integer code.
+
+    A trigram inverted index over the lowercased values answers substring
+    filters without scanning every value. Codes are never reused, so one
+    dictionary is carried from snapshot to snapshot and only values that
+    a delta merge introduces are encoded and indexed.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+        self._lowered = []
+        # trigram -> codes of the values containing it
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(value)
+                if code is None:
+                    code = len(self.values)
+                    lowered = value.lower()
+                    for trigram in trigrams(lowered):
+                        self._postings.setdefault(trigram, set()).add(code)
+                    self.values.append(value)
+                    self._lowered.append(lowered)
+                    self.codes[value] = code
+        return code
+
+    def _candidates(self, substring):
+        """Codes that may contain `substring`, or None when it is too short to index"""
+        if len(substring) < 3:
+            return None
+        postings = sorted(
+            (self._postings.get(trigram, set()) for trigram in trigrams(substring)), key=len
+        )
+        return set(postings[0]).intersection(*postings[1:])
+
+    def matching(self, substring):
+        """Boolean lookup table of the codes whose value contains `substring`"""
+        substring = substring.lower()
+        with self._lock:
+            table = np.zeros(len(self.values), dtype=bool)
+            candidates = self._candidates(substring)
+            if candidates is None:
+                candidates = range(len(self.values))
+            for code in candidates:
+                if substring in self._lowered[code]:
+                    table[code] = True
+        return table
+
+
+class SessionColumns:
+    """Parsed sessions stored column-wise for vectorized filtering and aggregation.
+
+    Session-level fields are NumPy arrays with one row per session, and
+    `sessions` holds the parsed session of each row. Pages are exploded
+    into a second set of arrays with one row per (session, page), linked
+    back through `page_session`. User emails and page names are
+    dictionary-encoded, so filters test each distinct string at most once
+    and aggregations are `bincount`s over the codes. Codes may belong to
+    values no longer present in these sessions; they simply never match a
+    row.
+
+    A delta merge patches a copy instead of rebuilding: changed sessions
+    are appended and the rows they replace are marked dead in `live`.
+    Every mask leaves dead rows out.
+    """
+
+    def __init__(self, sessions, users=None, pages=None):
+        self.users = users if users is not None else _Dictionary()
+        self.pages = pages if pages is not None else _Dictionary()
+        self.sessions = list(sessions)
+        (self.login_time, self.total_minutes, self.ended, self.user_code,
+         self.page_session, self.page_code, self.page_visits, self.page_minutes) = self._encode(self.sessions, 0)
+        self.live = np.ones(len(self.sessions), dtype=bool)
+        # session id -> its live row
+        self.row_of = {session["session_id"]: row for row, session in enumerate(self.sessions)}
+        # Rows are in the snapshot's newest-first order until a patch appends to them
+        self.ordered = True
+
+    def _encode(self, sessions, first_row):
+        """Column arrays for `sessions`, numbered from `first_row`"""
+        count = len(sessions)
+        login_time = np.zeros(count, dtype=np.float64)
+        total_minutes = np.zeros(count, dtype=np.float64)
+        ended = np.zeros(count, dtype=bool)
+        user_code = np.zeros(count, dtype=np.int32)
+
+        page_session = []
+        page_code = []
+        page_visits = []
+        page_minutes = []
+        for row, session in enumerate(sessions):
+            login_time[row] = session["login_time"] or 0
+            total = session["total_session_time"]
+            total_minutes[row] = total if isinstance(total, (int, float)) else 0
+            ended[row] = session["ended"]
+            user_code[row] = self.users.encode(session["user_email"])
+            for page_name, page_data in session["pages"].items():
+                if not isinstance(page_data, dict):
+                    continue
+                page_session.append(first_row + row)
+                page_code.append(self.pages.encode(page_name))
+                page_visits.append(page_data.get("visits", 0))
+                page_minutes.append(page_data.get("time_spent_minutes", 0))
+
+        return (
+            login_time, total_minutes, ended, user_code,
+            np.array(page_session, dtype=np.int64),
+            np.array(page_code, dtype=np.int32),
+            np.array(page_visits, dtype=np.float64),
+            np.array(page_minutes, dtype=np.float64),
+        )
+
+    def patched(self, changed, removed=()):
+        """Copy with the rows of `removed` ids dead and the parsed `changed` sessions appended"""
+        patched = copy.copy(self)
+        live = self.live.copy()
+        row_of = dict(self.row_of)
+        for session_id in itertools.chain(removed, (session["session_id"] for session in changed)):
+            row = row_of.pop(session_id, None)
+            if row is not None:
+                live[row] = False
+
+        first_row = len(self)
+        arrays = self._encode(changed, first_row)
+        for name, added in zip(
+            ("login_time", "total_minutes", "ended", "user_code", "page_session", "page_code", "page_visits", "page_minutes"),
+            arrays,
+        ):
+            setattr(patched, name, np.concatenate([getattr(self, name), added]))
+        patched.live = np.concatenate([live, np.ones(len(changed), dtype=bool)])
+        patched.sessions = self.sessions + list(changed)
+        for offset, session in enumerate(changed):
+            row_of[session["session_id"]] = first_row + offset
+        patched.row_of = row_of
+        patched.ordered = self.ordered and not changed
+        return patched
+
+    def dead_rows(self):
+        return len(self) - len(self.row_of)
+
+    def __len__(self):
+        return len(self.user_code)
+
+    def ordered_rows(self, mask):
+        """Row numbers of the mask, newest login first"""
+        rows = np.flatnonzero(mask)
+        if self.ordered:
+            return rows
+        return rows[np.argsort(-self.login_time[rows], kind="stable")]
+
+    def time_mask(self, start=None, end=None):
+        """Live rows with a login_time in [start, end); None leaves that side open"""
+        mask = self.live.copy()
+        if start is not None:
+            mask &= self.login_time >= start
+        if end is not None:
+            mask &= self.login_time < end
+        return mask
+
+    def filter_mask(self, filter_user="", filter_page="", start=None, end=None):
+        """Rows in the time window whose user email and any page name contain the filter substrings"""
+        mask = self.time_mask(start, end)
+        if filter_user.strip():
+            mask &= self.users.matching(filter_user.strip())[self.user_code]
+        if filter_page.strip():
+            page_hits = self.pages.matching(filter_page.strip())[self.page_code]
+            has_page = np.zeros(len(self), dtype=bool)
+            has_page[self.page_session[page_hits]] = True
+            mask &= has_page
+        return mask
+
+    def count_user(self, user_email, mask=None):
+        code = self.users.codes.get(user_email)
+        if code is None:
+            return 0
+        rows = self.user_code == code
+        return int(np.count_nonzero(rows & (mask if mask is not None else self.live)))
+
+    def totals(self, mask):
+        """Totals of the masked rows, shaped like merged rollup totals plus unique visitors per page"""
+        user_code = self.user_code[mask]
+        session_counts = np.bincount(user_code, minlength=len(self.users.values))
+        session_minutes = np.bincount(user_code, weights=self.total_minutes[mask], minlength=len(self.users.values))
+
+        page_rows = mask[self.page_session]
+        page_code = self.page_code[page_rows]
+        visits = np.bincount(page_code, weights=self.page_visits[page_rows], minlength=len(self.pages.values))
+        minutes = np.bincount(page_code, weights=self.page_minutes[page_rows], minlength=len(self.pages.values))
+        present = np.bincount(page_code, minlength=len(self.pages.values)) > 0
+        # Distinct (page, user) pairs give each page's unique visitors
+        user_count = max(len(self.users.values), 1)
+        pairs = np.unique(page_code.astype(np.int64) * user_count + self.user_code[self.page_session[page_rows]])
+        visitors = np.bincount(pairs // user_count, minlength=len(self.pages.values))
+
+        anonymous = self.users.codes.get("anonymous")
+        return {
+            "sessions": int(mask.sum()),
+            "anonymous_sessions": int(session_counts[anonymous]) if anonymous is not None else 0,
+            "total_time_minutes": float(self.total_minutes[mask].sum()),
+            "pages": {
+                self.pages.values[code]: {
+                    "visits": int(visits[code]),
+                    "time_minutes": float(minutes[code]),
+                    "visitors": int(visitors[code]),
+                }
+                for code in np.flatnonzero(present)
+            },
+            "users": {
+                self.users.values[code]: {"sessions": int(session_counts[code]), "time_minutes": float(session_minutes[code])}
+                for code in np.flatnonzero(session_counts)
+            },
+        }
+
+    def estimated_totals(self, mask, rate):
+        """Totals of the masked rows of a sample, scaled up to every session, and their 95% margins.
+
+        The rows are a Bernoulli sample taking each session with probability
+        `rate`, so sums are scaled by 1 / rate and a scaled sum of y has
+        variance (1 - rate) / rate² · Σ y² over the sampled rows. Returns
+        (totals, margins); totals are shaped like totals(), margins hold the
+        half-width of the interval for sessions, avg_session_time, and each
+        page's visits and time_minutes and each user's sessions. Distinct
+        counts (users, page visitors) do not scale and stay those of the sample.
+        """
+        totals = self.totals(mask)
+        spread = (1 - rate) / rate ** 2
+
+        def margin(sum_of_squares):
+            return round(Z_95 * math.sqrt(spread * sum_of_squares), 2)
+
+        minutes = self.total_minutes[mask]
+        sessions = len(minutes)
+        average = minutes.mean() if sessions else 0.0
+        # Ratio estimator: the 1 / rate scale cancels, leaving the spread around the mean
+        average_margin = Z_95 * math.sqrt((1 - rate) * ((minutes - average) ** 2).sum()) / sessions if sessions else 0.0
+
+        page_rows = mask[self.page_session]
+        page_code = self.page_code[page_rows]
+        visits_squared = np.bincount(page_code, weights=self.page_visits[page_rows] ** 2, minlength=len(self.pages.values))
+        minutes_squared = np.bincount(page_code, weights=self.page_minutes[page_rows] ** 2, minlength=len(self.pages.values))
+
+        margins = {
+            "sessions": margin(sessions),
+            "avg_session_time": round(average_margin, 2),
+            "pages": {
+                page_name: {
+                    "visits": margin(visits_squared[self.pages.codes[page_name]]),
+                    "time_minutes": margin(minutes_squared[self.pages.codes[page_name]]),
+                }
+                for page_name in totals["pages"]
+            },
+            # One session per row, so Σ y² is the sampled session count
+            "users": {user: {"sessions": margin(counters["sessions"])} for user, counters in totals["users"].items()},
+        }
+
+        for field in ("sessions", "anonymous_sessions"):
+            totals[field] = round(totals[field] / rate)
+        totals["total_time_minutes"] /= rate
+        for counters in totals["pages"].values():
+            counters["visits"] = round(counters["visits"] / rate)
+            counters["time_minutes"] /= rate
+        for counters in totals["users"].values():
+            counters["sessions"] = round(counters["sessions"] / rate)
+            counters["time_minutes"] /= rate
+        return totals, margins
+
+    def durations(self, mask, rate=1.0):
+        """Exact duration quantiles and histograms of the masked rows, shaped like the sketched ones.
+
+        Like the sketches, only ended sessions count, each with its recorded
+        duration, and pages with the time spent on them within each such
+        session. Bins take their upper edge. For a sample at `rate` the
+        quantiles stand as they are and the histogram counts are scaled by
+        1 / rate.
+        """
+        def summary(values):
+            summary = {name: round(float(np.quantile(values, q)), 2) if len(values) else 0.0 for name, q in QUANTILES}
+            bins = np.searchsorted(DURATION_EDGES, values, side="left")
+            counts = np.bincount(bins, minlength=len(DURATION_EDGES) + 1)
+            summary["histogram"] = [round(count / rate) for count in counts]
+            return summary
+
+        mask = mask & self.ended
+        minutes = self.total_minutes[mask]
+        page_rows = mask[self.page_session]
+        page_code = self.page_code[page_rows]
+        page_minutes = self.page_minutes[page_rows]
+        spent = page_minutes > 0
+        return {
+            "durations": summary(minutes),
+            "page_durations": {
+                self.pages.values[code]: summary(page_minutes[spent & (page_code == code)])
+                for code in np.unique(page_code[spent])
+            },
+        }
@@ -0,0 +1,280 @@
+import functools
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.dashboard.change_feed import change_feed
+from websiteanalytics.dashboard.query_cache import query_cache
+from websiteanalytics.dashboard.sessions import (
+    ALL,
+    SessionPage,
+    SessionSnapshot,
+    parse_session,
+)
+from websiteanalytics.storage.backend import storage
+from websiteanalytics.tracking.retention import archived_before
+from websiteanalytics.tracking.rollups import DAY, HOUR, bucket_start, load_rollups
+from websiteanalytics.tracking.sketches import load_sketch_totals
+from websiteanalytics.tracking.session_schema import DASHBOARD_FIELDS, is_current, schema_migrated
+
+log = get_logger(__name__)
+
+# Concurrent dashboard refreshes within this window share one read
+SESSIONS_TTL = 2.0
+ROLLUPS_TTL = 5.0
+# How long the schema migration flag is trusted before it is read again
+SCHEMA_TTL = 60.0
+# Sampled snapshots are for views that trade freshness and accuracy for speed
+SAMPLE_TTL = 30.0
+# Sample rates offered by the dashboard's approximate mode
+SAMPLE_RATES = {"1%": 0.01, "5%": 0.05, "10%": 0.1, "25%": 0.25}
+# Delta syncs re-read this much history before the cursor, so documents
+# stamped by a worker with a slightly slow clock are not missed.
+SYNC_OVERLAP_SECONDS = 30
+# Parts a full load is split into, each fetched and parsed on its own thread
+SCAN_PARTITIONS = min(32, (os.cpu_count() or 1) * 4)
+
+# Dashboard time range presets, seconds back from now
+ALL_TIME = "All time"
+CUSTOM_RANGE = "Custom"
+TIME_RANGES = {
+    "Last hour": 3600,
+    "Last 24 hours": 86400,
+    "Last 7 days": 7 * 86400,
+    "Last 30 days": 30 * 86400,
+    "Last 90 days": 90 * 86400,
+}
+# Windows up to this long are totalled from hourly rollups, longer ones from daily
+HOURLY_ROLLUPS_MAX = 3 * 86400
+
+# Login time window [start, end) in epoch seconds, None for an open side, and the
+# rollup granularity that covers it
+TimeWindow = namedtuple("TimeWindow", ["start", "end", "granularity"])
+
+
+def time_window(time_range, start_date="", end_date="", now=None):
+    """The TimeWindow for a dashboard time range selection.
+
+    `time_range` is ALL_TIME, CUSTOM_RANGE or a key of TIME_RANGES. Custom
+    ranges take YYYY-MM-DD dates in UTC, both days included; an empty date
+    leaves that side open. Preset starts are moved back to the start of
+    their rollup bucket, so the session queries and the rollups cover the
+    same window. Raises ValueError for a malformed date.
+    """
+    now = time.time() if now is None else now
+    if time_range in TIME_RANGES:
+        seconds = TIME_RANGES[time_range]
+        granularity = HOUR if seconds <= HOURLY_ROLLUPS_MAX else DAY
+        return TimeWindow(bucket_start(now - seconds, granularity), None, granularity)
+    if time_range == CUSTOM_RANGE:
+        start = end = None
+        if start_date:
+            start = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+        if end_date:
+            end_day = datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+            end = end_day.timestamp()
+        return TimeWindow(start, end, DAY)
+    return TimeWindow(None, None, DAY)
+
+
+def _login_filters(start, end):
+    filters = []
+    if start is not None:
+        filters.append(("login_time", ">=", start))
+    if end is not None:
+        filters.append(("login_time", "<", end))
+    return filters
+
+
+def _session_fields():
+    """Fields to read from session documents: only the dashboard's once every document is on schema v2"""
+    migrated = query_cache.get_or_load(("schema",), lambda previous: schema_migrated(), ttl=SCHEMA_TTL)
+    return DASHBOARD_FIELDS if migrated else None
+
+
+def _archived_ids(snapshot):
+    """Ids of cached sessions the retention job has since moved to the archive"""
+    before = query_cache.get_or_load(("retention",), lambda previous: archived_before(), ttl=SCHEMA_TTL)
+    removed = []
+    if before:
+        # Oldest first; sessions without a login_time sort last and are never archived
+        for session in reversed(snapshot.sessions):
+            if (session["login_time"] or 0) >= before:
+                break
+            if session["login_time"]:
+                removed.append(session["session_id"])
+    return removed
+
+
+def _completed(rows, fields):
+    """Re-read in full the documents a projection may have cut short, those not on schema v2"""
+    if fields is None:
+        return rows
+    return [
+        (session_id, data if is_current(data) else storage.get("analytics", session_id) or data)
+        for session_id, data in rows
+    ]
+
+
+def _scan_partition(partition, fields):
+    """Fetch and parse one part of the collection; returns (parsed sessions, their updated_at)"""
+    index = {}
+    versions = {}
+    for session_id, raw_session_data in _completed(storage.scan(partition, fields), fields):
+        versions[session_id] = raw_session_data.get("updated_at")
+        index[session_id] = parse_session(session_id, raw_session_data)
+    return index, versions
+
+
+def _full_scan(scope):
+    """Every session, read as concurrent partition scans and merged into one snapshot"""
+    partitions = storage.partitions("analytics", SCAN_PARTITIONS)
+    scan = functools.partial(_scan_partition, fields=_session_fields())
+    index = {}
+    versions = {}
+    with ThreadPoolExecutor(max_workers=len(partitions), thread_name_prefix="analytics-scan") as pool:
+        for part_index, part_versions in pool.map(scan, partitions):
+            index.update(part_index)
+            versions.update(part_versions)
+    cursor = max((version or 0 for version in versions.values()), default=0)
+    log.info("🔄 Full sync fetched %d %s sessions in %d partitions", len(index), scope, len(partitions))
+    return SessionSnapshot(scope, index, cursor, versions=versions)
+
+
+def _sync_sessions(scope, previous):
+    """Full load on first use, then only sessions updated past the cursor"""
+    if previous is None:
+        snapshot = _full_scan(scope)
+    else:
+        filters = [("updated_at", ">", previous.cursor - SYNC_OVERLAP_SECONDS)]
+        fields = _session_fields()
+        docs = dict(_completed(storage.find("analytics", filters, fields=fields), fields))
+        removed = _archived_ids(previous)
+        log.info("🔄 Delta sync fetched %d %s sessions, dropped %d archived", len(docs), scope, len(removed))
+        snapshot = previous.merged(docs, removed)
+    if not snapshot.cursor:
+        snapshot.cursor = time.time()
+    return snapshot
+
+
+def load_sessions(scope=ALL):
+    """Shared, delta-synced snapshot of every session"""
+    return query_cache.get_or_load(
+        ("sessions", scope), lambda previous: _sync_sessions(scope, previous), ttl=SESSIONS_TTL
+    )
+
+
+def _sampled(docs, rate):
+    return {session_id: data for session_id, data in docs.items() if data.get("sample_hash", 1.0) < rate}
+
+
+def _sync_sample(rate, previous):
+    """Sessions with a sample_hash below `rate`: one indexed read, then delta syncs"""
+    fields = _session_fields()
+    removed = []
+    if previous is None:
+        previous = SessionSnapshot(f"sample {rate:g}")
+        docs = dict(_completed(storage.find("analytics", [("sample_hash", "<", rate)], fields=fields), fields))
+        kind = "Full"
+    else:
+        # Changes are few, read them all and keep the sampled ones
+        filters = [("updated_at", ">", previous.cursor - SYNC_OVERLAP_SECONDS)]
+        docs = _sampled(dict(_completed(storage.find("analytics", filters, fields=fields), fields)), rate)
+        removed = _archived_ids(previous)
+        kind = "Delta"
+    log.info("🎲 %s sample sync fetched %d sessions at rate %g", kind, len(docs), rate)
+    snapshot = previous.merged(docs, removed)
+    if not snapshot.cursor:
+        snapshot.cursor = time.time()
+    return snapshot
+
+
+def load_sample(rate):
+    """Shared, delta-synced snapshot of a deterministic `rate` sample of the sessions"""
+    return query_cache.get_or_load(("sample", rate), lambda previous: _sync_sample(rate, previous), ttl=SAMPLE_TTL)
+
+
+def load_sampled_rows(filter_user, filter_page, rate, start=None, end=None):
+    """Like load_filtered_rows, on the `rate` sample instead of every session"""
+    snapshot = load_sample(rate)
+    return snapshot, snapshot.columns().filter_mask(filter_user, filter_page, start, end)
+
+
+def load_filtered_rows(filter_user, filter_page, start=None, end=None):
+    """Shared snapshot of every session and the mask of its rows matching the filters and time window"""
+    snapshot = load_sessions(ALL)
+    mask = snapshot.columns().filter_mask(filter_user, filter_page, start, end)
+    log.debug("📊 Filter results: %s sessions from %s total", mask.sum(), len(snapshot.sessions))
+    return snapshot, mask
+
+
+def _fetch_session_page(start_after, page_size, start, end):
+    # One extra document tells whether there is a next page
+    fields = _session_fields()
+    docs = storage.find(
+        "analytics", _login_filters(start, end), order_by="login_time", descending=True,
+        start_after=start_after, limit=page_size + 1, fields=fields,
+    )
+    docs = _completed(docs, fields)
+
+    page_docs = docs[:page_size]
+    sessions = [parse_session(session_id, data) for session_id, data in page_docs]
+    last_login_time = page_docs[-1][1].get("login_time") if page_docs else start_after
+    return SessionPage(sessions, last_login_time, len(docs) > page_size)
+
+
+def load_session_page(start_after, page_size, start=None, end=None):
+    """One page of sessions logged in within [start, end), newest first, starting after the login_time cursor"""
+    return query_cache.get_or_load(
+        ("page", start_after, page_size, start, end),
+        lambda previous: _fetch_session_page(start_after, page_size, start, end),
+        ttl=SESSIONS_TTL,
+    )
+
+
+def count_sessions(start=None, end=None):
+    """Number of sessions logged in within [start, end), from a count aggregation"""
+    return query_cache.get_or_load(
+        ("count", start, end),
+        lambda previous: storage.count("analytics", _login_filters(start, end)),
+        ttl=ROLLUPS_TTL,
+    )
+
+
+def load_rollup_totals(granularity=DAY, start=None, end=None):
+    """Shared merged totals of the rollups in [start, end)"""
+    return query_cache.get_or_load(
+        ("rollups", granularity, start, end),
+        lambda previous: load_rollups(granularity, start, end),
+        ttl=ROLLUPS_TTL,
+    )
+
+
+def load_sketch_summary(granularity=DAY, start=None, end=None):
+    """Shared distinct user counts and duration quantiles, overall and per page, from the sketches in [start, end)"""
+    return query_cache.get_or_load(
+        ("sketches", granularity, start, end),
+        lambda previous: load_sketch_totals(granularity, start, end),
+        ttl=ROLLUPS_TTL,
+    )
+
+
+def apply_changes(changed, removed):
+    """Merge sessions pushed by the change feed into the cached snapshots.
+
+    Cached pages and counts are dropped, they are cheap to read again.
+    """
+    for key in query_cache.keys():
+        if key[0] == "sessions":
+            query_cache.update(key, lambda snapshot: snapshot.merged(changed, removed))
+        elif key[0] == "sample":
+            sampled = _sampled(changed, key[1])
+            query_cache.update(key, lambda snapshot: snapshot.merged(sampled, removed))
+        elif key[0] in ("page", "count"):
+            query_cache.invalidate(key)
+
+
+change_feed.add_handler(apply_changes)
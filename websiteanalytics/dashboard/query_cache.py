@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """A load in progress that other callers for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QueryCache:
+    """Process-wide cache for dashboard reads.
+
+    Entries expire after their TTL and the least recently used entry is
+    evicted once `max_entries` is reached. When several callers miss on
+    the same key at once, only the first one runs the loader; the others
+    wait for its result (single flight).
+
+    Loaders are called with the expired value (or None), so a loader can
+    refresh incrementally instead of reading everything again.
+    """
+
+    def __init__(self, max_entries=64, default_ttl=2.0):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            previous = entry[0] if entry is not None else None
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader(previous)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None:
+                    self._store(key, flight.value)
+                del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+    def update(self, key, update):
+        """Replace a cached value with `update(value)` if the key is cached.
+
+        `update` runs outside the lock; if the entry was replaced meanwhile
+        it is applied again to the new value.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                return
+            value = update(entry[0])
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._store(key, value)
+                    return
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+query_cache = QueryCache()
@@ -0,0 +1,186 @@
+import bisect
+import dataclasses
+from collections import namedtuple
+
+from websiteanalytics.logs import get_sampled_logger
+from websiteanalytics.tracking.session_schema import read_session
+
+doc_log = get_sampled_logger(__name__)
+
+ALL = "all"
+
+# One page of the session list; `last_login_time` is the cursor for the next page
+SessionPage = namedtuple("SessionPage", ["sessions", "last_login_time", "has_next"])
+
+
+@dataclasses.dataclass
+class PageRecord:
+    """One page of a session as shown on the dashboard"""
+
+    name: str = ""
+    visits: int = 0
+    minutes: float = 0
+    # Epoch seconds, 0 when unknown
+    entry_ts: int = 0
+    exit_ts: int = 0
+    highlighted: bool = False
+
+
+@dataclasses.dataclass
+class SessionRecord:
+    """Compact session record synced to the dashboard; formatting happens in the component"""
+
+    session_id: str = ""
+    user_email: str = ""
+    login_ts: int = 0
+    total_minutes: float = 0
+    page_count: int = 0
+    total_visits: int = 0
+    pages: list[PageRecord] = dataclasses.field(default_factory=list)
+
+
+def _epoch(timestamp):
+    return int(timestamp) if isinstance(timestamp, (int, float)) else 0
+
+
+def session_record(session_info, filter_page=""):
+    """Build the SessionRecord for a parsed session, pages in visiting order"""
+    filter_page = filter_page.strip().lower()
+    pages = []
+    for page_name, page_data in sorted(
+        session_info["pages"].items(),
+        key=lambda item: item[1].get("entry_time", 0) if isinstance(item[1], dict) else 0,
+    ):
+        if not isinstance(page_data, dict):
+            continue
+        pages.append(PageRecord(
+            name=page_name,
+            visits=page_data.get("visits", 0),
+            minutes=page_data.get("time_spent_minutes", page_data.get("time_spent", 0)),
+            entry_ts=_epoch(page_data.get("entry_time", 0)),
+            exit_ts=_epoch(page_data.get("exit_time", 0)),
+            highlighted=bool(filter_page) and filter_page in page_name.lower(),
+        ))
+
+    return SessionRecord(
+        session_id=session_info["session_id"],
+        user_email=session_info["user_email"],
+        login_ts=_epoch(session_info["login_time"]),
+        total_minutes=session_info["total_session_time"],
+        page_count=len(pages),
+        total_visits=sum(page.visits for page in pages),
+        pages=pages,
+    )
+
+
+def parse_session(session_id, raw_session_data):
+    """Turn a raw session document, of either schema version, into the dict the dashboard works with"""
+    session = read_session(raw_session_data)
+    pages_data = session["pages"]
+    doc_log.debug("📋 Session %s: raw keys %s, pages %s", session_id, raw_session_data.keys(), pages_data)
+
+    # A session has ended once its SESSION_END recorded a total; until then it is estimated from its pages
+    ended = session["total_minutes"] is not None
+    total_session_time = session["total_minutes"] or 0
+    if not ended and pages_data:
+        total_session_time = round(sum(page["time_spent_minutes"] for page in pages_data.values()), 2)
+        doc_log.debug("📊 Session %s: total time from pages %s min", session_id, total_session_time)
+
+    return {
+        "session_id": session_id,
+        "user_email": session["user_email"],
+        "login_time": session["login_time"],
+        "total_session_time": total_session_time,
+        "ended": ended,
+        "pages": pages_data,
+    }
+
+
+class SessionSnapshot:
+    """Parsed sessions of one scope, plus the updated_at cursor they are current to.
+
+    Snapshots are shared between dashboards and never modified; merging
+    changes returns a new snapshot.
+    """
+
+    def __init__(self, scope, index=None, cursor=0, dictionaries=None, versions=None, sessions=None):
+        self.scope = scope
+        # session id -> parsed session
+        self.index = index if index is not None else {}
+        self.cursor = cursor
+        # session id -> updated_at of the document it was parsed from
+        self.versions = versions if versions is not None else {}
+        self.sessions = sessions if sessions is not None else self._ordered()
+        self._columns = None
+        # (users, pages) dictionaries inherited from the snapshot this was merged from
+        self._dictionaries = dictionaries
+
+    def columns(self):
+        """Columnar copy of the sessions, built on first use and shared.
+
+        A snapshot merged from one whose columns were built gets them
+        patched instead; once over a quarter of the rows are dead they are
+        rebuilt compact.
+        """
+        if self._columns is not None and self._columns.dead_rows() * 4 > len(self._columns):
+            self._columns = None
+        if self._columns is None:
+            from websiteanalytics.dashboard.columnar import SessionColumns
+
+            self._columns = SessionColumns(self.sessions, *(self._dictionaries or ()))
+            self._dictionaries = (self._columns.users, self._columns.pages)
+        return self._columns
+
+    def _ordered(self):
+        return sorted(self.index.values(), key=lambda session: session["login_time"] or 0, reverse=True)
+
+    def _position(self, session_id):
+        """Index of a held session in `sessions`"""
+        session = self.index[session_id]
+        position = bisect.bisect_left(self.sessions, _newest_first(session), key=_newest_first)
+        while self.sessions[position] is not session:
+            position += 1
+        return position
+
+    def merged(self, docs, removed=()):
+        """New snapshot with raw session documents merged in and `removed` ids dropped.
+
+        Documents whose updated_at matches the version already held are
+        skipped, and with nothing left to apply the snapshot itself is
+        returned. Changed sessions are placed into the existing order
+        instead of sorting every session again.
+        """
+        changed = {
+            session_id: raw_session_data
+            for session_id, raw_session_data in docs.items()
+            if session_id not in self.index or self.versions.get(session_id) != raw_session_data.get("updated_at")
+        }
+        removed = [session_id for session_id in removed if session_id in self.index and session_id not in changed]
+        if not changed and not removed:
+            return self
+
+        index = dict(self.index)
+        versions = dict(self.versions)
+        cursor = self.cursor
+        for session_id in removed:
+            del index[session_id]
+            versions.pop(session_id, None)
+        replaced = set(removed).union(session_id for session_id in changed if session_id in index)
+        sessions = list(self.sessions)
+        for position in sorted((self._position(session_id) for session_id in replaced), reverse=True):
+            del sessions[position]
+        parsed = []
+        for session_id, raw_session_data in changed.items():
+            cursor = max(cursor, raw_session_data.get("updated_at", 0))
+            versions[session_id] = raw_session_data.get("updated_at")
+            index[session_id] = parse_session(session_id, raw_session_data)
+            parsed.append(index[session_id])
+            bisect.insort(sessions, index[session_id], key=_newest_first)
+        snapshot = SessionSnapshot(self.scope, index, cursor, self._dictionaries, versions, sessions)
+        if self._columns is not None:
+            snapshot._columns = self._columns.patched(parsed, removed)
+        return snapshot
+
+
+def _newest_first(session):
+    return -(session["login_time"] or 0)
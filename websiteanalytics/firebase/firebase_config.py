@@ -1,11 +1,67 @@
+import os
+import threading
+
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
+
+# Path to the service account key, defaults to serviceAccountKey.json next to this file
+CREDENTIALS_ENV = "FIREBASE_CREDENTIALS"
+DEFAULT_CREDENTIALS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serviceAccountKey.json")
+
+_client = None
+_async_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def _forget_client():
+    # A forked worker must not reuse the parent's gRPC channel; start over
+    global _client, _async_client, _client_pid, _lock
+    _client = None
+    _async_client = None
+    _client_pid = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_client)
+
+
+def _app():
+    """This process's Firebase app; each worker process initializes its own"""
+    name = f"analytics-{os.getpid()}"
+    try:
+        return firebase_admin.get_app(name)
+    except ValueError:
+        cred = credentials.Certificate(os.environ.get(CREDENTIALS_ENV, DEFAULT_CREDENTIALS))
+        return firebase_admin.initialize_app(cred, name=name)
+
+
+def _ensure_clients():
+    global _client, _async_client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            app = _app()
+            _client = firestore.client(app)
+            _async_client = firestore_async.client(app)
+            _client_pid = os.getpid()
+
+
+def get_db():
+    """Firestore client for this process, created on first use"""
+    if _client is None or _client_pid != os.getpid():
+        _ensure_clients()
+    return _client
+
 
-# Replace this path with the actual path to your JSON file
-cred = credentials.Certificate("websiteanalytics/firebase/serviceAccountKey.json")
+def get_async_db():
+    """asyncio Firestore client for this process, for use from the Reflex event loop"""
+    if _async_client is None or _client_pid != os.getpid():
+        _ensure_clients()
+    return _async_client
 
-# Initialize Firebase app
-firebase_admin.initialize_app(cred)
 
-# Firestore client
-db = firestore.client()
+def __getattr__(name):
+    # `from ...firebase_config import db` still works, it initializes on first import of `db`
+    if name == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
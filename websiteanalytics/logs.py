@@ -0,0 +1,79 @@
+import logging
+import os
+import random
+
+# Levels, e.g. "warning" or "info,dashboard.sessions=debug,tracking=warning".
+# A bare level applies to the whole app; `module=level` entries override it
+# for one module or package, named relative to `websiteanalytics`.
+LOG_ENV = "ANALYTICS_LOG"
+# Fraction of per-document debug lines that are kept
+SAMPLE_ENV = "ANALYTICS_LOG_SAMPLE"
+
+ROOT = "websiteanalytics"
+DEFAULT_LEVEL = logging.INFO
+DEFAULT_SAMPLE_RATE = 0.01
+
+
+class SampleFilter(logging.Filter):
+    """Keep about `rate` of the debug records and every record above debug.
+
+    Runs after the level check and before any formatting, so dropped
+    records never have their message built.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+def _parse_levels(spec):
+    levels = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, level = entry.rpartition("=")
+        level = logging.getLevelName(level.strip().upper())
+        if isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+
+def configure(spec=None):
+    """Attach the app's handler and apply the levels from `spec` or ANALYTICS_LOG"""
+    root = logging.getLogger(ROOT)
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        root.addHandler(handler)
+        root.propagate = False
+
+    levels = _parse_levels(spec if spec is not None else os.environ.get(LOG_ENV, ""))
+    root.setLevel(levels.pop("", DEFAULT_LEVEL))
+    for name, level in levels.items():
+        logging.getLogger(f"{ROOT}.{name}").setLevel(level)
+
+
+def get_logger(name):
+    """Logger for a module; pass `__name__`"""
+    return logging.getLogger(name)
+
+
+def get_sampled_logger(name, rate=None):
+    """Child logger for per-document debug lines, keeping only a sample of them.
+
+    It inherits its module's level, so switching the module off also
+    silences it; `<module>.documents=debug` enables it on its own.
+    """
+    logger = logging.getLogger(f"{name}.documents")
+    if not logger.filters:
+        if rate is None:
+            rate = float(os.environ.get(SAMPLE_ENV, DEFAULT_SAMPLE_RATE))
+        logger.addFilter(SampleFilter(rate))
+    return logger
+
+
+configure()
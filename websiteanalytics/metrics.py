@@ -0,0 +1,105 @@
+import os
+import random
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from reflex.middleware import Middleware
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+registry = CollectorRegistry()
+
+# Events whose handler raised never reach postprocess; forget their start times past this
+MAX_PENDING_EVENTS = 10000
+# Fraction of state updates whose serialized size is measured; serializing is
+# as costly as the emit itself, so only a sample pays for it twice
+PAYLOAD_SAMPLE_ENV = "ANALYTICS_PAYLOAD_SAMPLE"
+DEFAULT_PAYLOAD_SAMPLE_RATE = 0.05
+
+_BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HANDLER_SECONDS = Histogram(
+    "analytics_handler_seconds", "Event handler latency, from receiving the event to its final update",
+    ["state", "handler"], registry=registry,
+)
+STATE_PAYLOAD_BYTES = Histogram(
+    "analytics_state_payload_bytes", "Serialized state delta sent to the browser per event, for a sample of the events",
+    ["state", "handler"], buckets=_BYTES_BUCKETS, registry=registry,
+)
+STORAGE_SECONDS = Histogram(
+    "analytics_storage_seconds", "Datastore call latency",
+    ["backend", "operation"], registry=registry,
+)
+STORAGE_ERRORS = Counter(
+    "analytics_storage_errors_total", "Datastore calls that raised",
+    ["backend", "operation"], registry=registry,
+)
+DOCUMENTS_READ = Counter(
+    "analytics_documents_read_total", "Documents returned by datastore reads",
+    ["backend", "operation"], registry=registry,
+)
+DOCUMENTS_WRITTEN = Counter(
+    "analytics_documents_written_total", "Documents written to the datastore",
+    ["backend", "operation"], registry=registry,
+)
+
+
+def handler_labels(event_name):
+    """(state, handler) for a full event name like `...____analytics_state.load_analytics`"""
+    state, _, handler = event_name.rpartition(".")
+    return state.rpartition("____")[2] or state, handler
+
+
+class MetricsMiddleware(Middleware):
+    """Times every event handler and measures the state delta it sends back.
+
+    Background handlers are not timed: each of their updates is final, so
+    only the first would be. Payload sizes are measured for about
+    `payload_sample_rate` of the updates.
+    """
+
+    def __init__(self, payload_sample_rate=None):
+        if payload_sample_rate is None:
+            payload_sample_rate = float(os.environ.get(PAYLOAD_SAMPLE_ENV, DEFAULT_PAYLOAD_SAMPLE_RATE))
+        self.payload_sample_rate = payload_sample_rate
+        self._started = {}
+        # event name -> whether its handler runs in the background
+        self._background = {}
+
+    def _is_background(self, state, event):
+        background = self._background.get(event.name)
+        if background is None:
+            path, _, name = event.name.rpartition(".")
+            try:
+                handler = type(state).get_class_substate(path).event_handlers[name]
+            except Exception:
+                return False
+            background = self._background[event.name] = handler.is_background
+        return background
+
+    async def preprocess(self, app, state, event):
+        if self._is_background(state, event):
+            return None
+        if len(self._started) >= MAX_PENDING_EVENTS:
+            self._started.clear()
+        self._started[id(event)] = time.perf_counter()
+        return None
+
+    async def postprocess(self, app, state, event, update):
+        labels = handler_labels(event.name)
+        if random.random() < self.payload_sample_rate:
+            STATE_PAYLOAD_BYTES.labels(*labels).observe(len(update.json()))
+        if update.final:
+            started = self._started.pop(id(event), None)
+            if started is not None:
+                HANDLER_SECONDS.labels(*labels).observe(time.perf_counter() - started)
+        return update
+
+
+async def metrics_endpoint(request):
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+# Mounted in front of the Reflex backend through rx.App(api_transformer=...)
+metrics_api = Starlette(routes=[Route("/metrics", metrics_endpoint)])
@@ -1,9 +1,49 @@
 import reflex as rx
+import asyncio
 import hashlib
-from websiteanalytics.firebase.firebase_config import db
+import math
+from websiteanalytics.dashboard.change_feed import change_feed
+from websiteanalytics.dashboard.data import (
+    ALL_TIME,
+    CUSTOM_RANGE,
+    SAMPLE_RATES,
+    TIME_RANGES,
+    TimeWindow,
+    count_sessions,
+    load_filtered_rows,
+    load_rollup_totals,
+    load_sampled_rows,
+    load_session_page,
+    load_sessions,
+    load_sketch_summary,
+    time_window,
+)
+from websiteanalytics.dashboard.sessions import ALL, PageRecord, SessionRecord, session_record
 import time
 from datetime import datetime
 import uuid
+from websiteanalytics.tracking.event_buffer import event_buffer
+from websiteanalytics.tracking.event_log import compactor
+from websiteanalytics.tracking.events import (
+    SESSION_START,
+    PAGE_ENTER,
+    PAGE_EXIT,
+    SESSION_END,
+    make_event,
+)
+from websiteanalytics.storage.backend import storage
+from websiteanalytics.tracking.rollups import DAY
+from websiteanalytics.tracking.sketches import DURATION_EDGES
+from websiteanalytics.logs import get_logger
+
+log = get_logger(__name__)
+
+# Labels of the duration histogram's bins, in minutes
+DURATION_BINS = (
+    [f"≤ {DURATION_EDGES[0]:g}"]
+    + [f"{low:g}–{high:g}" for low, high in zip(DURATION_EDGES, DURATION_EDGES[1:])]
+    + [f"> {DURATION_EDGES[-1]:g}"]
+)
 
 class AnalyticsState(rx.State):
     session_id: str = ""
@@ -11,162 +51,149 @@ class AnalyticsState(rx.State):
     page_start_time: float = 0
     login_time: float = 0
     current_user: str = ""
+    _event_seq: int = 0
+    # page -> minutes spent on it in this session, sent with SESSION_END
+    _page_minutes: dict = {}
+
+    def _push_event(self, event_type: str, user_email: str, **fields):
+        self._event_seq += 1
+        event_buffer.push(make_event(event_type, self.session_id, user_email, seq=self._event_seq, **fields))
+        compactor.ensure_running()
 
     def start_session(self, user_email: str):
-        now = datetime.utcnow()
-        self.session_id = f"{user_email}_{now.strftime('%Y%m%d%H%M%S%f')}"
-        self.login_time = now.timestamp()
+        self.session_id = f"{user_email}_{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}"
+        # utcnow() is naive, so its timestamp() would be read as local time
+        self.login_time = time.time()
         self.current_user = user_email
+        self._event_seq = 0
+        self._page_minutes = {}
 
-        print(f"Starting new session: {self.session_id} for user: {user_email}")
+        log.debug("Starting new session: %s for user: %s", self.session_id, user_email)
 
-        db.collection("analytics").document(self.session_id).set({
-            "user_email": user_email,
-            "login_time": self.login_time,
-            "session_start": self.login_time
-        })
+        self._push_event(SESSION_START, user_email, ts=self.login_time)
     
     def start_page_tracking(self, page_name: str, user_email: str):
         if not self.session_id or self.current_user != user_email:
-            print(f"New user or no session. Starting session for: {user_email}")
+            log.debug("New user or no session. Starting session for: %s", user_email)
             self.start_session(user_email)
             
         if self.current_page and self.page_start_time:
-            print(f"Saving time for previous page: {self.current_page}")
+            log.debug("Saving time for previous page: %s", self.current_page)
             self._save_page_time(user_email)
         
         self.current_page = page_name
         self.page_start_time = time.time()
-        print(f"Starting tracking for page: {page_name}, user: {user_email}")
+        log.debug("Starting tracking for page: %s, user: %s", page_name, user_email)
         self._record_page_visit(page_name, user_email)
 
     def _save_page_time(self, user_email: str):
         if not self.session_id:
-            print("No session_id, cannot save page time")
+            log.debug("No session_id, cannot save page time")
             return
             
         time_spent_seconds = time.time() - self.page_start_time
         time_spent_minutes = round(time_spent_seconds / 60, 2)
         
-        print(f"Saving page time: {self.current_page} = {time_spent_minutes} minutes")
+        log.debug("Saving page time: %s = %s minutes", self.current_page, time_spent_minutes)
+        self._page_minutes = {
+            **self._page_minutes,
+            self.current_page: round(self._page_minutes.get(self.current_page, 0) + time_spent_minutes, 2),
+        }
         
-        try:
-            db.collection("analytics").document(self.session_id).set({
-                f"pages.{self.current_page}.time_spent_minutes": time_spent_minutes,
-                f"pages.{self.current_page}.exit_time": time.time()
-            }, merge=True)
-            print(f"Successfully saved page time for {self.current_page}")
-        except Exception as e:
-            print(f"Error saving page time: {e}")
+        self._push_event(
+            PAGE_EXIT, user_email,
+            page=self.current_page,
+            time_spent_minutes=time_spent_minutes,
+        )
     
     def _record_page_visit(self, page_name: str, user_email: str):
         if not self.session_id:
-            print("No session_id, cannot record page visit")
+            log.debug("No session_id, cannot record page visit")
             return
             
-        try:
-            doc = db.collection("analytics").document(self.session_id).get()
-            current_visits = 0
-            if doc.exists:
-                data = doc.to_dict()
-                current_visits = data.get("pages", {}).get(page_name, {}).get("visits", 0)
-            
-            db.collection("analytics").document(self.session_id).set({
-                f"pages.{page_name}.visits": current_visits + 1,
-                f"pages.{page_name}.entry_time": time.time(),
-                f"pages.{page_name}.page_name": page_name
-            }, merge=True)
-            
-            print(f"Recorded visit for {page_name}, visits: {current_visits + 1}")
-            
-        except Exception as e:
-            print(f"Error recording page visit: {e}")
+        self._push_event(PAGE_ENTER, user_email, page=page_name)
+        
+        log.debug("Recorded visit for %s", page_name)
     
     def end_session(self, user_email: str):
         if not self.session_id:
-            print("No session to end")
+            log.debug("No session to end")
             return
             
-        try:
-            if self.current_page and self.page_start_time:
-                self._save_page_time(user_email)
-            
-            total_time_seconds = time.time() - self.login_time
-            total_time_minutes = round(total_time_seconds / 60, 2)
-            
-            db.collection("analytics").document(self.session_id).set({
-                "logout_time": time.time(),
-                "total_session_time_minutes": total_time_minutes
-            }, merge=True)
-            
-            print(f"Session ended for {user_email}, total time: {total_time_minutes} minutes")
-            
-            self.current_page = ""
-            self.page_start_time = 0
-            self.login_time = 0
-            self.session_id = ""
-            self.current_user = ""
-            
-        except Exception as e:
-            print(f"Error ending session: {e}")
+        if self.current_page and self.page_start_time:
+            self._save_page_time(user_email)
+        
+        total_time_seconds = time.time() - self.login_time
+        total_time_minutes = round(total_time_seconds / 60, 2)
+        
+        self._push_event(
+            SESSION_END, user_email,
+            total_session_time_minutes=total_time_minutes,
+            page_minutes=self._page_minutes,
+        )
+        
+        log.debug("Session ended for %s, total time: %s minutes", user_email, total_time_minutes)
+        
+        self.current_page = ""
+        self.page_start_time = 0
+        self.login_time = 0
+        self.session_id = ""
+        self.current_user = ""
 
     def start_anon_session(self):
         anon_session_id = get_anonymous_session_id()
-        now = datetime.utcnow()
         self.session_id = anon_session_id
-        self.login_time = now.timestamp()
+        self.login_time = time.time()
         self.current_user = "anonymous"
+        self._event_seq = 0
+        self._page_minutes = {}
 
-        print(f"Starting anonymous session: {self.session_id}")
+        log.debug("Starting anonymous session: %s", self.session_id)
 
-        db.collection("analytics").document(self.session_id).set({
-            "user_email": "anonymous",
-            "is_anonymous": True,
-            "login_time": self.login_time,
-            "session_start": self.login_time
-        })
+        self._push_event(
+            SESSION_START, "anonymous",
+            ts=self.login_time,
+            is_anonymous=True,
+        )
 
     def start_anon_page_tracking(self, page_name: str):
         if not self.session_id or self.current_user != "anonymous":
-            print("No anonymous session. Starting new anonymous session.")
+            log.debug("No anonymous session. Starting new anonymous session.")
             self.start_anon_session()
 
         if self.current_page and self.page_start_time:
-            print(f"Saving time for previous page: {self.current_page}")
+            log.debug("Saving time for previous page: %s", self.current_page)
             self._save_page_time("anonymous")
 
         self.current_page = page_name
         self.page_start_time = time.time()
-        print(f"Starting tracking for page: {page_name}, anonymous user")
+        log.debug("Starting tracking for page: %s, anonymous user", page_name)
         self._record_page_visit(page_name, "anonymous")
 
     def end_anon_session(self):
         if not self.session_id:
-            print("No anonymous session to end")
+            log.debug("No anonymous session to end")
             return
 
-        try:
-            if self.current_page and self.page_start_time:
-                self._save_page_time("anonymous")
-
-            total_time_seconds = time.time() - self.login_time
-            total_time_minutes = round(total_time_seconds / 60, 2)
+        if self.current_page and self.page_start_time:
+            self._save_page_time("anonymous")
 
-            db.collection("analytics").document(self.session_id).set({
-                "logout_time": time.time(),
-                "total_session_time_minutes": total_time_minutes
-            }, merge=True)
+        total_time_seconds = time.time() - self.login_time
+        total_time_minutes = round(total_time_seconds / 60, 2)
 
-            print(f"Anonymous session ended, total time: {total_time_minutes} minutes")
+        self._push_event(
+            SESSION_END, "anonymous",
+            total_session_time_minutes=total_time_minutes,
+            page_minutes=self._page_minutes,
+        )
 
-            self.current_page = ""
-            self.page_start_time = 0
-            self.login_time = 0
-            self.session_id = ""
-            self.current_user = ""
+        log.debug("Anonymous session ended, total time: %s minutes", total_time_minutes)
 
-        except Exception as e:
-            print(f"Error ending anonymous session: {e}")
+        self.current_page = ""
+        self.page_start_time = 0
+        self.login_time = 0
+        self.session_id = ""
+        self.current_user = ""
 
 class AdminLoginState(rx.State):
     email: str = ""
@@ -180,18 +207,18 @@ class AdminLoginState(rx.State):
     def set_password(self, password: str):
         self.password = password
 
-    def login(self):
+    async def login(self):
         if not (self.email and self.password):
             self.message = "All fields are required!"
             return
-        user = db.collection("admin").document(self.email).get()
-        if user.exists:
+        user = await storage.aget("admin", self.email)
+        if user is not None:
             hashed_password = hashlib.sha256(self.password.encode()).hexdigest()
-            if user.to_dict().get("password") == hashed_password:
+            if user.get("password") == hashed_password:
                 self.is_authenticated = True
                 self.message = "Login successful"
                 # Load analytics data
-                AnalyticsDashboardState.load_analytics()
+                return AnalyticsDashboardState.load_analytics
             else:
                 self.message = "Invalid password"
         else:
@@ -205,12 +232,103 @@ class AdminLoginState(rx.State):
         self.is_authenticated = False
         # ...other cleanup...
 
+async def _filtered_rows(query):
+    window = query["window"]
+    if query["rate"] is not None:
+        return await asyncio.to_thread(
+            load_sampled_rows, query["filter_user"], query["filter_page"], query["rate"], window.start, window.end,
+        )
+    return await asyncio.to_thread(
+        load_filtered_rows, query["filter_user"], query["filter_page"], window.start, window.end
+    )
+
+
+async def _read_page(query):
+    """The session summaries on the queried page; reads no dashboard state"""
+    window = query["window"]
+    page_size = query["page_size"]
+    last_login_time = None
+    if query["filtered"]:
+        snapshot, mask = await _filtered_rows(query)
+        columns = snapshot.columns()
+        rows = columns.ordered_rows(mask)
+        start = (query["page_number"] - 1) * page_size
+        sessions = [columns.sessions[row] for row in rows[start:start + page_size]]
+        has_next = start + page_size < len(rows)
+        total = len(rows)
+    else:
+        page, total = await asyncio.gather(
+            asyncio.to_thread(load_session_page, query["start_after"], page_size, window.start, window.end),
+            asyncio.to_thread(count_sessions, window.start, window.end),
+        )
+        sessions = page.sessions
+        has_next = page.has_next
+        last_login_time = page.last_login_time
+    return {
+        "records": [session_record(session, query["filter_page"]) for session in sessions],
+        "has_next": has_next,
+        "total": total,
+        "last_login_time": last_login_time,
+    }
+
+
+async def _read_stats(query):
+    """Summary cards and chart totals for the queried view, over its time range"""
+    window = query["window"]
+    rate = query["rate"]
+    if query["filtered"]:
+        snapshot, mask = await _filtered_rows(query)
+        columns = snapshot.columns()
+        in_window = columns.time_mask(window.start, window.end)
+        if rate is not None:
+            return {
+                "total_data_count": round(in_window.sum() / rate),
+                "anonymous_sessions_count": round(columns.count_user("anonymous", in_window) / rate),
+                "totals": columns.estimated_totals(mask, rate),
+                "durations": columns.durations(mask, rate),
+            }
+        return {
+            "total_data_count": int(in_window.sum()),
+            "anonymous_sessions_count": columns.count_user("anonymous", in_window),
+            "totals": (columns.totals(mask),),
+            "durations": columns.durations(mask),
+        }
+    totals, sketches = await asyncio.gather(
+        asyncio.to_thread(load_rollup_totals, window.granularity, window.start, window.end),
+        asyncio.to_thread(load_sketch_summary, window.granularity, window.start, window.end),
+    )
+    # Top users come from the sketches' bounded summary; rollups carry them only for old buckets
+    totals = dict(totals, users=sketches["top_users"] or totals["users"])
+    return {
+        "total_data_count": totals["sessions"],
+        "anonymous_sessions_count": totals["anonymous_sessions"],
+        "totals": (totals, None, sketches),
+        "durations": sketches,
+    }
+
+
+async def _read_view(query):
+    """Everything the queried view shows. The page and the stats are read concurrently"""
+    page, stats = await asyncio.gather(_read_page(query), _read_stats(query))
+    return {"page": page, "stats": stats, "loaded_at": datetime.now().strftime("%H:%M:%S")}
+
+
 class AnalyticsDashboardState(rx.State):
-    all_analytics_data: list = []
-    filtered_analytics_data: list = []
-    session_summaries: list = []
+    # Only the sessions on the current page are synced to the browser
+    session_summaries: list[SessionRecord] = []
     filter_user: str = ""
     filter_page: str = ""
+    # One of ALL_TIME, CUSTOM_RANGE or a TIME_RANGES preset; custom dates are YYYY-MM-DD
+    time_range: str = ALL_TIME
+    range_start: str = ""
+    range_end: str = ""
+    # Approximate mode: filtered views read a sample of the sessions, a SAMPLE_RATES key
+    approximate: bool = False
+    sample_rate: str = "10%"
+    # Whether the cards and charts show estimates, and their 95% margins
+    estimated: bool = False
+    sessions_margin: float = 0
+    avg_time_margin: float = 0
     total_sessions: int = 0
     total_users: int = 0
     avg_session_time: float = 0
@@ -223,220 +341,333 @@ class AnalyticsDashboardState(rx.State):
     page_visits_data: list = []
     user_sessions_data: list = []
     time_spent_data: list = []
+    unique_visitors_data: list = []
+    # Session duration percentiles (minutes), their histogram and per-page time percentiles
+    duration_p50: float = 0
+    duration_p90: float = 0
+    duration_p99: float = 0
+    duration_histogram_data: list = []
+    page_duration_data: list = []
 
     anonymous_sessions_count: int = 0
 
+    page_size: int = 25
+    page_number: int = 1
+    page_count: int = 1
+    has_next_page: bool = False
+
+    # login_time of the last session on each page already shown, newest first
+    _page_cursors: list = []
+    # Bumped each time live updates start; only the watcher holding the latest runs
+    _watch_token: int = 0
+
     def set_filter_user(self, user: str):
-        self.filter_user = user
+        self._set_filters(user, self.filter_page)
 
     def set_filter_page(self, page: str):
+        self._set_filters(self.filter_user, page)
+
+    def _set_filters(self, user, page):
+        # Filtered and default views page differently; a live update between
+        # keystrokes must not read one's page number with the other's cursors
+        was_active = self._filters_active()
+        self.filter_user = user
         self.filter_page = page
+        if self._filters_active() != was_active:
+            self._reset_paging()
+
+    def set_range_start(self, date: str):
+        self.range_start = date
+
+    def set_range_end(self, date: str):
+        self.range_end = date
+
+    async def set_time_range(self, time_range: str):
+        """Switch the time range; a custom range loads when its dates are applied"""
+        self.time_range = time_range
+        if time_range != CUSTOM_RANGE:
+            await self.apply_time_range()
+
+    async def apply_time_range(self):
+        log.info("🗓️ Time range: %s (%s to %s)", self.time_range, self.range_start, self.range_end)
+        self._reset_paging()
+        await self.load_analytics()
+
+    async def set_approximate(self, approximate: bool):
+        self.approximate = approximate
+        log.info("🎲 Approximate mode: %s", 'ON' if approximate else 'OFF')
+        self._reset_paging()
+        await self.load_analytics()
+
+    async def set_sample_rate(self, rate: str):
+        self.sample_rate = rate if rate in SAMPLE_RATES else "10%"
+        if self.approximate:
+            self._reset_paging()
+            await self.load_analytics()
+
+    def _window(self):
+        try:
+            return time_window(self.time_range, self.range_start, self.range_end)
+        except ValueError:
+            log.warning("Ignoring malformed date range %r to %r", self.range_start, self.range_end)
+            return TimeWindow(None, None, DAY)
 
     def toggle_auto_refresh(self):
-        """Toggle auto-refresh on/off and manage JS interval"""
+        """Toggle live updates on/off"""
         self.auto_refresh_enabled = not self.auto_refresh_enabled
-        print(f"Auto-refresh: {'ON' if self.auto_refresh_enabled else 'OFF'}")
+        log.info("Auto-refresh: %s", 'ON' if self.auto_refresh_enabled else 'OFF')
         
         if self.auto_refresh_enabled:
-            return rx.call_script(f"""
-                // Stop any existing interval
-                if (window.analyticsInterval) {{
-                    clearInterval(window.analyticsInterval);
-                }}
-                
-                console.log('🔄 Starting auto-refresh every {self.refresh_interval} seconds');
-                
-                window.analyticsInterval = setInterval(() => {{
-                    console.log('🔄 Auto-refreshing analytics data...');
-                    
-                    // Find the manual refresh button by ID
-                    const refreshBtn = document.getElementById('manual-refresh-btn');
-                    if (refreshBtn) {{
-                        refreshBtn.click();
-                        console.log('✅ Triggered refresh via button click');
-                    }} else {{
-                        console.log('❌ Manual refresh button not found');
-                        // Try to find any button with "Manual Refresh" text as fallback
-                        const buttons = document.querySelectorAll('button');
-                        for (let btn of buttons) {{
-                            if (btn.textContent && btn.textContent.includes('Manual Refresh')) {{
-                                btn.click();
-                                console.log('✅ Triggered refresh via text search');
-                                break;
-                            }}
-                        }}
-                    }}
-                }}, {self.refresh_interval * 1000});
-            """)
-        else:
-            return rx.call_script("""
-                // Stop auto-refresh
-                if (window.analyticsInterval) {
-                    clearInterval(window.analyticsInterval);
-                    window.analyticsInterval = null;
-                    console.log('🛑 Auto-refresh stopped');
-                }
-            """)
+            # A watcher still winding down from an earlier toggle sees the new token and exits
+            self._watch_token += 1
+            return AnalyticsDashboardState.watch_analytics(self._watch_token)
+
+    def stop_live_updates(self):
+        self.auto_refresh_enabled = False
 
     def set_refresh_interval(self, interval: str):
-        """Set refresh interval in seconds"""
+        """Set the minimum time between live updates in seconds"""
         try:
             self.refresh_interval = max(1, int(interval))
-            print(f"Refresh interval set to {self.refresh_interval} seconds")
-            # If auto-refresh is enabled, restart with new interval
-            if self.auto_refresh_enabled:
-                return rx.call_script(f"""
-                    // Restart with new interval
-                    if (window.analyticsInterval) {{
-                        clearInterval(window.analyticsInterval);
-                    }}
-                    
-                    console.log('🔄 Restarting auto-refresh with new interval: {self.refresh_interval} seconds');
-                    
-                    window.analyticsInterval = setInterval(() => {{
-                        console.log('🔄 Auto-refreshing analytics data...');
-                        
-                        const refreshBtn = document.getElementById('manual-refresh-btn');
-                        if (refreshBtn) {{
-                            refreshBtn.click();
-                            console.log('✅ Triggered refresh via button click');
-                        }}
-                    }}, {self.refresh_interval * 1000});
-                """)
+            log.info("Refresh interval set to %s seconds", self.refresh_interval)
         except:
             self.refresh_interval = 5
 
-    def _extract_pages_data(self, raw_data):
-        """Extract pages data from Firebase document - IMPROVED VERSION"""
-        pages_data = {}
-        
-        # Look for any keys that start with 'pages.'
-        for key, value in raw_data.items():
-            if key.startswith('pages.'):
-                # Parse the nested key structure: pages.pagename.property
-                parts = key.split('.')
-                if len(parts) >= 3:
-                    page_name = parts[1]
-                    property_name = parts[2]
-                    
-                    # Initialize page if it doesn't exist
-                    if page_name not in pages_data:
-                        pages_data[page_name] = {}
-                    
-                    # Set the property
-                    pages_data[page_name][property_name] = value
-                    
-        print(f"🔍 Extracted pages data: {pages_data}")
-        return pages_data
-    
-    def load_analytics(self):
-        """Load all analytics data from Firebase - IMPROVED VERSION"""
+    def _watching(self, token):
+        return self.auto_refresh_enabled and self._watch_token == token
+
+    @rx.event(background=True)
+    async def watch_analytics(self, token: int):
+        """Push changed sessions to this dashboard while live updates are on.
+
+        Changes come from the shared snapshot listener, so nothing is read
+        from storage unless a session actually changed. Changes arriving
+        within `refresh_interval` seconds are merged into one update. The
+        view is read without holding the state lock, which is only taken to
+        show it, and dropped if the dashboard moved to another view meanwhile.
+        """
+        changes = change_feed.subscribe()
         try:
-            print("🔍 Loading analytics data...")
-            docs = db.collection("analytics").get()
-            data = []
-            
-            for doc in docs:
-                raw_session_data = doc.to_dict()
-                print(f"📋 Processing session: {doc.id}")
-                print(f"📊 Raw session data keys: {list(raw_session_data.keys())}")
-                
-                pages_data = self._extract_pages_data(raw_session_data)
-                print(f"📄 Extracted pages data: {pages_data}")
-                
-                total_session_time = raw_session_data.get("total_session_time_minutes", raw_session_data.get("total_session_time", 0))
-                
-                if total_session_time == 0 and pages_data:
-                    total_from_pages = 0
-                    for page_name, page_info in pages_data.items():
-                        if isinstance(page_info, dict):
-                            page_time = page_info.get('time_spent_minutes', page_info.get('time_spent', 0))
-                            if isinstance(page_time, (int, float)):
-                                total_from_pages += page_time
-                    total_session_time = round(total_from_pages, 2)
-                    print(f"📊 Calculated total session time from pages: {total_session_time} min")
-                
-                session_info = {
-                    "session_id": doc.id,
-                    "user_email": raw_session_data.get("user_email", "Unknown"),
-                    "login_time": self._format_timestamp(raw_session_data.get("login_time", 0)),
-                    "total_session_time": total_session_time,
-                    "pages": pages_data  
-                }
-                
-                print(f"✅ Processed session info with {len(pages_data)} pages")
-                data.append(session_info)
-            
-            self.all_analytics_data = data
-            self.total_data_count = len(data)
-            self.anonymous_sessions_count = sum(
-                1 for session in data if session.get("user_email") == "anonymous"
-            )
-            print(f"📊 Total sessions loaded: {self.total_data_count}")
-            
-            self._apply_filters()
-            self._prepare_chart_data()  
-            self.last_updated = datetime.now().strftime("%H:%M:%S")
-            print(f"✅ Analytics loaded successfully at {self.last_updated}")
+            while True:
+                async with self:
+                    if not self._watching(token):
+                        break
+                    interval = self.refresh_interval
+
+                try:
+                    changed, removed = await asyncio.wait_for(changes.get(), timeout=interval)
+                except asyncio.TimeoutError:
+                    continue
+
+                # The feed hands the same objects to every dashboard
+                changed, removed = dict(changed), list(removed)
+                await asyncio.sleep(interval)
+                while not changes.empty():
+                    more_changed, more_removed = changes.get_nowait()
+                    changed.update(more_changed)
+                    removed.extend(more_removed)
+
+                async with self:
+                    if not self._watching(token):
+                        break
+                    query = self._view_query()
+                try:
+                    view = await _read_view(query)
+                except Exception:
+                    log.exception("❌ Error loading analytics")
+                    continue
+
+                async with self:
+                    if not self._watching(token):
+                        break
+                    if self._view_query() != query:
+                        continue
+                    self._show_view(query, view)
+                log.info("🔔 Applied %s changed and %s removed sessions at %s", len(changed), len(removed), view["loaded_at"])
+        finally:
+            change_feed.unsubscribe(changes)
+            log.info("🛑 Live updates stopped")
+
+    def _filters_active(self):
+        return bool(self.filter_user.strip() or self.filter_page.strip())
+
+    def _view_query(self):
+        """What the current view reads, so it can be read without the state"""
+        return {
+            "window": self._window(),
+            "filtered": self._filters_active(),
+            "filter_user": self.filter_user,
+            "filter_page": self.filter_page,
+            "rate": SAMPLE_RATES[self.sample_rate] if self.approximate else None,
+            "page_number": self.page_number,
+            "page_size": self.page_size,
+            # No cursor for the page (paging was reset under it): read from the top
+            "start_after": self._page_cursors[self.page_number - 2] if 1 < self.page_number <= len(self._page_cursors) + 1 else None,
+        }
+
+    async def load_analytics(self):
+        """Load analytics data from the datastore.
+
+        Everything covers the selected time range. The default view fetches
+        one page of sessions with an ordered query on login_time bounded by
+        the range and reads its totals from the hourly or daily rollups in
+        it. Filtered views work on the columnar copy of the shared snapshot
+        of every session and page through the matches in memory. Reads go through
+        the process-wide query cache, so dashboards refreshing together
+        share one read. They run on worker threads and concurrently, so a
+        slow read never blocks the event loop serving other visitors.
+        """
+        try:
+            log.debug("🔍 Loading analytics data...")
+            query = self._view_query()
+            self._show_view(query, await _read_view(query))
+            log.info("✅ Analytics loaded successfully at %s", self.last_updated)
             
-        except Exception as e:
-            print(f"❌ Error loading analytics: {e}")
-            import traceback
-            traceback.print_exc()
-            self.all_analytics_data = []
-            self.filtered_analytics_data = []
+        except Exception:
+            log.exception("❌ Error loading analytics")
             self.session_summaries = []
             self.total_data_count = 0
 
-    def _prepare_chart_data(self):
-        """✅ NEW: Prepare data for charts"""
+    def _show_view(self, query, view):
+        self._show_page(query, view["page"])
+        self._show_stats(view["stats"])
+        self.last_updated = view["loaded_at"]
+
+    async def _load_page(self):
+        """Fetch the sessions on the current page and build their summaries"""
+        query = self._view_query()
+        self._show_page(query, await _read_page(query))
+
+    def _show_page(self, query, page):
+        self.session_summaries = page["records"]
+        self.has_next_page = page["has_next"]
+        self.page_count = max(1, math.ceil(page["total"] / self.page_size))
+        if not query["filtered"]:
+            self._page_cursors = self._page_cursors[:self.page_number - 1] + [page["last_login_time"]]
+        log.debug("📄 Showing page %s of %s (%s sessions)", self.page_number, self.page_count, len(page["records"]))
+
+    def _reset_paging(self):
+        self.page_number = 1
+        self._page_cursors = []
+
+    async def next_page(self):
+        if self.has_next_page:
+            self.page_number += 1
+            await self._load_page()
+
+    async def prev_page(self):
+        if self.page_number > 1:
+            self.page_number -= 1
+            await self._load_page()
+
+    async def set_page_size(self, size: str):
         try:
-            print("📊 Preparing chart data...")
-            
-            page_visits = {}
-            total_time_by_page = {}
-            sessions_by_user = {}
-            
-            for session in self.filtered_analytics_data:
-                user_email = session.get("user_email", "Unknown")
-                
-                # Count sessions by user
-                sessions_by_user[user_email] = sessions_by_user.get(user_email, 0) + 1
-                
-                for page_name, page_data in session.get("pages", {}).items():
-                    if isinstance(page_data, dict):
-                        visits = page_data.get("visits", 0)
-                        time_spent = page_data.get("time_spent_minutes", 0)
-                        
-                        page_visits[page_name] = page_visits.get(page_name, 0) + visits
-                        total_time_by_page[page_name] = total_time_by_page.get(page_name, 0) + time_spent
-            
-            self.page_visits_data = [
-                {"name": page, "value": visits, "fill": self._get_color(i)}
-                for i, (page, visits) in enumerate(page_visits.items())
-            ]
-            
-            sorted_users = sorted(sessions_by_user.items(), key=lambda x: x[1], reverse=True)[:10]
-            self.user_sessions_data = [
-                {"name": user.split('@')[0] if '@' in user else user, "value": sessions, "fill": self._get_color(i)}
-                for i, (user, sessions) in enumerate(sorted_users)
-            ]
-            
-            self.time_spent_data = [
-                {"page": page, "time": round(time, 2), "fill": self._get_color(i)}
-                for i, (page, time) in enumerate(total_time_by_page.items())
-            ]
-            
-            print(f"📊 Chart data prepared:")
-            print(f"   Page visits: {len(self.page_visits_data)} items")
-            print(f"   User sessions: {len(self.user_sessions_data)} items")
-            print(f"   Time spent: {len(self.time_spent_data)} items")
-            
-        except Exception as e:
-            print(f"❌ Error preparing chart data: {e}")
-            self.page_visits_data = []
-            self.user_sessions_data = []
-            self.time_spent_data = []
+            self.page_size = max(1, int(size))
+        except:
+            self.page_size = 25
+        self._reset_paging()
+        await self._load_page()
+
+    def _show_stats(self, stats):
+        """Set summary cards and charts from what _read_stats() read"""
+        self.total_data_count = stats["total_data_count"]
+        self.anonymous_sessions_count = stats["anonymous_sessions_count"]
+        self._apply_totals(*stats["totals"])
+        self._apply_durations(stats["durations"])
+
+    def _apply_totals(self, totals, margins=None, uniques=None):
+        """Set summary cards and charts from rollup-shaped totals.
+
+        `margins` are given for estimates. `uniques` holds sketched distinct
+        user counts; without it they are counted from the totals.
+        """
+        self.estimated = margins is not None
+        self.sessions_margin = margins["sessions"] if margins else 0
+        self.avg_time_margin = margins["avg_session_time"] if margins else 0
+        if uniques is None:
+            uniques = {
+                "users": len(totals["users"]),
+                "pages": {page: counters.get("visitors", 0) for page, counters in totals["pages"].items()},
+            }
+        self.total_sessions = totals["sessions"]
+        self.total_users = uniques["users"]
+        self.unique_visitors_data = [
+            {"page": page, "visitors": visitors, "fill": self._get_color(i)}
+            for i, (page, visitors) in enumerate(uniques["pages"].items())
+        ]
+        self.avg_session_time = round(totals["total_time_minutes"] / totals["sessions"], 2) if totals["sessions"] else 0
+
+        page_visits = {page: counters.get("visits", 0) for page, counters in totals["pages"].items()}
+        self.most_visited_page = max(page_visits, key=page_visits.get) if page_visits else "None"
+
+        self._set_chart_data(
+            page_visits,
+            {page: counters.get("time_minutes", 0) for page, counters in totals["pages"].items()},
+            {user: counters.get("sessions", 0) for user, counters in totals["users"].items()},
+            margins,
+        )
+        log.debug("📊 Stats loaded: %s sessions, %s users", self.total_sessions, self.total_users)
+
+    def _apply_durations(self, durations):
+        """Set the duration percentiles and charts from sketched or exact duration summaries"""
+        sessions = durations["durations"]
+        self.duration_p50 = sessions["p50"]
+        self.duration_p90 = sessions["p90"]
+        self.duration_p99 = sessions["p99"]
+        self.duration_histogram_data = [
+            {"range": label, "sessions": count}
+            for label, count in zip(DURATION_BINS, sessions["histogram"])
+        ] if any(sessions["histogram"]) else []
+        self.page_duration_data = [
+            {"page": page, "p50": summary["p50"], "p90": summary["p90"], "p99": summary["p99"]}
+            for page, summary in durations["page_durations"].items()
+        ]
+
+    def _set_chart_data(self, page_visits, total_time_by_page, sessions_by_user, margins=None):
+        """Build the chart series from per-page and per-user totals.
+
+        With `margins` the values are estimates; pie labels carry their
+        95% margin and the bar chart draws it as an error bar.
+        """
+        def label(name, margin):
+            return f"{name} (±{margin:g})" if margins else name
+
+        page_margins = margins["pages"] if margins else {}
+        user_margins = margins["users"] if margins else {}
+
+        self.page_visits_data = [
+            {
+                "name": label(page, page_margins.get(page, {}).get("visits", 0)),
+                "value": visits,
+                "fill": self._get_color(i),
+            }
+            for i, (page, visits) in enumerate(page_visits.items())
+        ]
+        
+        sorted_users = sorted(sessions_by_user.items(), key=lambda x: x[1], reverse=True)[:10]
+        self.user_sessions_data = [
+            {
+                "name": label(user.split('@')[0] if '@' in user else user, user_margins.get(user, {}).get("sessions", 0)),
+                "value": sessions,
+                "fill": self._get_color(i),
+            }
+            for i, (user, sessions) in enumerate(sorted_users)
+        ]
+        
+        self.time_spent_data = [
+            {
+                "page": page,
+                "time": round(time, 2),
+                "margin": page_margins.get(page, {}).get("time_minutes", 0),
+                "fill": self._get_color(i),
+            }
+            for i, (page, time) in enumerate(total_time_by_page.items())
+        ]
+        
+        log.debug(
+            "📊 Chart data prepared: %s page visits, %s user sessions, %s time spent items",
+            len(self.page_visits_data), len(self.user_sessions_data), len(self.time_spent_data),
+        )
     
     def _get_color(self, index):
         """Get color for chart items"""
@@ -447,153 +678,23 @@ class AnalyticsDashboardState(rx.State):
         ]
         return colors[index % len(colors)]
 
-    def _apply_filters(self):
-        """Apply filters to the data - IMPROVED VERSION WITH BETTER FORMATTING"""
-        filtered_data = []
-        summaries = []
-        
-        print(f"🔍 Applying filters to {len(self.all_analytics_data)} sessions...")
-        
-        for session in self.all_analytics_data:
-            session_data = session
-            
-            # Check user filter
-            user_matches = True
-            if self.filter_user and self.filter_user.strip():
-                user_email = session_data.get("user_email", "").lower()
-                filter_user = self.filter_user.lower()
-                user_matches = filter_user in user_email
-                print(f"🔍 User filter: '{self.filter_user}' vs '{session_data.get('user_email')}' = {user_matches}")
-            
-            # Check page filter
-            page_matches = True
-            if self.filter_page and self.filter_page.strip():
-                pages_in_session = session_data.get("pages", {}).keys()
-                filter_page = self.filter_page.lower()
-                page_matches = any(filter_page in page.lower() for page in pages_in_session)
-                print(f"🔍 Page filter: '{self.filter_page}' in {list(pages_in_session)} = {page_matches}")
-            
-            # Include session if both filters match
-            if user_matches and page_matches:
-                filtered_data.append(session_data)
-                
-                pages_data = session_data.get("pages", {})
-                
-                print(f"📄 Processing pages for session {session_data.get('session_id', 'unknown')}")
-                print(f"📄 Pages data: {pages_data}")
-                print(f"📄 Pages count: {len(pages_data)}")
-                
-                if pages_data and len(pages_data) > 0:
-                    page_info_blocks = []
-                    total_pages_visited = len(pages_data)
-                    total_visits = sum(page_data.get('visits', 0) for page_data in pages_data.values() if isinstance(page_data, dict))
-                    
-                    # Sort pages by entry time for chronological order
-                    sorted_pages = sorted(
-                        pages_data.items(),
-                        key=lambda x: x[1].get('entry_time', 0) if isinstance(x[1], dict) else 0
-                    )
-                    
-                    for page_name, page_data in sorted_pages:
-                        print(f"🔹 Processing page: '{page_name}' with data: {page_data}")
-                        
-                        if isinstance(page_data, dict):
-                            time_spent = page_data.get('time_spent_minutes', page_data.get('time_spent', 0))
-                            visits = page_data.get('visits', 0)
-                            entry_time = page_data.get('entry_time', 0)
-                            exit_time = page_data.get('exit_time', 0)
-                            
-                            # Format timestamps
-                            entry_str = self._format_timestamp(entry_time) if entry_time else "N/A"
-                            exit_str = self._format_timestamp(exit_time) if exit_time else "N/A"
-                            
-                            # Create formatted page block
-                            if self.filter_page and self.filter_page.lower() in page_name.lower():
-                                page_block = f"   🎯 {page_name.upper()} (FILTERED):\n      ⏱️ Time: {time_spent} min | 👆 Visits: {visits}\n      📅 Entry: {entry_str}\n      📅 Exit: {exit_str}"
-                            else:
-                                page_block = f"   📄 {page_name.capitalize()}:\n      ⏱️ Time: {time_spent} min | 👆 Visits: {visits}\n      📅 Entry: {entry_str}\n      📅 Exit: {exit_str}"
-                            
-
-                            page_info_blocks.append(page_block)
-                            print(f"   ✅ Added page block for {page_name}")
-                    
-                    pages_summary = f"\n📊 Summary: {total_pages_visited} pages, {total_visits} total visits\n" + "\n".join(page_info_blocks)
-                    
-                else:
-                    pages_summary = "\n❌ No page data available"
-                    print(f"❌ No valid pages data found for session {session_data.get('session_id', 'unknown')}")
-                
-                summary = f"""👤 USER: {session_data.get('user_email', 'N/A')}
-🕐 LOGIN: {session_data.get('login_time', 'N/A')}
-⏱️ TOTAL SESSION TIME: {session_data.get('total_session_time', 0)} minutes
-🔗 SESSION ID: {session_data.get('session_id', 'N/A')}
-
-📋 PAGE ACTIVITY:{pages_summary}
-""".strip()
-                
-                summaries.append(summary)
-                print(f"✅ Created enhanced summary for session {session_data.get('session_id', 'unknown')}")
-        
-        self.filtered_analytics_data = filtered_data
-        self.session_summaries = summaries
-        self._calculate_summary_stats()
-        
-        print(f"📊 Filter results: {len(filtered_data)} sessions from {len(self.all_analytics_data)} total")
-
-    def _format_timestamp(self, timestamp):
-        """Convert timestamp to readable format"""
-        if timestamp:
-            try:
-                return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                return "Invalid time"
-        return "N/A"
-    
-    def _calculate_summary_stats(self):
-        """Calculate summary statistics based on filtered data"""
-        if not self.filtered_analytics_data:
-            self.total_sessions = 0
-            self.total_users = 0
-            self.avg_session_time = 0
-            self.most_visited_page = "None"
-            return
-            
-        self.total_sessions = len(self.filtered_analytics_data)
-        unique_users = set(session.get("user_email", "") for session in self.filtered_analytics_data)
-        self.total_users = len(unique_users)
-        
-        # Calculate average session time from filtered data
-        total_time = sum(session.get("total_session_time", 0) for session in self.filtered_analytics_data if isinstance(session.get("total_session_time"), (int, float)))
-        self.avg_session_time = round(total_time / self.total_sessions, 2) if self.total_sessions > 0 else 0
-        
-        # Find most visited page from filtered data
-        page_visits = {}
-        for session in self.filtered_analytics_data:
-            for page_name, page_data in session.get("pages", {}).items():
-                if isinstance(page_data, dict):
-                    page_visits[page_name] = page_visits.get(page_name, 0) + page_data.get("visits", 0)
-        
-        if page_visits:
-            self.most_visited_page = max(page_visits, key=page_visits.get)
-        else:
-            self.most_visited_page = "None"
-    
-    def apply_filters(self):
+    async def apply_filters(self):
         """Apply user and page filters"""
-        print(f"🔍 Applying filters - User: '{self.filter_user}', Page: '{self.filter_page}'")
-        self._apply_filters()
-        self._prepare_chart_data()  
+        log.info("🔍 Applying filters - User: '%s', Page: '%s'", self.filter_user, self.filter_page)
+        self._reset_paging()
+        await self.load_analytics()
     
-    def clear_filters(self):
+    async def clear_filters(self):
         """Clear all filters"""
         self.filter_user = ""
         self.filter_page = ""
-        print("🧹 Filters cleared")
-        self._apply_filters()
-        self._prepare_chart_data()  
+        log.info("🧹 Filters cleared")
+        self._reset_paging()
+        await self.load_analytics()
 
-    def get_anonymous_sessions(self):
-        return [s for s in self.all_analytics_data if s.get("user_email") == "anonymous"]
+    async def get_anonymous_sessions(self):
+        snapshot = await asyncio.to_thread(load_sessions, ALL)
+        return [s for s in snapshot.sessions if s["user_email"] == "anonymous"]
 
 def analyticalpage():
     return rx.cond(
@@ -633,7 +734,7 @@ def analyticalpage():
                         size="2"
                     )
                 ),
-                rx.text("Refresh every:", font_size="sm"),
+                rx.text("Update at most every:", font_size="sm"),
                 rx.input(
                     placeholder="5",
                     value=AnalyticsDashboardState.refresh_interval,
@@ -665,7 +766,14 @@ def analyticalpage():
                     rx.vstack(
                         rx.text("📊 Filtered Sessions", font_weight="bold", color="#34495e", font_size="sm"),
                         rx.text(AnalyticsDashboardState.total_sessions, font_size="2xl", color="#3498db", font_weight="bold"),
-                        rx.text(f"of {AnalyticsDashboardState.total_data_count} total", font_size="xs", color="#7f8c8d"),
+                        rx.cond(
+                            AnalyticsDashboardState.estimated,
+                            rx.text(
+                                f"± {AnalyticsDashboardState.sessions_margin} (95%) of ~{AnalyticsDashboardState.total_data_count} total",
+                                font_size="xs", color="#7f8c8d"
+                            ),
+                            rx.text(f"of {AnalyticsDashboardState.total_data_count} total", font_size="xs", color="#7f8c8d"),
+                        ),
                         align="center",
                         spacing="1"
                     ),
@@ -680,7 +788,10 @@ def analyticalpage():
                     rx.vstack(
                         rx.text("👥 Unique Users", font_weight="bold", color="#34495e", font_size="sm"),
                         rx.text(AnalyticsDashboardState.total_users, font_size="2xl", color="#e74c3c", font_weight="bold"),
-                        rx.text("distinct users", font_size="xs", color="#7f8c8d"),
+                        rx.text(
+                            rx.cond(AnalyticsDashboardState.estimated, "distinct users in sample", "distinct users"),
+                            font_size="xs", color="#7f8c8d"
+                        ),
                         align="center",
                         spacing="1"
                     ),
@@ -695,7 +806,29 @@ def analyticalpage():
                     rx.vstack(
                         rx.text("⏱️ Avg Session", font_weight="bold", color="#34495e", font_size="sm"),
                         rx.text(f"{AnalyticsDashboardState.avg_session_time}", font_size="2xl", color="#27ae60", font_weight="bold"),
-                        rx.text("minutes", font_size="xs", color="#7f8c8d"),
+                        rx.cond(
+                            AnalyticsDashboardState.estimated,
+                            rx.text(f"± {AnalyticsDashboardState.avg_time_margin} minutes (95%)", font_size="xs", color="#7f8c8d"),
+                            rx.text("minutes", font_size="xs", color="#7f8c8d"),
+                        ),
+                        align="center",
+                        spacing="1"
+                    ),
+                    bg="linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%)",
+                    padding="15px",
+                    border_radius="12px",
+                    width="180px",
+                    border="2px solid #dee2e6",
+                    _hover={"transform": "translateY(-2px)", "box_shadow": "0 4px 12px rgba(0,0,0,0.1)"}
+                ),
+                rx.box(
+                    rx.vstack(
+                        rx.text("📐 Session Length", font_weight="bold", color="#34495e", font_size="sm"),
+                        rx.text(f"{AnalyticsDashboardState.duration_p50}", font_size="2xl", color="#9b59b6", font_weight="bold"),
+                        rx.text(
+                            f"p50 · p90 {AnalyticsDashboardState.duration_p90} · p99 {AnalyticsDashboardState.duration_p99} min",
+                            font_size="xs", color="#7f8c8d"
+                        ),
                         align="center",
                         spacing="1"
                     ),
@@ -809,6 +942,7 @@ def analyticalpage():
                                 AnalyticsDashboardState.time_spent_data,
                                 rx.recharts.bar_chart(
                                     rx.recharts.bar(
+                                        rx.recharts.error_bar(data_key="margin", width=6, stroke="#2c3e50"),
                                         data_key="time",
                                         stroke="#8884d8",
                                         fill="#8884d8"
@@ -834,6 +968,111 @@ def analyticalpage():
                         width="100%",
                         margin_top="20px"
                     ),
+
+                    # Charts Row 3: Unique Visitors Bar Chart
+                    rx.box(
+                        rx.vstack(
+                            rx.heading("👁️ Unique Visitors by Page", size="4", color="#34495e"),
+                            rx.cond(
+                                AnalyticsDashboardState.unique_visitors_data,
+                                rx.recharts.bar_chart(
+                                    rx.recharts.bar(
+                                        data_key="visitors",
+                                        stroke="#82ca9d",
+                                        fill="#82ca9d"
+                                    ),
+                                    rx.recharts.x_axis(data_key="page"),
+                                    rx.recharts.y_axis(),
+                                    rx.recharts.cartesian_grid(stroke_dasharray="3 3"),
+                                    rx.recharts.tooltip(),
+                                    data=AnalyticsDashboardState.unique_visitors_data,
+                                    width="100%",
+                                    height=300
+                                ),
+                                rx.text("No visitor data available", color="#7f8c8d", text_align="center")
+                            ),
+                            align="center",
+                            spacing="3"
+                        ),
+                        bg="white",
+                        padding="20px",
+                        border_radius="15px",
+                        border="2px solid #e9ecef",
+                        box_shadow="0 4px 12px rgba(0,0,0,0.1)",
+                        width="100%",
+                        margin_top="20px"
+                    ),
+
+                    # Charts Row 4: Session Duration Histogram and Page Time Percentiles
+                    rx.hstack(
+                        rx.box(
+                            rx.vstack(
+                                rx.heading("📊 Session Length Distribution", size="4", color="#34495e"),
+                                rx.cond(
+                                    AnalyticsDashboardState.duration_histogram_data,
+                                    rx.recharts.bar_chart(
+                                        rx.recharts.bar(
+                                            data_key="sessions",
+                                            stroke="#9b59b6",
+                                            fill="#9b59b6"
+                                        ),
+                                        rx.recharts.x_axis(data_key="range"),
+                                        rx.recharts.y_axis(),
+                                        rx.recharts.cartesian_grid(stroke_dasharray="3 3"),
+                                        rx.recharts.tooltip(),
+                                        data=AnalyticsDashboardState.duration_histogram_data,
+                                        width="100%",
+                                        height=300
+                                    ),
+                                    rx.text("No session length data available", color="#7f8c8d", text_align="center")
+                                ),
+                                rx.text("minutes per session", font_size="xs", color="#7f8c8d"),
+                                align="center",
+                                spacing="3"
+                            ),
+                            bg="white",
+                            padding="20px",
+                            border_radius="15px",
+                            border="2px solid #e9ecef",
+                            box_shadow="0 4px 12px rgba(0,0,0,0.1)",
+                            width="48%"
+                        ),
+                        rx.box(
+                            rx.vstack(
+                                rx.heading("⏳ Time on Page Percentiles", size="4", color="#34495e"),
+                                rx.cond(
+                                    AnalyticsDashboardState.page_duration_data,
+                                    rx.recharts.bar_chart(
+                                        rx.recharts.bar(data_key="p50", fill="#3498db"),
+                                        rx.recharts.bar(data_key="p90", fill="#f39c12"),
+                                        rx.recharts.bar(data_key="p99", fill="#e74c3c"),
+                                        rx.recharts.x_axis(data_key="page"),
+                                        rx.recharts.y_axis(),
+                                        rx.recharts.cartesian_grid(stroke_dasharray="3 3"),
+                                        rx.recharts.tooltip(),
+                                        rx.recharts.legend(),
+                                        data=AnalyticsDashboardState.page_duration_data,
+                                        width="100%",
+                                        height=300
+                                    ),
+                                    rx.text("No page time data available", color="#7f8c8d", text_align="center")
+                                ),
+                                rx.text("minutes per page per ended session", font_size="xs", color="#7f8c8d"),
+                                align="center",
+                                spacing="3"
+                            ),
+                            bg="white",
+                            padding="20px",
+                            border_radius="15px",
+                            border="2px solid #e9ecef",
+                            box_shadow="0 4px 12px rgba(0,0,0,0.1)",
+                            width="48%"
+                        ),
+                        spacing="4",
+                        justify="between",
+                        width="100%",
+                        margin_top="20px"
+                    ),
                     
                     align="center",
                     spacing="4"
@@ -872,6 +1111,52 @@ def analyticalpage():
                         ),
                         spacing="6"
                     ),
+                    rx.hstack(
+                        rx.text("🗓️ Time Range:", font_weight="bold", font_size="sm", color="#34495e"),
+                        rx.select(
+                            [ALL_TIME, *TIME_RANGES, CUSTOM_RANGE],
+                            value=AnalyticsDashboardState.time_range,
+                            on_change=AnalyticsDashboardState.set_time_range,
+                            size="2"
+                        ),
+                        rx.cond(
+                            AnalyticsDashboardState.time_range == CUSTOM_RANGE,
+                            rx.hstack(
+                                rx.input(
+                                    type="date",
+                                    value=AnalyticsDashboardState.range_start,
+                                    on_change=AnalyticsDashboardState.set_range_start,
+                                ),
+                                rx.text("to", font_size="sm"),
+                                rx.input(
+                                    type="date",
+                                    value=AnalyticsDashboardState.range_end,
+                                    on_change=AnalyticsDashboardState.set_range_end,
+                                ),
+                                rx.button("Apply", on_click=AnalyticsDashboardState.apply_time_range, size="2"),
+                                spacing="2",
+                                align="center"
+                            )
+                        ),
+                        spacing="3",
+                        align="center"
+                    ),
+                    rx.hstack(
+                        rx.checkbox(
+                            "🎲 Approximate (sampled) filtered views",
+                            checked=AnalyticsDashboardState.approximate,
+                            on_change=AnalyticsDashboardState.set_approximate,
+                        ),
+                        rx.text("Sample rate:", font_size="sm"),
+                        rx.select(
+                            list(SAMPLE_RATES),
+                            value=AnalyticsDashboardState.sample_rate,
+                            on_change=AnalyticsDashboardState.set_sample_rate,
+                            size="2"
+                        ),
+                        spacing="3",
+                        align="center"
+                    ),
                     rx.hstack(
                         rx.button("🔍 Apply Filters", on_click=AnalyticsDashboardState.apply_filters, bg="#3498db", color="white", size="2"),
                         rx.button("🧹 Clear Filters", on_click=AnalyticsDashboardState.clear_filters, bg="#e74c3c", color="white", size="2"),
@@ -901,30 +1186,45 @@ def analyticalpage():
             ),
             rx.divider(),
             
-            # Session display
+            # Pagination controls
+            rx.hstack(
+                rx.button(
+                    "◀ Prev",
+                    on_click=AnalyticsDashboardState.prev_page,
+                    disabled=AnalyticsDashboardState.page_number <= 1,
+                    size="2"
+                ),
+                rx.text(
+                    f"Page {AnalyticsDashboardState.page_number} of {AnalyticsDashboardState.page_count}",
+                    font_size="sm",
+                    color="#34495e"
+                ),
+                rx.button(
+                    "Next ▶",
+                    on_click=AnalyticsDashboardState.next_page,
+                    disabled=~AnalyticsDashboardState.has_next_page,
+                    size="2"
+                ),
+                rx.text("Per page:", font_size="sm"),
+                rx.select(
+                    ["10", "25", "50", "100"],
+                    value=AnalyticsDashboardState.page_size.to_string(),
+                    on_change=AnalyticsDashboardState.set_page_size,
+                    size="2"
+                ),
+                spacing="3",
+                align="center",
+                justify="center"
+            ),
+            
+            # Session display, scrolled inside a fixed-height window. Cards
+            # outside the viewport skip layout and paint (content-visibility).
             rx.vstack(
                 rx.cond(
                     AnalyticsDashboardState.session_summaries,
                     rx.foreach(
                         AnalyticsDashboardState.session_summaries,
-                        lambda summary: rx.box(
-                            rx.text(
-                                summary, 
-                                font_size="sm", 
-                                white_space="pre-line",
-                                font_family="'Segoe UI', Tahoma, Geneva, Verdana, sans-serif",
-                                line_height="1.6"
-                            ),
-                            bg="linear-gradient(135deg, #ffffff 0%, #f8f9fa 100%)",
-                            padding="25px",
-                            border_radius="15px",
-                            margin_bottom="20px",
-                            border="2px solid #e9ecef",
-                            box_shadow="0 4px 12px rgba(0,0,0,0.1)",
-                            _hover={"transform": "translateY(-2px)", "box_shadow": "0 8px 20px rgba(0,0,0,0.15)", "border": "2px solid #3498db"},
-                            width="100%",
-                            transition="all 0.3s ease"
-                        )
+                        session_card
                     ),
                     rx.box(
                         rx.vstack(
@@ -940,6 +1240,8 @@ def analyticalpage():
                 ),
                 align="start",
                 width="100%",
+                max_height="80vh",
+                overflow_y="auto",
                 spacing="3"
             ),
             
@@ -984,7 +1286,8 @@ def analyticalpage():
             padding="30px",
             width="100%",
             bg="linear-gradient(135deg, #f1f2f6 0%, #dfe4ea 100%)",
-            min_height="100vh"
+            min_height="100vh",
+            on_unmount=AnalyticsDashboardState.stop_live_updates
         ),
         
         # Login Form
@@ -1025,6 +1328,64 @@ def analyticalpage():
         )
     )
 
+def format_epoch(timestamp):
+    """Format an epoch-seconds var in the browser, N/A when unknown"""
+    return rx.cond(
+        timestamp,
+        rx.moment(date=timestamp.to_string(), unix=True, format="YYYY-MM-DD HH:mm:ss"),
+        rx.text.span("N/A")
+    )
+
+def page_activity(page: PageRecord):
+    return rx.box(
+        rx.cond(
+            page.highlighted,
+            rx.text(f"🎯 {page.name.upper()} (FILTERED):", font_weight="bold", color="#3498db"),
+            rx.text(f"📄 {page.name}:", font_weight="bold", text_transform="capitalize")
+        ),
+        rx.text(f"⏱️ Time: {page.minutes} min | 👆 Visits: {page.visits}"),
+        rx.text("📅 Entry: ", format_epoch(page.entry_ts)),
+        rx.text("📅 Exit: ", format_epoch(page.exit_ts)),
+        padding_left="20px"
+    )
+
+def session_card(record: SessionRecord):
+    return rx.box(
+        rx.vstack(
+            rx.text(f"👤 USER: {record.user_email}"),
+            rx.text("🕐 LOGIN: ", format_epoch(record.login_ts)),
+            rx.text(f"⏱️ TOTAL SESSION TIME: {record.total_minutes} minutes"),
+            rx.text(f"🔗 SESSION ID: {record.session_id}"),
+            rx.text("📋 PAGE ACTIVITY:", margin_top="10px"),
+            rx.cond(
+                record.pages,
+                rx.vstack(
+                    rx.text(f"📊 Summary: {record.page_count} pages, {record.total_visits} total visits"),
+                    rx.foreach(record.pages, page_activity),
+                    spacing="2",
+                    align="start"
+                ),
+                rx.text("❌ No page data available")
+            ),
+            spacing="1",
+            align="start",
+            font_size="sm",
+            font_family="'Segoe UI', Tahoma, Geneva, Verdana, sans-serif",
+            line_height="1.6"
+        ),
+        bg="linear-gradient(135deg, #ffffff 0%, #f8f9fa 100%)",
+        padding="25px",
+        border_radius="15px",
+        margin_bottom="20px",
+        border="2px solid #e9ecef",
+        box_shadow="0 4px 12px rgba(0,0,0,0.1)",
+        _hover={"transform": "translateY(-2px)", "box_shadow": "0 8px 20px rgba(0,0,0,0.15)", "border": "2px solid #3498db"},
+        width="100%",
+        transition="all 0.3s ease",
+        content_visibility="auto",
+        contain_intrinsic_size="auto 360px"
+    )
+
 def get_anonymous_session_id():
     # This is a simple Python-side generator; for real persistence, use browser localStorage via JS bridge if needed
     return f"anon_{uuid.uuid4().hex}_{int(time.time())}"
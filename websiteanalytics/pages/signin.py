@@ -1,6 +1,6 @@
 import reflex as rx
 import hashlib
-from ..firebase.firebase_config import db
+from websiteanalytics.storage.backend import storage
 from websiteanalytics.pages.analyticalpage import AnalyticsState as AnalyticalPageState
 # Your state class
 class SigninState(rx.State):
@@ -9,19 +9,18 @@ class SigninState(rx.State):
     message: str = ""
     is_authenticated:  bool = False
 
-    def check_user(self):
+    async def check_user(self):
         if not (self.email and self.password):
             self.message = "All fields are required!"
             return
-        user_ref = db.collection("users")  # your Firestore collection
-        users = user_ref.where("email", "==", self.email).get()
+        users = await storage.afind("users", [("email", "==", self.email)], limit=1)
 
         if not users:
             self.message = "No user found with this email!"
             return
 
         hashed_password = hashlib.sha256(self.password.encode()).hexdigest()
-        user_data = users[0].to_dict()
+        _, user_data = users[0]
 
         if user_data.get("password") != hashed_password:
             self.message = "Invalid email or password!"
@@ -1,6 +1,6 @@
 import reflex as rx
 from websiteanalytics.components.navbar import navbar
-from ..firebase.firebase_config import db
+from websiteanalytics.storage.backend import storage
 import hashlib
 
 class SignupState(rx.State):
@@ -10,17 +10,14 @@ class SignupState(rx.State):
     message: str = ""
 
     # Function to sign up user
-    def signup_user(self):
+    async def signup_user(self):
         # Validate inputs
         if not (self.username and self.email and self.password):
             self.message = "All fields are required!"
             return
         
-        # Reference to users collection
-        user_ref = db.collection("users")
-        
         # Check if user with email already exists
-        existing_user = user_ref.where("email", "==", self.email).get()
+        existing_user = await storage.afind("users", [("email", "==", self.email)], limit=1)
         if existing_user:
             self.message = "User with this email already exists!"
             print(self.message)
@@ -29,8 +26,8 @@ class SignupState(rx.State):
         # Hash the password
         hashed_password = hashlib.sha256(self.password.encode()).hexdigest()
 
-        # Add new user to Firestore
-        db.collection("users").add({
+        # Add new user to the users collection
+        await storage.aadd("users", {
             "username": self.username,
             "email": self.email,
             "password": hashed_password
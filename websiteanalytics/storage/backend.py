@@ -0,0 +1,29 @@
+import os
+
+from websiteanalytics.storage.instrumented import InstrumentedStorage
+
+# "firestore" (default), "sqlite", "sqlite:<path to database file>" or "memory"
+STORAGE_ENV = "ANALYTICS_STORAGE"
+DEFAULT_SQLITE_PATH = "analytics.db"
+
+
+def open_storage(spec):
+    """Storage backend for a ANALYTICS_STORAGE value"""
+    name, _, path = spec.partition(":")
+    if name == "firestore":
+        from websiteanalytics.firebase.firebase_config import get_async_db, get_db
+        from websiteanalytics.storage.firestore_backend import FirestoreStorage
+
+        return FirestoreStorage(get_db, get_async_db)
+    if name == "sqlite":
+        from websiteanalytics.storage.sqlite_backend import SQLiteStorage
+
+        return SQLiteStorage(path or DEFAULT_SQLITE_PATH)
+    if name == "memory":
+        from websiteanalytics.storage.memory_backend import MemoryStorage
+
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend {spec!r}")
+
+
+storage = InstrumentedStorage(open_storage(os.environ.get(STORAGE_ENV, "firestore")))
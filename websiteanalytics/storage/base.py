@@ -0,0 +1,194 @@
+import asyncio
+import threading
+from collections import namedtuple
+
+from websiteanalytics.logs import get_logger
+
+log = get_logger(__name__)
+
+# A pending document write, applied as set(data, merge=merge) on collection/doc_id
+WriteOp = namedtuple("WriteOp", ["collection", "doc_id", "data", "merge"])
+
+# Query filter operators every backend supports
+OPERATORS = ("==", "<", "<=", ">", ">=")
+# Seconds between polls for listen() on backends without change notifications
+POLL_INTERVAL = 1.0
+
+
+class Increment:
+    """Atomic numeric increment, usable as a field value in a merged write"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return f"Increment({self.value!r})"
+
+
+def merge_document(document, data, merge):
+    """Apply set(data, merge=merge) to a stored document and return the result.
+
+    Field names are taken literally, dots included. With merge, nested maps
+    are merged field by field and increments add to the stored number;
+    without it the document is replaced and increments start from zero.
+    """
+    merged = dict(document or {}) if merge else {}
+    for field, value in data.items():
+        merged[field] = _merge_field(merged.get(field), value, merge)
+    return merged
+
+
+def _merge_field(old, new, merge):
+    if isinstance(new, Increment):
+        return (old if merge and isinstance(old, (int, float)) else 0) + new.value
+    if isinstance(new, dict):
+        return merge_document(old if merge and isinstance(old, dict) else None, new, merge)
+    return new
+
+
+def project(document, fields):
+    """Only the listed top-level fields of a document; None keeps every field"""
+    if fields is None:
+        return document
+    return {field: document[field] for field in fields if field in document}
+
+
+def matches(document, filters):
+    """Whether a document passes (field, op, value) filters; missing fields never match"""
+    for field, op, value in filters:
+        if field not in document:
+            return False
+        current = document[field]
+        try:
+            if op == "==":
+                ok = current == value
+            elif op == "<":
+                ok = current < value
+            elif op == "<=":
+                ok = current <= value
+            elif op == ">":
+                ok = current > value
+            elif op == ">=":
+                ok = current >= value
+            else:
+                raise ValueError(f"Unsupported operator {op!r}")
+        except TypeError:
+            ok = False
+        if not ok:
+            return False
+    return True
+
+
+class Poller:
+    """listen() handle for backends without change notifications.
+
+    A daemon thread polls the backend's find() for documents whose field
+    moved past the cursor and hands them to the callback. Deletions are
+    not seen.
+    """
+
+    def __init__(self, storage, collection, field, after, callback, name="analytics-listener"):
+        self._storage = storage
+        self._collection = collection
+        self._field = field
+        self._cursor = after
+        self._callback = callback
+        self._stopped = threading.Event()
+        threading.Thread(target=self._run, name=name, daemon=True).start()
+
+    def _run(self):
+        while not self._stopped.wait(POLL_INTERVAL):
+            try:
+                rows = self._storage.find(
+                    self._collection, [(self._field, ">", self._cursor)], order_by=self._field
+                )
+                if rows:
+                    self._cursor = rows[-1][1][self._field]
+                    self._callback(dict(rows), [])
+            except Exception:
+                log.exception("Error polling %s for changes", self._collection)
+
+    def unsubscribe(self):
+        self._stopped.set()
+
+
+class Storage:
+    """Document store used by the tracking pipeline, the dashboard and the sign-in pages.
+
+    Documents are dicts addressed by collection and id. Query results are
+    lists of (doc_id, data).
+    """
+
+    # Most writes one commit() call accepts
+    max_batch_writes = 500
+
+    def warm_up(self):
+        """Open connections ahead of the first request"""
+
+    def get(self, collection, doc_id):
+        """The document's data, or None when it does not exist"""
+        raise NotImplementedError
+
+    def set(self, collection, doc_id, data, merge=False):
+        raise NotImplementedError
+
+    def add(self, collection, data):
+        """Store a document under a generated id and return the id"""
+        raise NotImplementedError
+
+    def find(self, collection, filters=(), order_by=None, descending=False, start_after=None, limit=None, fields=None):
+        """Documents matching every (field, op, value) filter.
+
+        With `order_by` they are sorted on that field and `start_after`
+        skips everything up to and including that field value. With
+        `fields` only those top-level fields of each document are read.
+        """
+        raise NotImplementedError
+
+    def partitions(self, collection, count):
+        """Split a collection into at most `count` disjoint parts that scan() can read concurrently"""
+        return [collection]
+
+    def scan(self, partition, fields=None):
+        """Every document in one part from partitions(), as (doc_id, data)"""
+        return self.find(partition, fields=fields)
+
+    def count(self, collection, filters=()):
+        """Number of documents matching every (field, op, value) filter"""
+        raise NotImplementedError
+
+    def delete(self, collection, doc_ids):
+        """Delete the documents in one batch of at most max_batch_writes; missing ids are ignored"""
+        raise NotImplementedError
+
+    def commit(self, ops):
+        """Apply WriteOps atomically"""
+        raise NotImplementedError
+
+    def commit_if(self, collection, doc_id, check, ops):
+        """Apply WriteOps atomically if `check(data)` holds for the document's current data.
+
+        `data` is None for a missing document. Returns whether the ops
+        were applied.
+        """
+        raise NotImplementedError
+
+    def listen(self, collection, field, after, callback):
+        """Call `callback(changed, removed)` as documents move past `after` on `field`.
+
+        `changed` maps doc ids to their data and `removed` lists ids of
+        documents that left the query. Returns a handle with `unsubscribe()`.
+        """
+        raise NotImplementedError
+
+    # Awaitable versions for event handlers. Backends without a native async
+    # client run the blocking call on a worker thread, off the event loop.
+
+    async def aget(self, collection, doc_id):
+        return await asyncio.to_thread(self.get, collection, doc_id)
+
+    async def aadd(self, collection, data):
+        return await asyncio.to_thread(self.add, collection, data)
+
+    async def afind(self, collection, filters=(), order_by=None, descending=False, start_after=None, limit=None):
+        return await asyncio.to_thread(self.find, collection, filters, order_by, descending, start_after, limit)
@@ -0,0 +1,147 @@
+from firebase_admin import firestore
+
+from websiteanalytics.storage.base import Increment, Storage
+
+
+def _to_firestore(value):
+    if isinstance(value, Increment):
+        return firestore.Increment(value.value)
+    if isinstance(value, dict):
+        return {field: _to_firestore(item) for field, item in value.items()}
+    return value
+
+
+class FirestoreStorage(Storage):
+    """Storage on Cloud Firestore.
+
+    `client_factory` returns the process's client, so nothing connects
+    until the first call and forked workers get their own channel. With
+    `async_client_factory` the awaitable methods use the asyncio client.
+    """
+
+    def __init__(self, client_factory, async_client_factory=None):
+        self._client_factory = client_factory
+        self._async_client_factory = async_client_factory
+
+    @property
+    def client(self):
+        return self._client_factory()
+
+    def warm_up(self):
+        # Create the client and open its channel with one cheap RPC
+        next(iter(self.client.collections()), None)
+
+    def _ref(self, collection, doc_id):
+        return self.client.collection(collection).document(doc_id)
+
+    def get(self, collection, doc_id):
+        snapshot = self._ref(collection, doc_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def set(self, collection, doc_id, data, merge=False):
+        self._ref(collection, doc_id).set(_to_firestore(data), merge=merge)
+
+    def add(self, collection, data):
+        _, ref = self.client.collection(collection).add(_to_firestore(data))
+        return ref.id
+
+    def find(self, collection, filters=(), order_by=None, descending=False, start_after=None, limit=None, fields=None):
+        query = self._query(self.client, collection, filters, order_by, descending, start_after, limit)
+        if fields is not None:
+            query = query.select(fields)
+        return [(doc.id, doc.to_dict()) for doc in query.get()]
+
+    @staticmethod
+    def _query(client, collection, filters, order_by, descending, start_after, limit):
+        query = client.collection(collection)
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        if order_by is not None:
+            direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+            query = query.order_by(order_by, direction=direction)
+            if start_after is not None:
+                query = query.start_after({order_by: start_after})
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def partitions(self, collection, count):
+        if count <= 1:
+            return [collection]
+        # Partition queries only run on collection groups; no subcollection is named like a
+        # top-level collection here, so the group holds exactly the collection's documents
+        return list(self.client.collection_group(collection).get_partitions(count))
+
+    def scan(self, partition, fields=None):
+        if isinstance(partition, str):
+            return self.find(partition, fields=fields)
+        query = partition.query()
+        if fields is not None:
+            query = query.select(fields)
+        return [(doc.id, doc.to_dict()) for doc in query.get()]
+
+    def count(self, collection, filters=()):
+        query = self._query(self.client, collection, filters, None, False, None, None)
+        result = query.count().get()
+        return int(result[0][0].value)
+
+    def delete(self, collection, doc_ids):
+        batch = self.client.batch()
+        for doc_id in doc_ids:
+            batch.delete(self._ref(collection, doc_id))
+        batch.commit()
+
+    def commit(self, ops):
+        batch = self.client.batch()
+        for op in ops:
+            batch.set(self._ref(op.collection, op.doc_id), _to_firestore(op.data), merge=op.merge)
+        batch.commit()
+
+    def commit_if(self, collection, doc_id, check, ops):
+        guard_ref = self._ref(collection, doc_id)
+
+        @firestore.transactional
+        def apply(transaction):
+            snapshot = guard_ref.get(transaction=transaction)
+            if not check(snapshot.to_dict() if snapshot.exists else None):
+                return False
+            for op in ops:
+                transaction.set(self._ref(op.collection, op.doc_id), _to_firestore(op.data), merge=op.merge)
+            return True
+
+        return apply(self.client.transaction())
+
+    async def aget(self, collection, doc_id):
+        if self._async_client_factory is None:
+            return await super().aget(collection, doc_id)
+        snapshot = await self._async_client_factory().collection(collection).document(doc_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    async def aadd(self, collection, data):
+        if self._async_client_factory is None:
+            return await super().aadd(collection, data)
+        _, ref = await self._async_client_factory().collection(collection).add(_to_firestore(data))
+        return ref.id
+
+    async def afind(self, collection, filters=(), order_by=None, descending=False, start_after=None, limit=None):
+        if self._async_client_factory is None:
+            return await super().afind(collection, filters, order_by, descending, start_after, limit)
+        query = self._query(
+            self._async_client_factory(), collection, filters, order_by, descending, start_after, limit
+        )
+        return [(doc.id, doc.to_dict()) for doc in await query.get()]
+
+    def listen(self, collection, field, after, callback):
+        def on_snapshot(docs, changes, read_time):
+            changed = {}
+            removed = []
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    removed.append(change.document.id)
+                else:
+                    changed[change.document.id] = change.document.to_dict()
+            if changed or removed:
+                callback(changed, removed)
+
+        query = self.client.collection(collection).where(field, ">", after)
+        return query.on_snapshot(on_snapshot)
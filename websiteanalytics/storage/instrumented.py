@@ -0,0 +1,121 @@
+import contextlib
+import time
+
+from websiteanalytics.metrics import DOCUMENTS_READ, DOCUMENTS_WRITTEN, STORAGE_ERRORS, STORAGE_SECONDS
+from websiteanalytics.storage.base import Storage
+
+
+class InstrumentedStorage(Storage):
+    """Wraps a backend and records call latency, errors and documents read and written"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._name = type(backend).__name__
+
+    @property
+    def max_batch_writes(self):
+        return self.backend.max_batch_writes
+
+    @contextlib.contextmanager
+    def _timed(self, operation):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            STORAGE_ERRORS.labels(self._name, operation).inc()
+            raise
+        finally:
+            STORAGE_SECONDS.labels(self._name, operation).observe(time.perf_counter() - started)
+
+    def _read(self, operation, documents):
+        DOCUMENTS_READ.labels(self._name, operation).inc(documents)
+
+    def _written(self, operation, documents):
+        DOCUMENTS_WRITTEN.labels(self._name, operation).inc(documents)
+
+    def warm_up(self):
+        with self._timed("warm_up"):
+            self.backend.warm_up()
+
+    def get(self, collection, doc_id):
+        with self._timed("get"):
+            data = self.backend.get(collection, doc_id)
+        self._read("get", 1)
+        return data
+
+    def set(self, collection, doc_id, data, merge=False):
+        with self._timed("set"):
+            self.backend.set(collection, doc_id, data, merge)
+        self._written("set", 1)
+
+    def add(self, collection, data):
+        with self._timed("add"):
+            doc_id = self.backend.add(collection, data)
+        self._written("add", 1)
+        return doc_id
+
+    def find(self, collection, filters=(), order_by=None, descending=False, start_after=None, limit=None, fields=None):
+        with self._timed("find"):
+            rows = self.backend.find(collection, filters, order_by, descending, start_after, limit, fields)
+        self._read("find", len(rows))
+        return rows
+
+    def partitions(self, collection, count):
+        with self._timed("partitions"):
+            return self.backend.partitions(collection, count)
+
+    def scan(self, partition, fields=None):
+        with self._timed("scan"):
+            rows = self.backend.scan(partition, fields)
+        self._read("scan", len(rows))
+        return rows
+
+    def count(self, collection, filters=()):
+        with self._timed("count"):
+            count = self.backend.count(collection, filters)
+        # One aggregation result, whatever the number of documents counted
+        self._read("count", 1)
+        return count
+
+    def delete(self, collection, doc_ids):
+        with self._timed("delete"):
+            self.backend.delete(collection, doc_ids)
+        self._written("delete", len(doc_ids))
+
+    def commit(self, ops):
+        with self._timed("commit"):
+            self.backend.commit(ops)
+        self._written("commit", len(ops))
+
+    def commit_if(self, collection, doc_id, check, ops):
+        with self._timed("commit_if"):
+            applied = self.backend.commit_if(collection, doc_id, check, ops)
+        self._read("commit_if", 1)
+        if applied:
+            self._written("commit_if", len(ops))
+        return applied
+
+    async def aget(self, collection, doc_id):
+        with self._timed("get"):
+            data = await self.backend.aget(collection, doc_id)
+        self._read("get", 1)
+        return data
+
+    async def aadd(self, collection, data):
+        with self._timed("add"):
+            doc_id = await self.backend.aadd(collection, data)
+        self._written("add", 1)
+        return doc_id
+
+    async def afind(self, collection, filters=(), order_by=None, descending=False, start_after=None, limit=None):
+        with self._timed("find"):
+            rows = await self.backend.afind(collection, filters, order_by, descending, start_after, limit)
+        self._read("find", len(rows))
+        return rows
+
+    def listen(self, collection, field, after, callback):
+        def on_changes(changed, removed):
+            self._read("listen", len(changed))
+            callback(changed, removed)
+
+        return self.backend.listen(collection, field, after, on_changes)
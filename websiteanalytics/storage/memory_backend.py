@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+import uuid
+
+from websiteanalytics.storage.base import Poller, Storage, matches, merge_document, project
+
+
+class StorageUnavailable(Exception):
+    """Injected failure from MemoryStorage"""
+
+
+class MemoryStorage(Storage):
+    """In-process storage for tests and load generation.
+
+    Every call sleeps for about `latency` seconds (uniformly up to
+    `jitter` more) and fails with StorageUnavailable at `failure_rate`,
+    so callers can be exercised against a slow or flaky datastore.
+    `reads` and `writes` count completed calls and written documents.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.reads = 0
+        self.writes = 0
+        self.failures = 0
+        self._documents = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def _call(self):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            with self._lock:
+                self.failures += 1
+            raise StorageUnavailable("injected storage failure")
+
+    def _collection(self, collection):
+        return self._documents.setdefault(collection, {})
+
+    def _write(self, collection, doc_id, data, merge):
+        documents = self._collection(collection)
+        documents[doc_id] = merge_document(documents.get(doc_id) if merge else None, data, merge)
+        self.writes += 1
+
+    def get(self, collection, doc_id):
+        self._call()
+        with self._lock:
+            self.reads += 1
+            document = self._collection(collection).get(doc_id)
+            return dict(document) if document is not None else None
+
+    def set(self, collection, doc_id, data, merge=False):
+        self._call()
+        with self._lock:
+            self._write(collection, doc_id, data, merge)
+
+    def add(self, collection, data):
+        doc_id = uuid.uuid4().hex[:20]
+        self.set(collection, doc_id, data)
+        return doc_id
+
+    def find(self, collection, filters=(), order_by=None, descending=False, start_after=None, limit=None, fields=None):
+        self._call()
+        with self._lock:
+            self.reads += 1
+            rows = [
+                (doc_id, dict(document))
+                for doc_id, document in self._collection(collection).items()
+                if matches(document, filters)
+            ]
+        if order_by is not None:
+            rows = [row for row in rows if order_by in row[1]]
+            if start_after is not None:
+                op = "<" if descending else ">"
+                rows = [row for row in rows if matches(row[1], [(order_by, op, start_after)])]
+            rows.sort(key=lambda row: row[1][order_by], reverse=descending)
+        if limit is not None:
+            rows = rows[:limit]
+        return [(doc_id, project(document, fields)) for doc_id, document in rows]
+
+    def count(self, collection, filters=()):
+        self._call()
+        with self._lock:
+            self.reads += 1
+            return sum(1 for document in self._collection(collection).values() if matches(document, filters))
+
+    def delete(self, collection, doc_ids):
+        self._call()
+        with self._lock:
+            documents = self._collection(collection)
+            for doc_id in doc_ids:
+                documents.pop(doc_id, None)
+                self.writes += 1
+
+    def commit(self, ops):
+        self._call()
+        with self._lock:
+            for op in ops:
+                self._write(op.collection, op.doc_id, op.data, op.merge)
+
+    def commit_if(self, collection, doc_id, check, ops):
+        self._call()
+        with self._lock:
+            if not check(self._collection(collection).get(doc_id)):
+                return False
+            for op in ops:
+                self._write(op.collection, op.doc_id, op.data, op.merge)
+        return True
+
+    def listen(self, collection, field, after, callback):
+        # find() filters with matches(), so polls see the same latency and failures as other reads
+        return Poller(self, collection, field, after, callback, "analytics-memory-listener")
@@ -0,0 +1,203 @@
+import contextlib
+import json
+import sqlite3
+import threading
+import uuid
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.storage.base import OPERATORS, Poller, Storage, merge_document
+
+log = get_logger(__name__)
+
+# Fields the app filters or sorts on; each gets an index on its JSON value
+INDEXED_FIELDS = ("login_time", "updated_at", "sample_hash", "ingested_at", "email", "bucket")
+
+
+def _path(name):
+    """JSON path literal for a top-level document field"""
+    return "'$.\"{}\"'".format(name.replace("'", "''").replace('"', '\\"'))
+
+
+def _field(name):
+    """SQL expression for a document field; must match the index expressions exactly"""
+    return f"json_extract(data, {_path(name)})"
+
+
+def _where(collection, filters):
+    """WHERE clause and parameters for documents in a collection matching the filters"""
+    sql = " WHERE collection = ?"
+    params = [collection]
+    for field, op, value in filters:
+        if op not in OPERATORS:
+            raise ValueError(f"Unsupported operator {op!r}")
+        sql += f" AND {_field(field)} {'=' if op == '==' else op} ?"
+        params.append(value)
+    return sql, params
+
+
+def _rows(rows, fields):
+    """(doc_id, data) from rows selected with _columns(fields)"""
+    if fields is None:
+        return [(doc_id, json.loads(data)) for doc_id, data in rows]
+    projected = []
+    for doc_id, values in rows:
+        values = json.loads(values)
+        projected.append((doc_id, {field: value for field, value in zip(fields, values) if value is not None}))
+    return projected
+
+
+def _columns(fields):
+    """Select list for doc_id and the document, or only `fields` of it as a JSON array"""
+    if fields is None:
+        return "doc_id, data"
+    # With several paths json_extract returns an array; repeat a lone path to get one too
+    paths = [_path(field) for field in fields]
+    return "doc_id, json_extract(data, {})".format(", ".join(paths if len(paths) > 1 else paths * 2))
+
+
+class SQLiteStorage(Storage):
+    """Storage in an embedded SQLite database, for single-node and offline runs.
+
+    Every document is a JSON row keyed by (collection, doc_id). The
+    database runs in WAL mode so dashboard reads do not wait on the
+    tracking writers, and the fields in INDEXED_FIELDS are indexed.
+    """
+
+    max_batch_writes = 10000
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " collection TEXT NOT NULL,"
+            " doc_id TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (collection, doc_id))"
+        )
+        # Databases created before collection groups were dropped still carry the column
+        if any(row[1] == "collection_group" for row in self._conn.execute("PRAGMA table_info(documents)")):
+            self._conn.execute("DROP INDEX IF EXISTS documents_collection_group")
+            self._conn.execute("ALTER TABLE documents DROP COLUMN collection_group")
+        for name in INDEXED_FIELDS:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS documents_{name} ON documents (collection, {_field(name)})"
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _read(self, collection, doc_id):
+        rows = self._query(
+            "SELECT data FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def _write(self, collection, doc_id, data, merge):
+        document = merge_document(self._read(collection, doc_id) if merge else None, data, merge)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (collection, doc_id, data) VALUES (?, ?, ?)",
+            (collection, doc_id, json.dumps(document, default=str)),
+        )
+
+    def get(self, collection, doc_id):
+        return self._read(collection, doc_id)
+
+    def set(self, collection, doc_id, data, merge=False):
+        with self._transaction():
+            self._write(collection, doc_id, data, merge)
+
+    def add(self, collection, data):
+        doc_id = uuid.uuid4().hex[:20]
+        self.set(collection, doc_id, data)
+        return doc_id
+
+    def find(self, collection, filters=(), order_by=None, descending=False, start_after=None, limit=None, fields=None):
+        where, params = _where(collection, filters)
+        sql = f"SELECT {_columns(fields)} FROM documents" + where
+        if order_by is not None:
+            # Like Firestore, ordering on a field leaves out documents without it
+            sql += f" AND {_field(order_by)} IS NOT NULL"
+            if start_after is not None:
+                sql += f" AND {_field(order_by)} {'<' if descending else '>'} ?"
+                params.append(start_after)
+            sql += f" ORDER BY {_field(order_by)} {'DESC' if descending else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return _rows(self._query(sql, params), fields)
+
+    def partitions(self, collection, count):
+        """Ranges of doc ids holding about the same number of documents"""
+        total = self.count(collection)
+        bounds = [None]
+        for part in range(1, min(count, total)):
+            rows = self._query(
+                "SELECT doc_id FROM documents WHERE collection = ? ORDER BY doc_id LIMIT 1 OFFSET ?",
+                (collection, total * part // count),
+            )
+            if rows and rows[0][0] != bounds[-1]:
+                bounds.append(rows[0][0])
+        bounds.append(None)
+        return [(collection, low, high) for low, high in zip(bounds, bounds[1:])]
+
+    def scan(self, partition, fields=None):
+        if isinstance(partition, str):
+            return self.find(partition, fields=fields)
+        collection, low, high = partition
+        sql = f"SELECT {_columns(fields)} FROM documents WHERE collection = ?"
+        params = [collection]
+        if low is not None:
+            sql += " AND doc_id >= ?"
+            params.append(low)
+        if high is not None:
+            sql += " AND doc_id < ?"
+            params.append(high)
+        # A connection of its own so partitions scan concurrently; WAL lets it read alongside the writer
+        reader = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            return _rows(reader.execute(sql, params).fetchall(), fields)
+        finally:
+            reader.close()
+
+    def count(self, collection, filters=()):
+        where, params = _where(collection, filters)
+        return self._query("SELECT COUNT(*) FROM documents" + where, params)[0][0]
+
+    def delete(self, collection, doc_ids):
+        with self._transaction():
+            self._conn.executemany(
+                "DELETE FROM documents WHERE collection = ? AND doc_id = ?",
+                [(collection, doc_id) for doc_id in doc_ids],
+            )
+
+    def commit(self, ops):
+        with self._transaction():
+            for op in ops:
+                self._write(op.collection, op.doc_id, op.data, op.merge)
+
+    def commit_if(self, collection, doc_id, check, ops):
+        with self._transaction():
+            if not check(self._read(collection, doc_id)):
+                return False
+            for op in ops:
+                self._write(op.collection, op.doc_id, op.data, op.merge)
+        return True
+
+    def listen(self, collection, field, after, callback):
+        return Poller(self, collection, field, after, callback, "analytics-sqlite-listener")
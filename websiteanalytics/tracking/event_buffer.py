@@ -0,0 +1,114 @@
+import atexit
+import queue
+import threading
+import time
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.tracking.event_log import MAX_SESSIONS_PER_PASS, event_log_writes, stamp_ingested
+from websiteanalytics.tracking.rollups import rollup_writes
+from websiteanalytics.tracking.sketches import sketch_writer
+from websiteanalytics.tracking.writes import coalesce_ops, commit_ops
+
+log = get_logger(__name__)
+
+
+class EventBuffer:
+    """Write-behind queue for tracking events.
+
+    Event handlers only push events onto an in-process queue. A daemon
+    worker drains the queue whenever `flush_size` events are waiting or
+    `flush_interval` seconds have passed, turns the events into document
+    writes with the registered writers and commits each writer's writes
+    in storage batches of their own. Session documents are not written
+    here; they are built from the event log by the compactor in
+    `event_log.py`.
+    """
+
+    def __init__(self, flush_size=200, flush_interval=1.0, max_retries=3):
+        # A flush's log records share one ingested_at and the compactor folds such a run in one pass
+        if flush_size > MAX_SESSIONS_PER_PASS:
+            raise ValueError(f"flush_size {flush_size} is above the compactor's {MAX_SESSIONS_PER_PASS} sessions per pass")
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = queue.Queue()
+        self._writers = []
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def add_writer(self, writer, prepare=None):
+        """Register a callable that maps a list of events to a list of WriteOps.
+
+        `prepare` is passed on to commit_ops() for the writer's batches.
+        """
+        self._writers.append((writer, prepare))
+
+    def push(self, event):
+        self._ensure_worker()
+        self._queue.put(event)
+
+    def pending(self):
+        """Number of events waiting to be written"""
+        return self._queue.qsize()
+
+    def flush(self):
+        """Synchronously write everything that is currently queued"""
+        while True:
+            events = self._drain(block=False)
+            if not events:
+                break
+            self._write(events)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="analytics-event-buffer", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            events = self._drain(block=True)
+            if events:
+                try:
+                    self._write(events)
+                except Exception:
+                    log.exception("Error writing %d analytics events", len(events))
+
+    def _drain(self, block):
+        events = []
+        if block:
+            events.append(self._queue.get())
+        deadline = time.monotonic() + self.flush_interval
+        while len(events) < self.flush_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    events.append(self._queue.get(timeout=timeout))
+                else:
+                    events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _write(self, events):
+        # Each writer commits on its own, in registration order, so a failing
+        # or rejected rollup or sketch write never takes the event log appends with it
+        for writer, prepare in self._writers:
+            try:
+                ops = writer(events)
+            except Exception:
+                log.exception("Error in analytics writer %s", getattr(writer, "__qualname__", writer))
+                continue
+            commit_ops(coalesce_ops(ops), self.max_retries, prepare)
+
+
+event_buffer = EventBuffer()
+event_buffer.add_writer(event_log_writes, stamp_ingested)
+event_buffer.add_writer(rollup_writes)
+event_buffer.add_writer(sketch_writer.writes)
+
+atexit.register(event_buffer.flush)
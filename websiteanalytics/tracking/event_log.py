@@ -0,0 +1,179 @@
+import threading
+import time
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.storage.backend import storage
+from websiteanalytics.tracking.events import session_writes
+from websiteanalytics.tracking.writes import WriteOp, coalesce_ops
+
+log = get_logger(__name__)
+
+EVENTS = "analytics_events"
+META = "analytics_meta"
+COMPACTION_CURSOR = "compaction"
+
+# Events logged more recently than this are left for the next pass, so a
+# batch that another worker is still committing cannot slip behind the cursor.
+# Records are stamped right before each commit attempt, so this only has to
+# cover one attempt.
+COMPACTION_LAG = 10
+EVENTS_PER_PASS = 2000
+# Compacted records deleted per batch
+PRUNE_BATCH = 500
+# A pass is committed in one transaction, which holds at most 500 writes
+MAX_SESSIONS_PER_PASS = 450
+
+
+def event_id(event):
+    return f"{event['session_id']}_{event['seq']:06d}"
+
+
+def event_log_writes(events):
+    """Append every event to the event log as its own immutable record.
+
+    Commit the writes with stamp_ingested() as their `prepare` step.
+    """
+    return [WriteOp(EVENTS, event_id(event), dict(event), False) for event in events]
+
+
+def stamp_ingested(ops):
+    """The event log writes with `ingested_at` set to now, for commit_ops() to call before each attempt"""
+    now = time.time()
+    return [op._replace(data=dict(op.data, ingested_at=now)) for op in ops]
+
+
+def _cut(events, size):
+    """Trim events to `size` without splitting a run of equal ingested_at values"""
+    if size >= len(events):
+        return events
+    while size > 0 and events[size - 1]["ingested_at"] == events[size]["ingested_at"]:
+        size -= 1
+    return events[:size]
+
+
+def _select_pass(events, page_full):
+    sessions = set()
+    for index, event in enumerate(events):
+        sessions.add(event["session_id"])
+        if len(sessions) > MAX_SESSIONS_PER_PASS:
+            selected = _cut(events, index)
+            if not selected:
+                # One run spans more sessions than a pass holds; take it whole so the
+                # cursor still moves. EventBuffer keeps each flush below the limit.
+                first = events[0]["ingested_at"]
+                selected = [event for event in events if event["ingested_at"] == first]
+            return selected
+    if page_full:
+        # The next event may share the last ingested_at, leave that run for the next pass
+        size = len(events)
+        while size > 0 and events[size - 1]["ingested_at"] == events[-1]["ingested_at"]:
+            size -= 1
+        return events[:size] or events
+    return events
+
+
+def _cursor_value(data):
+    return data.get("ingested_at", 0) if data else 0
+
+
+def _commit_pass(expected_cursor, new_cursor, ops):
+    cursor_op = WriteOp(META, COMPACTION_CURSOR, {"ingested_at": new_cursor, "compacted_at": time.time()}, False)
+    # Another worker compacted since we read the cursor, drop our pass
+    return storage.commit_if(
+        META, COMPACTION_CURSOR,
+        lambda data: _cursor_value(data) == expected_cursor,
+        ops + [cursor_op],
+    )
+
+
+def compact_events():
+    """Fold newly logged events into the `analytics` session documents.
+
+    Returns the number of events folded. The folded writes and the new
+    cursor are committed in one transaction, so every event is applied
+    exactly once even when several workers run the compactor.
+    """
+    cursor = _cursor_value(storage.get(META, COMPACTION_CURSOR))
+
+    docs = storage.find(
+        EVENTS,
+        [("ingested_at", ">", cursor), ("ingested_at", "<=", time.time() - COMPACTION_LAG)],
+        order_by="ingested_at",
+        limit=EVENTS_PER_PASS,
+    )
+    events = [data for _, data in docs]
+    events = _select_pass(events, len(events) == EVENTS_PER_PASS)
+    if not events:
+        return 0
+
+    ops = coalesce_ops(session_writes(events))
+    if not _commit_pass(cursor, events[-1]["ingested_at"], ops):
+        log.info("Compaction cursor moved, another worker is compacting")
+        return 0
+
+    log.debug("Compacted %d events into %d sessions", len(events), len(ops))
+    return len(events)
+
+
+def prune_events():
+    """Delete event log records the compactor has folded in.
+
+    Only records at or below the cursor and older than COMPACTION_LAG go,
+    so nothing a pass could still read is removed. Returns the number
+    deleted.
+    """
+    cursor = _cursor_value(storage.get(META, COMPACTION_CURSOR))
+    horizon = min(cursor, time.time() - COMPACTION_LAG)
+    batch_size = min(PRUNE_BATCH, storage.max_batch_writes)
+    pruned = 0
+    while True:
+        docs = storage.find(EVENTS, [("ingested_at", "<=", horizon)], limit=batch_size, fields=("ingested_at",))
+        if not docs:
+            break
+        storage.delete(EVENTS, [doc_id for doc_id, _ in docs])
+        pruned += len(docs)
+    if pruned:
+        log.debug("Pruned %d compacted events", pruned)
+    return pruned
+
+
+class Compactor:
+    """Background thread that runs compact_events, then prune_events, every `interval` seconds"""
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="analytics-compactor", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                while compact_events():
+                    pass
+                prune_events()
+            except Exception:
+                log.exception("Error compacting analytics events")
+            time.sleep(self.interval)
+
+
+compactor = Compactor()
+
+
+if __name__ == "__main__":
+    total = 0
+    while True:
+        folded = compact_events()
+        if not folded:
+            break
+        total += folded
+    print(f"Compaction finished, {total} events folded, {prune_events()} pruned")
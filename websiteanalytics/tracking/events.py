@@ -0,0 +1,76 @@
+import time
+
+from websiteanalytics.tracking.session_schema import SCHEMA_VERSION, sample_hash
+from websiteanalytics.tracking.writes import WriteOp, increment
+
+SESSION_START = "session_start"
+PAGE_ENTER = "page_enter"
+PAGE_EXIT = "page_exit"
+SESSION_END = "session_end"
+
+
+def make_event(event_type, session_id, user_email, seq=0, ts=None, **fields):
+    """Build a tracking event dict that can be pushed to the event buffer.
+
+    `seq` is the event's position within its session and, together with the
+    session id, names the event's record in the append-only event log.
+    """
+    event = {
+        "type": event_type,
+        "session_id": session_id,
+        "user_email": user_email,
+        "seq": seq,
+        "ts": ts if ts is not None else time.time(),
+    }
+    event.update(fields)
+    return event
+
+
+def session_writes(events):
+    """Fold tracking events into merged writes on the `analytics` session documents.
+
+    Only deltas are written (increments for visits and time spent), so a
+    batch of events can be folded into a summary without reading it first.
+    Every write stamps `updated_at` for the dashboard's delta sync. Documents
+    use the version 2 layout described in session_schema.
+    """
+    ops = []
+    updated_at = time.time()
+    for event in events:
+        session_id = event["session_id"]
+        event_type = event["type"]
+
+        if event_type == SESSION_START:
+            data = {
+                "schema": SCHEMA_VERSION,
+                "user_email": event["user_email"],
+                "login_time": event["ts"],
+                "updated_at": updated_at,
+                "sample_hash": sample_hash(session_id),
+            }
+            if event.get("is_anonymous"):
+                data["anon"] = True
+            ops.append(WriteOp("analytics", session_id, data, True))
+
+        elif event_type == PAGE_ENTER:
+            page = event["page"]
+            ops.append(WriteOp("analytics", session_id, {
+                "pages": {page: {"v": increment(), "en": event["ts"]}},
+                "updated_at": updated_at,
+            }, True))
+
+        elif event_type == PAGE_EXIT:
+            page = event["page"]
+            ops.append(WriteOp("analytics", session_id, {
+                "pages": {page: {"t": increment(event["time_spent_minutes"]), "ex": event["ts"]}},
+                "updated_at": updated_at,
+            }, True))
+
+        elif event_type == SESSION_END:
+            ops.append(WriteOp("analytics", session_id, {
+                "out": event["ts"],
+                "total": event["total_session_time_minutes"],
+                "updated_at": updated_at,
+            }, True))
+
+    return ops
@@ -0,0 +1,177 @@
+"""Retention of the `analytics` session documents.
+
+Sessions that logged in more than ANALYTICS_RETENTION_DAYS ago (90 by
+default) are moved out of the hot collection into day files under
+ANALYTICS_ARCHIVE_DIR:
+
+    archive/analytics-2026-01-05.ndjson.zst    {"id": <session id>, "data": <document>} per line
+
+Files are zstd-compressed, which needs the `zstandard` package from
+requirements.txt. Rollups and sketches are left
+in place, so the dashboard's default view still totals the archived days;
+run the rollup backfill first if older sessions predate the rollups.
+
+    python -m websiteanalytics.tracking.retention                       # archive
+    python -m websiteanalytics.tracking.retention summary 2026-01-01 2026-02-01
+"""
+
+import argparse
+import io
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import zstandard
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.storage.backend import storage
+from websiteanalytics.tracking.rollups import DAY, bucket_start
+from websiteanalytics.tracking.session_schema import META, SESSIONS
+
+log = get_logger(__name__)
+
+RETENTION_ENV = "ANALYTICS_RETENTION_DAYS"
+DEFAULT_RETENTION_DAYS = 90
+ARCHIVE_ENV = "ANALYTICS_ARCHIVE_DIR"
+DEFAULT_ARCHIVE_DIR = "archive"
+RETENTION_DOC = "retention"
+RETENTION_BATCH = 500
+# Archives are written once and read rarely, so favour ratio over speed
+ZSTD_LEVEL = 10
+
+
+def archive_dir():
+    return Path(os.environ.get(ARCHIVE_ENV, DEFAULT_ARCHIVE_DIR))
+
+
+def _day(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _append(directory, day, lines):
+    """Append the lines to the day's file as one compressed frame, flushed to disk.
+
+    Concatenated zstd frames read as one stream, so later runs can add to
+    a day without rewriting it.
+    """
+    data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress("".join(lines).encode("utf-8"))
+    with open(directory / f"analytics-{day}.ndjson.zst", "ab") as archive:
+        archive.write(data)
+        archive.flush()
+        os.fsync(archive.fileno())
+
+
+def archive_sessions(retention_days=None, directory=None, batch_size=RETENTION_BATCH, now=None):
+    """Move sessions that logged in before the retention cutoff to the day archives.
+
+    The cutoff is rounded down to a whole UTC day, so a day's file is
+    complete once the job has passed it. Each batch is written and synced
+    to its files before it is deleted from the collection; a run stopped in
+    between leaves sessions in both places, which the next run archives
+    again and read_archive() reads once. Sessions without a login_time are
+    kept. Returns the number of sessions archived.
+    """
+    if retention_days is None:
+        retention_days = float(os.environ.get(RETENTION_ENV, DEFAULT_RETENTION_DAYS))
+    directory = Path(directory) if directory is not None else archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    batch_size = min(batch_size, storage.max_batch_writes)
+    cutoff = bucket_start((now if now is not None else time.time()) - retention_days * 86400, DAY)
+
+    archived = 0
+    while True:
+        rows = storage.find(SESSIONS, [("login_time", "<", cutoff)], order_by="login_time", limit=batch_size)
+        if not rows:
+            break
+        days = {}
+        for session_id, data in rows:
+            line = json.dumps({"id": session_id, "data": data}, default=str) + "\n"
+            days.setdefault(_day(data["login_time"]), []).append(line)
+        for day, lines in days.items():
+            _append(directory, day, lines)
+        storage.delete(SESSIONS, [session_id for session_id, _ in rows])
+        archived += len(rows)
+        log.info("📦 Archived %d sessions up to %s", archived, _day(rows[-1][1]["login_time"]))
+
+    # Dashboards drop sessions before this from their cached snapshots
+    storage.set(META, RETENTION_DOC, {"archived_before": cutoff, "archived_at": time.time()}, merge=True)
+    log.info("📦 Retention finished: %d sessions archived to %s", archived, directory)
+    return archived
+
+
+def archived_before():
+    """Login time before which sessions have been moved to the archive, or None"""
+    state = storage.get(META, RETENTION_DOC)
+    return state.get("archived_before") if state else None
+
+
+def _read_lines(path):
+    with open(path, "rb") as archive:
+        reader = zstandard.ZstdDecompressor().stream_reader(archive, read_across_frames=True)
+        yield from io.TextIOWrapper(reader, encoding="utf-8")
+
+
+def read_archive(start=None, end=None, directory=None):
+    """(session id, document) of the archived sessions that logged in within [start, end).
+
+    Reads only the day files overlapping the range, one day at a time;
+    works offline, without the storage backend.
+    """
+    directory = Path(directory) if directory is not None else archive_dir()
+    first = _day(start) if start is not None else None
+    last = _day(end) if end is not None else None
+    paths = {}
+    for path in directory.glob("analytics-*.ndjson.zst"):
+        day = path.name[len("analytics-"):].split(".", 1)[0]
+        if (first is None or day >= first) and (last is None or day <= last):
+            paths[day] = path
+
+    for day in sorted(paths):
+        # A session lives in one day, so repeats from an interrupted run are dropped per day
+        sessions = {}
+        for line in _read_lines(paths[day]):
+            record = json.loads(line)
+            sessions[record["id"]] = record["data"]
+        for session_id, data in sessions.items():
+            login_time = data.get("login_time", 0)
+            if (start is None or login_time >= start) and (end is None or login_time < end):
+                yield session_id, data
+
+
+def _summary(start, end, directory):
+    """Print dashboard-style totals of the archived sessions in [start, end)"""
+    from websiteanalytics.dashboard.sessions import SessionSnapshot
+
+    snapshot = SessionSnapshot("archive").merged(dict(read_archive(start, end, directory)))
+    columns = snapshot.columns()
+    totals = columns.totals(columns.time_mask())
+    average = totals["total_time_minutes"] / totals["sessions"] if totals["sessions"] else 0
+    print(f"{totals['sessions']} sessions, {len(totals['users'])} users, {average:.2f} min average")
+    for page, counters in sorted(totals["pages"].items(), key=lambda item: -item[1]["visits"]):
+        print(f"  {page:<20} {counters['visits']:>8} visits {counters['time_minutes']:>10.1f} min")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old sessions, or summarise the archive offline")
+    parser.add_argument("--dir", help=f"archive directory (default ${ARCHIVE_ENV} or {DEFAULT_ARCHIVE_DIR})")
+    commands = parser.add_subparsers(dest="command")
+    archive = commands.add_parser("archive", help="move sessions past the retention age to the archive")
+    archive.add_argument("--days", type=float, help=f"retention age (default ${RETENTION_ENV} or {DEFAULT_RETENTION_DAYS})")
+    summary = commands.add_parser("summary", help="totals of the archived sessions between two UTC dates")
+    summary.add_argument("start", help="first day, YYYY-MM-DD")
+    summary.add_argument("end", help="last day, YYYY-MM-DD, inclusive")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        start = datetime.strptime(args.start, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        end = datetime.strptime(args.end, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+        _summary(start.timestamp(), end.timestamp(), args.dir)
+    else:
+        count = archive_sessions(getattr(args, "days", None), args.dir)
+        print(f"Retention finished, {count} sessions archived")
+
+
+if __name__ == "__main__":
+    main()
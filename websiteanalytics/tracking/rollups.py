@@ -0,0 +1,167 @@
+from datetime import datetime, timezone
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.storage.backend import storage
+from websiteanalytics.tracking.events import (
+    SESSION_START,
+    PAGE_ENTER,
+    PAGE_EXIT,
+    SESSION_END,
+)
+from websiteanalytics.tracking.session_schema import read_session
+from websiteanalytics.tracking.writes import WriteOp, increment, writer_id
+
+log = get_logger(__name__)
+
+ROLLUPS = "analytics_rollups"
+HOUR = "hour"
+DAY = "day"
+
+_BUCKET_FORMATS = {HOUR: "%Y%m%d%H", DAY: "%Y%m%d"}
+
+
+def bucket_start(ts, granularity):
+    """Start of the UTC hour or day that `ts` falls in, as an epoch timestamp"""
+    moment = datetime.fromtimestamp(ts, tz=timezone.utc)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == DAY:
+        moment = moment.replace(hour=0)
+    return moment.timestamp()
+
+
+def rollup_id(ts, granularity):
+    moment = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return f"{granularity}_{moment.strftime(_BUCKET_FORMATS[granularity])}"
+
+
+def _event_delta(event):
+    """Rollup fields an event adds to, as nested maps of increments"""
+    event_type = event["type"]
+
+    if event_type == SESSION_START:
+        delta = {"sessions": increment()}
+        if event.get("is_anonymous"):
+            delta["anonymous_sessions"] = increment()
+        return delta
+    if event_type == PAGE_ENTER:
+        return {"pages": {event["page"]: {"visits": increment()}}}
+    if event_type == PAGE_EXIT:
+        minutes = event["time_spent_minutes"]
+        return {"pages": {event["page"]: {"time_minutes": increment(minutes)}}}
+    if event_type == SESSION_END:
+        minutes = event["total_session_time_minutes"]
+        return {"total_time_minutes": increment(minutes)}
+    return None
+
+
+def rollup_writes(events):
+    """Add each event to this writer's hourly and daily rollup documents.
+
+    Every writer increments documents of its own, so concurrent workers
+    never contend on one bucket document; readers sum them. Per-user
+    counts are kept out of them: the sketches' bounded TopUsers summary
+    holds the busiest users however many a bucket sees.
+    """
+    writer = writer_id()
+    ops = []
+    for event in events:
+        delta = _event_delta(event)
+        if delta is None:
+            continue
+        for granularity in (HOUR, DAY):
+            bucket = {"granularity": granularity, "bucket": bucket_start(event["ts"], granularity)}
+            bucket_id = rollup_id(event["ts"], granularity)
+            ops.append(WriteOp(ROLLUPS, f"{bucket_id}_{writer}", dict(delta, **bucket), True))
+    return ops
+
+
+def empty_totals():
+    return {
+        "sessions": 0,
+        "anonymous_sessions": 0,
+        "total_time_minutes": 0,
+        "pages": {},
+        "users": {},
+    }
+
+
+def merge_rollups(rows, totals=None):
+    """Sum rollup documents into one totals dict shaped like a single rollup"""
+    totals = totals if totals is not None else empty_totals()
+    for row in rows:
+        for field in ("sessions", "anonymous_sessions", "total_time_minutes"):
+            totals[field] += row.get(field, 0)
+        for group in ("pages", "users"):
+            for name, counters in row.get(group, {}).items():
+                merged = totals[group].setdefault(name, {})
+                for counter, value in counters.items():
+                    merged[counter] = merged.get(counter, 0) + value
+    return totals
+
+
+def load_rollups(granularity=DAY, start=None, end=None):
+    """Merged totals of the rollups whose bucket lies in [start, end)"""
+    filters = [("granularity", "==", granularity)]
+    if start is not None:
+        filters.append(("bucket", ">=", bucket_start(start, granularity)))
+    if end is not None:
+        filters.append(("bucket", "<", end))
+    return merge_rollups(data for _, data in storage.find(ROLLUPS, filters))
+
+
+def _session_events(session_id, data):
+    """Approximate tracking events for an existing session document"""
+    session = read_session(data)
+    user_email = session["user_email"]
+    login_time = session["login_time"]
+    events = [{
+        "type": SESSION_START, "session_id": session_id, "user_email": user_email,
+        "ts": login_time, "is_anonymous": session["anonymous"],
+    }]
+
+    for page_name, page in session["pages"].items():
+        for _ in range(int(page["visits"])):
+            events.append({
+                "type": PAGE_ENTER, "session_id": session_id, "user_email": user_email,
+                "ts": page["entry_time"] or login_time, "page": page_name,
+            })
+        if page["time_spent_minutes"]:
+            events.append({
+                "type": PAGE_EXIT, "session_id": session_id, "user_email": user_email,
+                "ts": page["exit_time"] or login_time, "page": page_name,
+                "time_spent_minutes": page["time_spent_minutes"],
+            })
+
+    if session["total_minutes"] is not None:
+        events.append({
+            "type": SESSION_END, "session_id": session_id, "user_email": user_email,
+            "ts": session["logout_time"] or login_time,
+            "total_session_time_minutes": session["total_minutes"],
+            "page_minutes": {
+                page_name: page["time_spent_minutes"]
+                for page_name, page in session["pages"].items() if page["time_spent_minutes"]
+            },
+        })
+    return events
+
+
+def backfill_rollups():
+    """Build rollups, unique-user and duration sketches for sessions recorded before they existed. Run it once."""
+    from websiteanalytics.tracking.sketches import sketch_writer
+    from websiteanalytics.tracking.writes import coalesce_ops, commit_ops
+
+    ops = []
+    events = []
+    sessions = 0
+    for session_id, data in storage.find("analytics"):
+        session_events = _session_events(session_id, data)
+        ops.extend(rollup_writes(session_events))
+        events.extend(session_events)
+        sessions += 1
+    ops = coalesce_ops(ops + sketch_writer.writes(events))
+    commit_ops(ops)
+    log.info("Backfilled %d rollup and sketch documents from %d sessions", len(ops), sessions)
+
+
+if __name__ == "__main__":
+    backfill_rollups()
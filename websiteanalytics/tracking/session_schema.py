@@ -0,0 +1,188 @@
+"""Layout of the `analytics` session documents.
+
+Version 1 documents hold their pages as literal dotted fields
+(`pages.home.visits`) next to long top-level names. Version 2 nests the
+pages in one map with compact field names:
+
+    {"schema": 2, "user_email": ..., "login_time": ..., "updated_at": ...,
+     "sample_hash": <0..1>, "anon": True, "out": <logout ts>, "total": <minutes>,
+     "pages": {"home": {"v": <visits>, "t": <minutes>, "en": <entry ts>, "ex": <exit ts>}}}
+
+`user_email`, `login_time`, `updated_at` and `sample_hash` keep their
+names because queries filter and sort on them. Sessions that were open when the writers
+switched to version 2 carry both layouts until they are migrated, so
+read_session() accepts either and combines them.
+"""
+
+import hashlib
+import time
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.storage.backend import storage
+from websiteanalytics.tracking.writes import WriteOp
+
+log = get_logger(__name__)
+
+SESSIONS = "analytics"
+META = "analytics_meta"
+SCHEMA_DOC = "session_schema"
+SCHEMA_VERSION = 2
+
+# Fields the dashboard reads from a version 2 document
+DASHBOARD_FIELDS = ("schema", "user_email", "login_time", "updated_at", "sample_hash", "total", "pages")
+
+# Version 1 top-level fields and their version 2 names; None drops the field
+_RENAMED = {
+    "is_anonymous": "anon",
+    "logout_time": "out",
+    "total_session_time_minutes": "total",
+    "total_session_time": "total",
+    "session_start": None,
+}
+# Version 2 page fields and the names read_session() returns them under
+_PAGE_FIELDS = {"v": "visits", "t": "time_spent_minutes", "en": "entry_time", "ex": "exit_time"}
+_SUMMED = ("visits", "time_spent_minutes")
+
+# Sessions written more recently than this are left for a later run, so the
+# migrator does not overwrite increments a tracking writer is folding in.
+MIGRATION_QUIET_SECONDS = 3600
+MIGRATION_BATCH = 500
+
+
+def sample_hash(session_id):
+    """Uniform value in [0, 1) fixed by the session id; `sample_hash < rate` samples sessions at `rate`"""
+    digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2**64
+
+
+def _v1_pages(data):
+    pages = {}
+    for key, value in data.items():
+        parts = key.split(".")
+        if len(parts) >= 3 and parts[0] == "pages":
+            pages.setdefault(parts[1], {})[parts[2]] = value
+    return pages
+
+
+def read_session(data):
+    """Layout-independent view of a session document.
+
+    Returns user_email, login_time, updated_at, anonymous, logout_time,
+    total_minutes (None while the session is open) and pages, a map of
+    page name to visits, time_spent_minutes, entry_time and exit_time.
+    """
+    pages = {}
+    for page_name, page in _v1_pages(data).items():
+        pages[page_name] = {
+            "visits": page.get("visits", 0),
+            "time_spent_minutes": page.get("time_spent_minutes", page.get("time_spent", 0)),
+            "entry_time": page.get("entry_time", 0),
+            "exit_time": page.get("exit_time", 0),
+        }
+    nested = data.get("pages")
+    for page_name, page in (nested.items() if isinstance(nested, dict) else ()):
+        if not isinstance(page, dict):
+            continue
+        merged = pages.setdefault(page_name, {"visits": 0, "time_spent_minutes": 0, "entry_time": 0, "exit_time": 0})
+        for short, name in _PAGE_FIELDS.items():
+            if short not in page:
+                continue
+            if name in _SUMMED:
+                merged[name] += page[short]
+            else:
+                merged[name] = max(merged[name], page[short])
+
+    total = data.get("total", data.get("total_session_time_minutes", data.get("total_session_time")))
+    return {
+        "user_email": data.get("user_email", "Unknown"),
+        "login_time": data.get("login_time", 0),
+        "updated_at": data.get("updated_at", 0),
+        "anonymous": bool(data.get("anon", data.get("is_anonymous", False))),
+        "logout_time": data.get("out", data.get("logout_time")),
+        "total_minutes": total,
+        "pages": pages,
+    }
+
+
+def is_current(data):
+    return data.get("schema") == SCHEMA_VERSION
+
+
+def upgrade_session(session_id, data):
+    """The version 2 document for a version 1 or mixed one"""
+    session = read_session(data)
+    document = {"schema": SCHEMA_VERSION, "sample_hash": sample_hash(session_id)}
+    for field, value in data.items():
+        # Unknown top-level fields are carried over unchanged
+        if field != "pages" and not field.startswith("pages.") and field not in _RENAMED:
+            document[field] = value
+    document.pop("anon", None)
+    if session["anonymous"]:
+        document["anon"] = True
+    if session["logout_time"] is not None:
+        document["out"] = session["logout_time"]
+    if session["total_minutes"] is not None:
+        document["total"] = session["total_minutes"]
+    document["pages"] = {
+        page_name: {short: page[name] for short, name in _PAGE_FIELDS.items() if page[name]}
+        for page_name, page in session["pages"].items()
+    }
+    return document
+
+
+def schema_migrated():
+    """Whether the migrator has found every session on version 2"""
+    state = storage.get(META, SCHEMA_DOC)
+    return bool(state) and state.get("version") == SCHEMA_VERSION
+
+
+def migrate_sessions(batch_size=MIGRATION_BATCH):
+    """Rewrite version 1 and mixed session documents as version 2, one batch per commit.
+
+    Stale documents are found with a read of only their `schema` and
+    `sample_hash` fields and re-read in full just before rewriting; version
+    2 documents missing their sample_hash only get it added. Every batch is committed on its
+    own and migrated documents are skipped, so an interrupted run is resumed
+    by running it again. Sessions updated in the last MIGRATION_QUIET_SECONDS
+    are left for a later run; once none are left behind the dashboard
+    switches to projected reads. Returns the number of documents rewritten.
+    """
+    batch_size = min(batch_size, storage.max_batch_writes)
+    cutoff = time.time() - MIGRATION_QUIET_SECONDS
+    stale = [
+        session_id
+        for session_id, data in storage.find(SESSIONS, fields=("schema", "sample_hash"))
+        if not is_current(data) or "sample_hash" not in data
+    ]
+    log.info("🔁 %d sessions to migrate to schema v%d", len(stale), SCHEMA_VERSION)
+
+    migrated = 0
+    deferred = 0
+    for start in range(0, len(stale), batch_size):
+        ops = []
+        for session_id in stale[start:start + batch_size]:
+            data = storage.get(SESSIONS, session_id)
+            if data is None or is_current(data) and "sample_hash" in data:
+                continue
+            if is_current(data):
+                ops.append(WriteOp(SESSIONS, session_id, {"sample_hash": sample_hash(session_id)}, True))
+                continue
+            if data.get("updated_at", 0) >= cutoff:
+                deferred += 1
+                continue
+            ops.append(WriteOp(SESSIONS, session_id, upgrade_session(session_id, data), False))
+        if ops:
+            storage.commit(ops)
+        migrated += len(ops)
+        log.info("🔁 Migrated %d of %d sessions", migrated, len(stale))
+
+    if deferred:
+        log.info("⏳ %d active sessions left for the next migration run", deferred)
+    else:
+        storage.set(META, SCHEMA_DOC, {"version": SCHEMA_VERSION, "migrated_at": time.time()})
+    return migrated
+
+
+if __name__ == "__main__":
+    count = migrate_sessions()
+    print(f"Schema migration finished, {count} sessions rewritten")
@@ -0,0 +1,386 @@
+import base64
+import bisect
+import hashlib
+import itertools
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.storage.backend import storage
+from websiteanalytics.tracking.events import PAGE_ENTER, SESSION_END, SESSION_START
+from websiteanalytics.tracking.rollups import DAY, HOUR, bucket_start, rollup_id
+from websiteanalytics.tracking.writes import WriteOp, writer_id
+
+log = get_logger(__name__)
+
+SKETCHES = "analytics_sketches"
+# 2**12 one-byte registers: about 1.6% standard error, 5.5 KB per sketch in base64
+PRECISION = 12
+# Buckets older than this are dropped from memory; a late event starts a new document
+RETAIN_SECONDS = 2 * 86400
+# t-digest size/accuracy trade-off: about this many centroids, tails within a fraction of a percent
+COMPRESSION = 100
+# Upper edges, in minutes, of the duration histogram's bins; the last bin is open
+DURATION_EDGES = (0.5, 1, 2, 5, 10, 20, 30, 60)
+QUANTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+# Numbers the sketch documents a process creates, so every writer's are distinct
+_document_numbers = itertools.count(1)
+# Users held by a top-users summary; the dashboard charts the first ten
+TOP_USERS = 100
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch with 2**precision one-byte registers"""
+
+    def __init__(self, precision=PRECISION, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, value):
+        hashed = _hash(value)
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        # Position of the first 1 bit in the remaining 64 - precision bits
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are empty
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def to_base64(self):
+        return base64.b64encode(self.registers.tobytes()).decode("ascii")
+
+    @classmethod
+    def from_base64(cls, text):
+        registers = np.frombuffer(base64.b64decode(text), dtype=np.uint8).copy()
+        return cls(int(registers.size).bit_length() - 1, registers)
+
+
+class TDigest:
+    """Mergeable quantile sketch: weighted centroids, small ones near the tails.
+
+    Points are buffered and folded into the centroids with the k1 scale
+    function, so a centroid near quantile q covers about sqrt(q(1 - q)) /
+    compression of the weight and the tails stay precise.
+    """
+
+    def __init__(self, compression=COMPRESSION, means=None, weights=None, minimum=math.inf, maximum=-math.inf):
+        self.compression = compression
+        self.means = means if means is not None else np.zeros(0)
+        self.weights = weights if weights is not None else np.zeros(0)
+        self.minimum = minimum
+        self.maximum = maximum
+        self._buffer = []
+
+    def add(self, value):
+        value = float(value)
+        self._buffer.append(value)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        if len(self._buffer) >= 10 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._compress(other.means, other.weights)
+        return self
+
+    def _scale(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self, means=(), weights=()):
+        if not self._buffer and not len(means):
+            return
+        all_means = np.concatenate([self.means, self._buffer, means])
+        all_weights = np.concatenate([self.weights, np.ones(len(self._buffer)), weights])
+        self._buffer = []
+        order = np.argsort(all_means, kind="stable")
+        all_means = all_means[order].tolist()
+        all_weights = all_weights[order].tolist()
+        total = sum(all_weights)
+
+        merged_means = []
+        merged_weights = []
+        mean, weight = all_means[0], all_weights[0]
+        before = 0.0
+        limit = self._scale(0.0) + 1
+        for point, point_weight in zip(all_means[1:], all_weights[1:]):
+            if self._scale((before + weight + point_weight) / total) <= limit:
+                weight += point_weight
+                mean += (point - mean) * point_weight / weight
+            else:
+                merged_means.append(mean)
+                merged_weights.append(weight)
+                before += weight
+                limit = self._scale(before / total) + 1
+                mean, weight = point, point_weight
+        merged_means.append(mean)
+        merged_weights.append(weight)
+        self.means = np.array(merged_means)
+        self.weights = np.array(merged_weights)
+
+    def count(self):
+        self._compress()
+        return float(self.weights.sum())
+
+    def _points(self):
+        """Cumulative weight at each centroid's center, with the extremes pinned to min and max"""
+        centers = np.cumsum(self.weights) - self.weights / 2
+        return (
+            np.concatenate([[0.0], centers, [self.weights.sum()]]),
+            np.concatenate([[self.minimum], self.means, [self.maximum]]),
+        )
+
+    def quantile(self, q):
+        if not self.count():
+            return 0.0
+        ranks, values = self._points()
+        return float(np.interp(q * ranks[-1], ranks, values))
+
+    def cdf(self, value):
+        """Estimated weight of the points at or below `value`"""
+        if not self.count():
+            return 0.0
+        ranks, values = self._points()
+        return float(np.interp(value, values, ranks))
+
+    def to_dict(self):
+        self._compress()
+        centroids = np.stack([self.means, self.weights]).astype(np.float64)
+        # An empty digest has no extremes; JSON has no infinity
+        empty = not len(self.weights)
+        return {
+            "c": base64.b64encode(centroids.tobytes()).decode("ascii"),
+            "min": None if empty else self.minimum,
+            "max": None if empty else self.maximum,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        centroids = np.frombuffer(base64.b64decode(data["c"]), dtype=np.float64).reshape(2, -1).copy()
+        minimum = math.inf if data["min"] is None else data["min"]
+        maximum = -math.inf if data["max"] is None else data["max"]
+        return cls(COMPRESSION, centroids[0], centroids[1], minimum, maximum)
+
+
+class TopUsers:
+    """Space-saving summary of the users with the most sessions.
+
+    Holds at most `capacity` users. A new user past that takes the place of
+    the one with the fewest sessions and inherits its count, so a held
+    count overestimates by at most the smallest count; users with more
+    sessions than that are always held.
+    """
+
+    def __init__(self, capacity=TOP_USERS, counts=None):
+        self.capacity = capacity
+        self.counts = counts if counts is not None else {}
+
+    def add(self, user, count=1):
+        if user not in self.counts and len(self.counts) >= self.capacity:
+            smallest = min(self.counts, key=self.counts.get)
+            count += self.counts.pop(smallest)
+        self.counts[user] = self.counts.get(user, 0) + count
+
+    def merge(self, other):
+        for user, count in other.counts.items():
+            self.counts[user] = self.counts.get(user, 0) + count
+        if len(self.counts) > self.capacity:
+            self.counts = dict(self.top(self.capacity))
+        return self
+
+    def top(self, count):
+        """(user, sessions) of the `count` users with the most sessions, most first"""
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:count]
+
+    def to_list(self):
+        # A list rather than a map: emails are not valid field names everywhere
+        return [[user, count] for user, count in self.counts.items()]
+
+    @classmethod
+    def from_list(cls, rows, capacity=TOP_USERS):
+        return cls(capacity, {user: count for user, count in rows})
+
+
+def duration_bin(minutes):
+    """Histogram bin of a duration; bins take their upper edge, like np.searchsorted(side="left")"""
+    return bisect.bisect_left(DURATION_EDGES, minutes)
+
+
+def duration_summary(digest, histogram=None):
+    """p50/p90/p99 and histogram bin counts (over DURATION_EDGES) of a duration digest.
+
+    Without exact `histogram` counts the bins are estimated from the digest.
+    """
+    summary = {name: round(digest.quantile(q), 2) for name, q in QUANTILES}
+    if histogram is None:
+        below = [digest.cdf(edge) for edge in DURATION_EDGES] + [digest.count()]
+        histogram = [int(round(high - low)) for low, high in zip([0.0] + below, below)]
+    summary["histogram"] = list(histogram)
+    return summary
+
+
+class SketchWriter:
+    """Keeps this process's sketches per time bucket and writes them out.
+
+    Each bucket gets a HyperLogLog of every user seen and one per page of
+    the users who entered it, a TopUsers summary of the users who started
+    the most sessions in it, and t-digests of the durations of the
+    sessions that ended in it and of each page's total time within them,
+    as carried by SESSION_END; session durations are also counted exactly
+    into the histogram bins. They are written whole to a document owned by
+    this writer alone, so no read-modify-write is needed; readers merge
+    the documents of every writer. A forked worker starts a new writer.
+
+    Nothing is read from storage here. A bucket dropped from memory and
+    touched again by a late event starts over in a new document, which
+    readers merge like any other writer's.
+    """
+
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Registered after writes.py's own fork hook, so a forked worker gets its new id
+        self.writer_id = writer_id()
+        # rollup id -> the sketches of that bucket and the document they are written to
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, ts, granularity):
+        key = rollup_id(ts, granularity)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = {
+                "doc_id": f"{key}_{self.writer_id}_{next(_document_numbers)}",
+                "granularity": granularity,
+                "bucket": bucket_start(ts, granularity),
+                "users": HyperLogLog(),
+                "top_users": TopUsers(),
+                "pages": {},
+                "durations": TDigest(),
+                "histogram": [0] * (len(DURATION_EDGES) + 1),
+                "page_durations": {},
+            }
+        return key, bucket
+
+    def writes(self, events):
+        """Add the events to their buckets' sketches and return writes of every touched bucket"""
+        touched = set()
+        with self._lock:
+            for event in events:
+                event_type = event["type"]
+                if event_type not in (SESSION_START, PAGE_ENTER, SESSION_END):
+                    continue
+                for granularity in (HOUR, DAY):
+                    key, bucket = self._bucket(event["ts"], granularity)
+                    if event_type in (SESSION_START, PAGE_ENTER):
+                        bucket["users"].add(event["user_email"])
+                    if event_type == SESSION_START:
+                        bucket["top_users"].add(event["user_email"])
+                    elif event_type == PAGE_ENTER:
+                        bucket["pages"].setdefault(event["page"], HyperLogLog()).add(event["user_email"])
+                    elif event_type == SESSION_END:
+                        minutes = event["total_session_time_minutes"]
+                        bucket["durations"].add(minutes)
+                        bucket["histogram"][duration_bin(minutes)] += 1
+                        for page, page_minutes in event.get("page_minutes", {}).items():
+                            if page_minutes > 0:
+                                bucket["page_durations"].setdefault(page, TDigest()).add(page_minutes)
+                    touched.add(key)
+
+            ops = [
+                WriteOp(SKETCHES, self._buckets[key]["doc_id"], self._document(self._buckets[key]), False)
+                for key in touched
+            ]
+
+            horizon = time.time() - RETAIN_SECONDS
+            for key in [key for key, bucket in self._buckets.items() if bucket["bucket"] < horizon]:
+                if key not in touched:
+                    del self._buckets[key]
+        return ops
+
+    def _document(self, bucket):
+        return {
+            "granularity": bucket["granularity"],
+            "bucket": bucket["bucket"],
+            "writer": self.writer_id,
+            "users": bucket["users"].to_base64(),
+            "top_users": bucket["top_users"].to_list(),
+            "pages": {page: sketch.to_base64() for page, sketch in bucket["pages"].items()},
+            "durations": bucket["durations"].to_dict(),
+            "histogram": bucket["histogram"],
+            "page_durations": {page: digest.to_dict() for page, digest in bucket["page_durations"].items()},
+        }
+
+
+sketch_writer = SketchWriter()
+
+
+def load_sketch_totals(granularity=DAY, start=None, end=None):
+    """Merged sketches of the buckets within [start, end).
+
+    Returns the distinct users overall ("users") and per page ("pages"),
+    the users who started the most sessions ({email: {"sessions": n}},
+    "top_users"), and duration_summary() of the session durations ("durations") and of
+    each page's time within a session ("page_durations"). Memory stays one sketch per
+    page however many buckets and writers are merged.
+    """
+    filters = [("granularity", "==", granularity)]
+    if start is not None:
+        filters.append(("bucket", ">=", bucket_start(start, granularity)))
+    if end is not None:
+        filters.append(("bucket", "<", end))
+
+    users = HyperLogLog()
+    top_users = TopUsers()
+    pages = {}
+    durations = TDigest()
+    histogram = [0] * (len(DURATION_EDGES) + 1)
+    page_durations = {}
+    for _, data in storage.find(SKETCHES, filters):
+        users.merge(HyperLogLog.from_base64(data["users"]))
+        top_users.merge(TopUsers.from_list(data.get("top_users", [])))
+        for page, text in data.get("pages", {}).items():
+            sketch = HyperLogLog.from_base64(text)
+            if page in pages:
+                pages[page].merge(sketch)
+            else:
+                pages[page] = sketch
+        if "durations" in data:
+            digest = TDigest.from_dict(data["durations"])
+            durations.merge(digest)
+            counts = data.get("histogram") or duration_summary(digest)["histogram"]
+            histogram = [total + count for total, count in zip(histogram, counts)]
+        for page, digest in data.get("page_durations", {}).items():
+            page_durations.setdefault(page, TDigest()).merge(TDigest.from_dict(digest))
+    return {
+        "users": users.count(),
+        "pages": {page: sketch.count() for page, sketch in pages.items()},
+        "top_users": {user: {"sessions": count} for user, count in top_users.top(TOP_USERS)},
+        "durations": duration_summary(durations, histogram),
+        "page_durations": {page: duration_summary(digest) for page, digest in page_durations.items()},
+    }
@@ -0,0 +1,85 @@
+import os
+import time
+import uuid
+
+from websiteanalytics.logs import get_logger
+from websiteanalytics.storage.backend import storage
+from websiteanalytics.storage.base import Increment, WriteOp
+
+log = get_logger(__name__)
+
+
+def _new_writer_id():
+    return f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+_writer_id = _new_writer_id()
+
+
+def writer_id():
+    """Id of this process, for documents that only it writes; a forked worker gets its own"""
+    return _writer_id
+
+
+def _reset_writer_id():
+    global _writer_id
+    _writer_id = _new_writer_id()
+
+
+os.register_at_fork(after_in_child=_reset_writer_id)
+
+
+def increment(amount=1):
+    """Atomic increment, usable as a value in a merged WriteOp"""
+    return Increment(amount)
+
+
+def is_increment(value):
+    return isinstance(value, Increment)
+
+
+def _merge_value(old, new):
+    # Two increments of the same field collapse into one increment of the sum
+    if is_increment(old) and is_increment(new):
+        return increment(old.value + new.value)
+    # Nested maps are merged field by field, as set(merge=True) does
+    if isinstance(old, dict) and isinstance(new, dict):
+        merged = dict(old)
+        for field, value in new.items():
+            merged[field] = _merge_value(merged.get(field), value)
+        return merged
+    return new
+
+
+def coalesce_ops(ops):
+    """Fold writes that target the same document into one write, keeping order"""
+    merged = {}
+    for op in ops:
+        key = (op.collection, op.doc_id)
+        previous = merged.get(key)
+        if previous is None or not op.merge:
+            merged[key] = WriteOp(op.collection, op.doc_id, dict(op.data), op.merge)
+        else:
+            for field, value in op.data.items():
+                previous.data[field] = _merge_value(previous.data.get(field), value)
+    return list(merged.values())
+
+
+def commit_ops(ops, max_retries=3, prepare=None):
+    """Commit writes in batches the storage backend accepts, retrying failed batches.
+
+    `prepare`, if given, maps each batch to the ops to commit right before
+    every attempt, e.g. to stamp them with the commit time.
+    """
+    for start in range(0, len(ops), storage.max_batch_writes):
+        chunk = ops[start:start + storage.max_batch_writes]
+        for attempt in range(1, max_retries + 1):
+            try:
+                storage.commit(prepare(chunk) if prepare is not None else chunk)
+                break
+            except Exception as e:
+                log.warning("Error flushing %d analytics writes (attempt %d): %s", len(chunk), attempt, e)
+                if attempt == max_retries:
+                    log.error("Dropping %d analytics writes", len(chunk))
+                else:
+                    time.sleep(0.5 * attempt)
@@ -1,3 +1,5 @@
+import asyncio
+
 import reflex as rx
 from websiteanalytics.pages.home import home
 from websiteanalytics.pages.shop import shop
@@ -7,6 +9,8 @@ from websiteanalytics.components.navbar import navbar
 from websiteanalytics.pages.about import about
 from websiteanalytics.pages.contact import contact
 from websiteanalytics.pages.analyticalpage import analyticalpage
+from websiteanalytics.metrics import MetricsMiddleware, metrics_api
+from websiteanalytics.storage.backend import storage
 
 def index():
     return rx.vstack(
@@ -22,8 +26,19 @@ app = rx.App(
     style={
         "backgroundColor": "white",   # global background
         "color": "black",             # default text color
-    }
+    },
+    # Serves /metrics in Prometheus format next to the Reflex backend
+    api_transformer=metrics_api,
 )
+app.add_middleware(MetricsMiddleware())
+
+
+async def warm_up_storage():
+    """Connect each worker to the datastore when it starts, not on its first request"""
+    await asyncio.to_thread(storage.warm_up)
+
+
+app.register_lifespan_task(warm_up_storage)
 
 app.add_page(index, route="/")
 app.add_page(home, route="/home")